@@ -0,0 +1,76 @@
+# answer_cache.py
+# In-memory semantic cache for chatbot answers.
+#
+# Answers are grouped under a key made of the sorted top countries and the version of
+# each of their reports. Within a key, a new question is matched against earlier ones
+# by cosine similarity of their embeddings; a close enough match returns the stored
+# answer without calling Gemini.
+
+import time
+import threading
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold=0.95, ttl_seconds=3600, max_entries_per_key=200):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_key = max_entries_per_key
+        self._entries = {}   # key -> list of (unit embedding, answer, stored_at)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(report_versions):
+        """
+        Builds the cache key from {country_code: report_version}.
+        Any regenerated report changes its version, so old answers stop matching.
+        """
+        return tuple(sorted(report_versions.items()))
+
+    @staticmethod
+    def _unit(embedding):
+        import numpy as np  # Deferred so importing the chatbot stays cheap
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, key, embedding):
+        """Returns the cached answer for the most similar question above the threshold, or None."""
+        import numpy as np
+        query = self._unit(embedding)
+        now = time.time()
+        with self._lock:
+            self._drop_stale_versions(key)
+            entries = [e for e in self._entries.get(key, []) if now - e[2] <= self.ttl_seconds]
+            if not entries:
+                self._entries.pop(key, None)
+                return None
+            self._entries[key] = entries
+            scores = np.stack([e[0] for e in entries]) @ query
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            return entries[best][1]
+        return None
+
+    def store(self, key, embedding, answer):
+        with self._lock:
+            self._drop_stale_versions(key)
+            entries = self._entries.setdefault(key, [])
+            entries.append((self._unit(embedding), answer, time.time()))
+            if len(entries) > self.max_entries_per_key:
+                del entries[:len(entries) - self.max_entries_per_key]
+
+    def invalidate(self, country_codes=None):
+        """Drops every entry touching any of the given countries (or everything when None)."""
+        with self._lock:
+            if country_codes is None:
+                self._entries.clear()
+                return
+            codes = set(country_codes)
+            for key in [k for k in self._entries if codes & {code for code, _ in k}]:
+                del self._entries[key]
+
+    # Entries for the same country set under an older report version can never match again
+    def _drop_stale_versions(self, key):
+        countries = [code for code, _ in key]
+        for other in [k for k in self._entries if k != key and [code for code, _ in k] == countries]:
+            del self._entries[other]
@@ -1,19 +1,19 @@
 import os
-import hashlib
-from flask import Flask, request, jsonify, send_from_directory, abort, send_file
+import json
+from flask import Flask, Response, request, jsonify, send_from_directory, abort, send_file, stream_with_context
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from io import BytesIO
 
 # Local module imports for various pipeline steps
 from fallback_sector_detection import detect_sectors
-from pdf_reader import detect_sectors_from_pdf
-from get_final_shortlist import get_shortlist
-from generate_country_reports import generate_final_reports
-from chatbot import generate_answer
-from plot_graphs import generate_country_graphs
+from pdf_reader import UnreadablePDFError, detect_sectors_from_pdf_bytes
+from chatbot import generate_answer, stream_answer, clear_chat_sessions, BUDGET_REPLY
+from services import get_collection, pool_metrics
+from pipeline import (MAX_UPLOAD_BYTES, SHORTLIST_SESSIONS, SHORTLIST_TOP_N, allowed_file, generate_session_id,
+                      parse_flag, render_metrics, rerank_country_pipeline, run_country_pipeline, session_id_from,
+                      shortlist_sensitivity)
+from usage import request_ledger, session_usage, TokenBudgetExceeded, CHAT_TOKEN_BUDGET
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,33 +22,29 @@ load_dotenv()
 app = Flask(__name__, static_folder="../frontend", static_url_path="")
 CORS(app, resources={r"/*": {"origins": ["*"]}})  # Allow all origins (update in production)
 
-# Set up MongoDB client and collection references
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client[os.getenv("DB_NAME")]
-report_col = db["country_reports"]
-graph_col = db["country_graphs"]
-
-# Set up upload folder
-UPLOAD_FOLDER = "./Uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-# Allowed file types for upload
-ALLOWED_EXTENSIONS = {"pdf"}
-
-# Check if uploaded file is a PDF
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-# Generate session ID using hash of input text
-def generate_session_id(text):
-    return hashlib.sha256(text.encode()).hexdigest()[:12]
+# Uploads are processed in memory; cap their size so a single request stays bounded
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 
 # Serve frontend landing page
 @app.route("/")
 def index():
     return send_from_directory(app.static_folder, "index.html")
 
+# Lightweight liveness check — touches no database or model
+@app.route("/health")
+def health():
+    return jsonify({"status": "ok"})
+
+# Connection-pool metrics for the shared MongoDB client
+@app.route("/pool_stats")
+def pool_stats():
+    return jsonify(pool_metrics())
+
+# Prometheus scrape endpoint
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 # Handle PDF uploads and extract sectors
 @app.route("/upload_pdf", methods=["POST"])
 def upload_pdf():
@@ -56,14 +52,14 @@ def upload_pdf():
     if file is None or not allowed_file(file.filename):
         abort(400, "Invalid or missing PDF file")
 
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
+    # Read the upload straight from the request stream — no temp file, no filename collisions
+    with request_ledger("upload_pdf") as ledger:
+        try:
+            sectors, extracted_text = detect_sectors_from_pdf_bytes(file.read())
+        except UnreadablePDFError as e:
+            abort(400, f"Could not read PDF: {e}")
+        session_id = ledger.session_id = generate_session_id()
 
-    sectors, extracted_text = detect_sectors_from_pdf(filepath)
-    os.remove(filepath)  # Remove file after processing
-
-    session_id = generate_session_id(extracted_text)
     return jsonify({"text": extracted_text, "sectors": sectors, "session_id": session_id})
 
 # Handle text input submission
@@ -73,8 +69,10 @@ def submit_text():
     if not idea:
         abort(400, "Business idea text is required")
 
-    sectors = detect_sectors(idea)
-    session_id = generate_session_id(idea)
+    # Keeps the ID /upload_pdf issued for this idea, if any
+    session_id = session_id_from(request.form.get("session_id")) or generate_session_id()
+    with request_ledger("submit_text", session_id=session_id):
+        sectors = detect_sectors(idea)
     return jsonify({"text": idea, "sectors": sectors, "session_id": session_id})
 
 # Run the full country analysis pipeline
@@ -86,30 +84,62 @@ def run_pipeline():
         print("Missing idea input")
         abort(400, "Business idea is required")
 
-    session_id = generate_session_id(idea)
-    final_top = get_shortlist(idea, top_n=5)
-    final_codes = [c["country_code"] for c in final_top]
-
-    generate_final_reports(idea, final_top)
-
-    # Generate and store graphs for shortlisted countries
-    graph_col = db["country_graphs"]
-    profiles_col = db["country_profiles"]
-    for code in final_codes:
-        generate_country_graphs(code, profiles_col, graph_col)
-
-    return jsonify({"top_countries": final_codes})
+    session_id = session_id_from(request.form.get("session_id")) or generate_session_id()
+    final_codes, usage = run_country_pipeline(idea, session_id)
+    return jsonify({"top_countries": final_codes, "usage": usage, "session_id": session_id})
+
+# Re-rank an existing session's shortlist with custom weights and/or sectors
+# JSON body: {"session_id": ..., "weights": {"fdi": 0.05, ...}, "sectors": [...], "top_n": 5}
+@app.route("/rerank", methods=["POST"])
+def rerank():
+    payload = request.get_json(silent=True) or {}
+    session_id = payload.get("session_id")
+    if not session_id:
+        abort(400, "session_id is required")
+
+    try:
+        result = rerank_country_pipeline(
+            session_id, payload.get("weights"), payload.get("sectors"),
+            int(payload.get("top_n", SHORTLIST_TOP_N))
+        )
+    except LookupError as e:
+        abort(404, str(e))
+    except (TypeError, ValueError) as e:
+        abort(400, str(e))
+    return jsonify(result)
+
+# Rank stability of a session's shortlist under perturbed weights and imputed missing data
+# JSON body: {"session_id": ..., "weights": {...}, "sectors": [...], "top_n": 5, "samples": 2000, "impute": true}
+@app.route("/sensitivity", methods=["POST"])
+def sensitivity():
+    payload = request.get_json(silent=True) or {}
+    session_id = payload.get("session_id")
+    if not session_id:
+        abort(400, "session_id is required")
+
+    try:
+        samples = payload.get("samples")
+        result = shortlist_sensitivity(
+            session_id, payload.get("weights"), payload.get("sectors"),
+            int(payload.get("top_n", SHORTLIST_TOP_N)), int(samples) if samples is not None else None,
+            parse_flag(payload.get("impute"), "impute")
+        )
+    except LookupError as e:
+        abort(404, str(e))
+    except (TypeError, ValueError) as e:
+        abort(400, str(e))
+    return jsonify(result)
 
 # Fetch all stored country reports
 @app.route("/get_reports", methods=["GET"])
 def get_reports():
-    reports = list(report_col.find({}, {"_id": 0}))
+    reports = list(get_collection("country_reports").find({}, {"_id": 0}))
     return jsonify(reports)
 
 # Fetch a specific country graph based on country code and category
 @app.route("/get_graph/<country_code>/<category>")
 def get_graph(country_code, category):
-    graph = db["country_graphs"].find_one({"country_code": country_code, "category": category})
+    graph = get_collection("country_graphs").find_one({"country_code": country_code, "category": category})
     if not graph:
         abort(404, "Graph not found")
     return send_file(BytesIO(graph["image"]), mimetype="image/png")
@@ -119,6 +149,7 @@ def get_graph(country_code, category):
 def chat_with_bot():
     question = request.form.get("question")
     top_countries = request.form.getlist("top_countries")
+    session_id = session_id_from(request.form.get("session_id"))
 
     print("Chatbot received question:", question)
     print("Top countries list:", top_countries)
@@ -126,13 +157,52 @@ def chat_with_bot():
     if not question:
         abort(400, "Question required")
 
-    response = generate_answer(question, top_countries)
+    with request_ledger("chat", session_id=session_id, budget_tokens=CHAT_TOKEN_BUDGET, per_session=True):
+        try:
+            response = generate_answer(question, top_countries, session_id=session_id)
+        except TokenBudgetExceeded as e:
+            print(f"Chat refused: {e}")
+            return jsonify({"response": BUDGET_REPLY}), 429
     return jsonify({"response": response})
 
-# Reset the session (clears country reports)
+# Stream chatbot answers as Server-Sent Events (one "token" event per Gemini chunk)
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    question = request.form.get("question")
+    top_countries = request.form.getlist("top_countries")
+    session_id = session_id_from(request.form.get("session_id"))
+
+    print("Chatbot (stream) received question:", question)
+
+    if not question:
+        abort(400, "Question required")
+
+    def events():
+        # The ledger lives inside the generator so it covers the whole streamed response
+        with request_ledger("chat", session_id=session_id, budget_tokens=CHAT_TOKEN_BUDGET, per_session=True):
+            for event in stream_answer(question, top_countries, session_id=session_id):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Accumulated LLM token usage for one session (all pipeline, chat and upload requests)
+@app.route("/usage/<session_id>")
+def get_usage(session_id):
+    usage = session_usage(session_id)
+    if not usage:
+        abort(404, "No usage recorded for this session")
+    return jsonify(usage)
+
+# Reset the session (clears country reports and the shortlists /rerank works from)
 @app.route("/reset", methods=["POST"])
 def reset_session():
-    deleted = report_col.delete_many({})
+    deleted = get_collection("country_reports").delete_many({})
+    get_collection(SHORTLIST_SESSIONS).delete_many({})
+    clear_chat_sessions()
     return jsonify({"status": "reset", "deleted_count": deleted.deleted_count})
 
 # Serve static files from the frontend
@@ -0,0 +1,275 @@
+# asgi_app.py
+# ASGI serving mode: the same routes as app.py, with async handlers.
+#
+# Run with:  uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+#
+# Chat routes use Gemini's async API, so one worker can keep hundreds of chats in flight.
+# MongoDB goes through the one shared pymongo pool (see services.py) on worker threads, so
+# /pool_stats covers every connection. The country pipeline (shortlist, reports, graphs) is
+# still synchronous code; it runs on worker threads, capped by PIPELINE_CONCURRENCY, while
+# the event loop keeps serving other requests. Shared helpers come from pipeline.py, so
+# the Flask app is never built here.
+
+import os
+import json
+import asyncio
+from typing import List
+from contextlib import asynccontextmanager
+from fastapi import Body, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+
+from fallback_sector_detection import detect_sectors
+from pdf_reader import UnreadablePDFError, detect_sectors_from_pdf_bytes
+from chatbot import generate_answer_async, stream_answer_async, clear_chat_sessions, BUDGET_REPLY
+from services import get_collection, pool_metrics
+from pipeline import (MAX_UPLOAD_BYTES, SHORTLIST_SESSIONS, SHORTLIST_TOP_N, allowed_file, generate_session_id,
+                      parse_flag, render_metrics, rerank_country_pipeline, run_country_pipeline, session_id_from,
+                      shortlist_sensitivity)
+from usage import request_ledger, session_tokens, session_usage, TokenBudgetExceeded, CHAT_TOKEN_BUDGET
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend")
+
+# Pipelines are long and thread-bound; cap how many run at once per worker
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", 8))
+_pipeline_slots = None
+
+def _pipeline_semaphore():
+    global _pipeline_slots
+    if _pipeline_slots is None:
+        _pipeline_slots = asyncio.Semaphore(PIPELINE_CONCURRENCY)
+    return _pipeline_slots
+
+# Same ledger as app.py, but the Mongo reads and writes around it run off the event loop
+@asynccontextmanager
+async def usage_ledger(kind, session_id=None, budget_tokens=0, per_session=False):
+    prior = 0
+    if per_session and budget_tokens and session_id:
+        prior = await run_in_threadpool(session_tokens, session_id, kind)
+    with request_ledger(kind, session_id=session_id, budget_tokens=budget_tokens,
+                        persist=False, prior_tokens=prior) as ledger:
+        try:
+            yield ledger
+        finally:
+            await run_in_threadpool(ledger.persist)
+
+# Flask's MAX_CONTENT_LENGTH for ASGI: a body over the limit is refused from its declared
+# length, or once the bytes received pass it, before the form parser buffers it all
+class BodySizeLimit:
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_bytes:
+            return await PlainTextResponse("Request body too large", status_code=413)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(413, "Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app = FastAPI(title="GlobalLaunch AI")
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(BodySizeLimit, max_bytes=MAX_UPLOAD_BYTES)
+
+
+@app.get("/")
+async def index():
+    return FileResponse(os.path.join(FRONTEND_DIR, "index.html"))
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/pool_stats")
+async def pool_stats():
+    return pool_metrics()
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/upload_pdf")
+async def upload_pdf(file: UploadFile = File(None)):
+    if file is None or not allowed_file(file.filename or ""):
+        raise HTTPException(400, "Invalid or missing PDF file")
+
+    # BodySizeLimit has already refused anything over MAX_UPLOAD_BYTES
+    data = await file.read()
+    async with usage_ledger("upload_pdf") as ledger:
+        try:
+            sectors, extracted_text = await run_in_threadpool(detect_sectors_from_pdf_bytes, data)
+        except UnreadablePDFError as e:
+            raise HTTPException(400, f"Could not read PDF: {e}")
+        session_id = ledger.session_id = generate_session_id()
+
+    return {"text": extracted_text, "sectors": sectors, "session_id": session_id}
+
+
+@app.post("/submit_text")
+async def submit_text(text: str = Form(""), session_id: str = Form(None)):
+    idea = text.strip()
+    if not idea:
+        raise HTTPException(400, "Business idea text is required")
+
+    session_id = session_id_from(session_id) or generate_session_id()
+    async with usage_ledger("submit_text", session_id=session_id):
+        sectors = await run_in_threadpool(detect_sectors, idea)
+    return {"text": idea, "sectors": sectors, "session_id": session_id}
+
+
+@app.post("/run_pipeline")
+async def run_pipeline(idea: str = Form(""), session_id: str = Form(None)):
+    idea = idea.strip()
+    print("/run_pipeline received idea:", idea)
+    if not idea:
+        raise HTTPException(400, "Business idea is required")
+
+    session_id = session_id_from(session_id) or generate_session_id()
+    async with _pipeline_semaphore():
+        final_codes, usage = await run_in_threadpool(run_country_pipeline, idea, session_id)
+    return {"top_countries": final_codes, "usage": usage, "session_id": session_id}
+
+
+@app.post("/rerank")
+async def rerank(payload: dict = Body(...)):
+    session_id = payload.get("session_id")
+    if not session_id:
+        raise HTTPException(400, "session_id is required")
+
+    # Usually milliseconds, but new entrants get reports, so it shares the pipeline slots
+    async with _pipeline_semaphore():
+        try:
+            return await run_in_threadpool(
+                rerank_country_pipeline, session_id, payload.get("weights"), payload.get("sectors"),
+                int(payload.get("top_n", SHORTLIST_TOP_N))
+            )
+        except LookupError as e:
+            raise HTTPException(404, str(e))
+        except (TypeError, ValueError) as e:
+            raise HTTPException(400, str(e))
+
+
+@app.post("/sensitivity")
+async def sensitivity(payload: dict = Body(...)):
+    session_id = payload.get("session_id")
+    if not session_id:
+        raise HTTPException(400, "session_id is required")
+
+    # CPU-bound for up to a second, so it waits for a pipeline slot rather than piling up threads
+    samples = payload.get("samples")
+    async with _pipeline_semaphore():
+        try:
+            return await run_in_threadpool(
+                shortlist_sensitivity, session_id, payload.get("weights"), payload.get("sectors"),
+                int(payload.get("top_n", SHORTLIST_TOP_N)), int(samples) if samples is not None else None,
+                parse_flag(payload.get("impute"), "impute")
+            )
+        except LookupError as e:
+            raise HTTPException(404, str(e))
+        except (TypeError, ValueError) as e:
+            raise HTTPException(400, str(e))
+
+
+@app.get("/get_reports")
+async def get_reports():
+    return await run_in_threadpool(lambda: list(get_collection("country_reports").find({}, {"_id": 0})))
+
+
+@app.get("/get_graph/{country_code}/{category}")
+async def get_graph(country_code: str, category: str):
+    graph = await run_in_threadpool(
+        get_collection("country_graphs").find_one, {"country_code": country_code, "category": category}
+    )
+    if not graph:
+        raise HTTPException(404, "Graph not found")
+    return Response(content=bytes(graph["image"]), media_type="image/png")
+
+
+@app.post("/chat")
+async def chat_with_bot(
+    question: str = Form(""),
+    top_countries: List[str] = Form([]),
+    session_id: str = Form(None)
+):
+    print("Chatbot received question:", question)
+    if not question:
+        raise HTTPException(400, "Question required")
+    session_id = session_id_from(session_id)
+
+    async with usage_ledger("chat", session_id=session_id, budget_tokens=CHAT_TOKEN_BUDGET, per_session=True):
+        try:
+            response = await generate_answer_async(question, top_countries, session_id=session_id)
+        except TokenBudgetExceeded as e:
+            print(f"Chat refused: {e}")
+            return JSONResponse({"response": BUDGET_REPLY}, status_code=429)
+    return {"response": response}
+
+
+@app.post("/chat/stream")
+async def chat_stream(
+    question: str = Form(""),
+    top_countries: List[str] = Form([]),
+    session_id: str = Form(None)
+):
+    if not question:
+        raise HTTPException(400, "Question required")
+    session_id = session_id_from(session_id)
+
+    async def events():
+        async with usage_ledger("chat", session_id=session_id, budget_tokens=CHAT_TOKEN_BUDGET, per_session=True):
+            async for event in stream_answer_async(question, top_countries, session_id=session_id):
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/usage/{session_id}")
+async def get_usage(session_id: str):
+    usage = await run_in_threadpool(session_usage, session_id)
+    if not usage:
+        raise HTTPException(404, "No usage recorded for this session")
+    return usage
+
+
+@app.post("/reset")
+async def reset_session():
+    deleted = await run_in_threadpool(get_collection("country_reports").delete_many, {})
+    await run_in_threadpool(get_collection(SHORTLIST_SESSIONS).delete_many, {})
+    clear_chat_sessions()
+    return {"status": "reset", "deleted_count": deleted.deleted_count}
+
+
+@app.get("/static/{path:path}")
+async def serve_static(path: str):
+    full_path = os.path.normpath(os.path.join(FRONTEND_DIR, path))
+    if not full_path.startswith(os.path.normpath(FRONTEND_DIR)) or not os.path.isfile(full_path):
+        raise HTTPException(404, "Not found")
+    return FileResponse(full_path)
+
+
+# Everything else (script.js, styles.css, report.html, ...) is served from the frontend folder,
+# matching Flask's static_url_path=""
+app.mount("/", StaticFiles(directory=FRONTEND_DIR), name="frontend")
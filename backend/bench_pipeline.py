@@ -0,0 +1,341 @@
+# bench_pipeline.py
+# Offline benchmark for the pipeline stages, run entirely on the fakes in fakes.py
+# (no Gemini, Vertex AI or Atlas needed).
+#
+#   python bench_pipeline.py                                  # all cases, print the table
+#   python bench_pipeline.py --save-baseline bench_baseline.json
+#   python bench_pipeline.py --baseline bench_baseline.json   # exit 1 on regression
+#
+# Fake latencies are fixed (plus seeded jitter), so run-to-run differences come from the
+# code under test. Besides latency, every case reports LLM calls, tokens and Mongo round
+# trips per operation; those are exact, and any increase counts as a regression.
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import fakes
+
+IDEAS = [
+    "Mobile fintech app offering micro-loans to small merchants using AI-ML credit scoring",
+    "SaaS platform for logistics companies to optimise last-mile delivery routes",
+    "Healthtech telemedicine service connecting rural patients with specialists",
+    "Edtech marketplace for vocational courses with AI tutors",
+    "Cleantech startup selling solar-powered cold storage to agritech cooperatives",
+]
+
+QUESTIONS = [
+    "What are the licensing requirements for launching here?",
+    "Which of these countries has the best digital infrastructure?",
+    "How risky is the regulatory environment?",
+    "Where is inflation lowest and why does it matter for pricing?",
+    "What go-to-market approach would you recommend first?",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+# === Cases ===
+# Each case returns (setup, run): setup(i) prepares iteration i untimed, run(i) is timed.
+
+def case_shortlist(env):
+    from get_final_shortlist import get_shortlist
+    from static_scores import build_static_scores
+    # Static components are materialized ahead of time in production too
+    build_static_scores(env.db["country_profiles"], env.db["country_static_scores"])
+    return None, lambda i: get_shortlist(IDEAS[i % len(IDEAS)], top_n=5)
+
+
+def case_reports(env):
+    from get_final_shortlist import get_shortlist
+    from generate_country_reports import generate_final_reports
+    shortlist = get_shortlist(IDEAS[0], top_n=5)
+    reports_col = env.db["country_reports"]
+    return (
+        lambda i: reports_col.delete_many({}),
+        lambda i: generate_final_reports(IDEAS[0], shortlist)
+    )
+
+
+def case_graphs(env):
+    from plot_graphs import generate_country_graphs
+    codes = env.country_codes[:5]
+    profiles_col, graphs_col = env.db["country_profiles"], env.db["country_graphs"]
+
+    def run(i):
+        for code in codes:
+            generate_country_graphs(code, profiles_col, graphs_col)
+    return lambda i: graphs_col.delete_many({}), run
+
+
+def case_chat(env):
+    from get_final_shortlist import get_shortlist
+    from generate_country_reports import generate_final_reports
+    from chatbot import generate_answer, clear_chat_sessions
+    shortlist = get_shortlist(IDEAS[0], top_n=5)
+    generate_final_reports(IDEAS[0], shortlist)
+    codes = [c["country_code"] for c in shortlist]
+    # Cold answer cache each time; sessions are spread so history grows like real chats
+    return (
+        lambda i: clear_chat_sessions() if i % len(QUESTIONS) == 0 else None,
+        lambda i: generate_answer(QUESTIONS[i % len(QUESTIONS)] + f" ({i})", codes, session_id=f"bench-{i // len(QUESTIONS)}")
+    )
+
+
+def case_semantics_etl(env):
+    # One country × sector through the offline ETL: packed prompts → merge → upsert → embed
+    from services import get_embedding_model
+    from packing import flatten_chunks
+    from generate_semantics_from_chunks import generate_semantic_profile
+    profiles_col, semantics_col = env.db["country_profiles"], env.db["country_semantics"]
+    path = os.environ["SEMANTIC_EMBEDDING"]
+
+    def run(i):
+        code = env.country_codes[i % len(env.country_codes)]
+        sector = fakes.SECTORS[i % len(fakes.SECTORS)]
+        fields = flatten_chunks(profiles_col.find({"country_code": code}))
+        semantic = generate_semantic_profile(code, sector, fields)
+        semantics_col.update_one(
+            {"country_code": code, "sector": sector},
+            {"$set": {"summary": semantic["summary"], "key_indicators": semantic["key_indicators"]}},
+            upsert=True
+        )
+        embedding = get_embedding_model().get_embeddings([semantic["summary"]])[0].values
+        semantics_col.update_one({"country_code": code, "sector": sector}, {"$set": {path: embedding}})
+    return None, run
+
+
+def case_semantics_runner(env):
+    # Every sector of 3 countries through the worker-pool runner (forced, so nothing is skipped).
+    # The profile JSON files go to a temporary directory, not the real data/ output.
+    from packing import flatten_chunks
+    from generate_semantics_from_chunks import run_profiles
+    profiles_col, semantics_col = env.db["country_profiles"], env.db["country_semantics"]
+
+    def run(i):
+        codes = [env.country_codes[(3 * i + k) % len(env.country_codes)] for k in range(3)]
+        with tempfile.TemporaryDirectory() as output_dir:
+            run_profiles(codes, lambda code: flatten_chunks(profiles_col.find({"country_code": code})),
+                         semantics_col, force=True, output_dir=output_dir)
+    return None, run
+
+
+def case_embed_backfill(env):
+    # Re-embeds the summaries of 5 countries: cursor → stale check → batched get_embeddings → bulk_write
+    from ratelimit import RateLimiter
+    from services import DEFAULT_EMBEDDING_MODEL
+    from embed_sector_profiles import adopt_existing, meta_field, run_backfill
+    semantics_col, checkpoints = env.db["country_semantics"], env.db["job_checkpoints"]
+    path = os.environ["SEMANTIC_EMBEDDING"]
+    codes = env.country_codes[:5]
+    # Seeded vectors carry no metadata; tag them once so only the unset ones count as stale
+    adopt_existing(semantics_col, path, DEFAULT_EMBEDDING_MODEL)
+
+    def setup(i):
+        semantics_col.update_many({"country_code": {"$in": codes}}, {"$unset": {path: "", meta_field(path): ""}})
+        checkpoints.delete_many({})
+
+    def run(i):
+        run_backfill(semantics_col, env.embedder, RateLimiter("bench", 0), checkpoints, field=path)
+    return setup, run
+
+
+def case_sensitivity(env):
+    # Monte Carlo rank stability of one shortlist: every candidate × SENSITIVITY_SAMPLES scenarios
+    from get_final_shortlist import build_shortlist_state, candidate_hits, get_static_components
+    from sensitivity import analyze
+    state = build_shortlist_state(IDEAS[0])
+    hits = candidate_hits(state, state["sectors"])
+    components = get_static_components(list(hits))
+    return None, lambda i: analyze(hits, components, top_n=5, seed=i)
+
+
+def case_static_scores(env):
+    # Full rebuild of country_static_scores: one pass over country_profiles → one bulk upsert
+    from static_scores import build_static_scores
+    profiles_col, static_col = env.db["country_profiles"], env.db["country_static_scores"]
+    return None, lambda i: build_static_scores(profiles_col, static_col, force=True)
+
+
+def case_trends(env):
+    # Indicator series and trend features for every country in one vectorized pass
+    from static_scores import profile_flats
+    from timeseries import trend_components
+    flats = profile_flats(env.db["country_profiles"])
+    return None, lambda i: trend_components(flats)
+
+
+CASES = {
+    "shortlist": case_shortlist,
+    "reports": case_reports,
+    "graphs": case_graphs,
+    "chat": case_chat,
+    "semantics_etl": case_semantics_etl,
+    "semantics_runner": case_semantics_runner,
+    "embed_backfill": case_embed_backfill,
+    "static_scores": case_static_scores,
+    "trends": case_trends,
+    "sensitivity": case_sensitivity,
+}
+
+# === Runner ===
+
+def run_case(name, env, iterations, warmup, concurrency):
+    from tracing import span
+    from usage import process_totals
+
+    setup, run = CASES[name](env)
+
+    def one(i):
+        if setup:
+            setup(i)
+        started = time.perf_counter()
+        with span(f"bench_{name}") as sp:
+            run(i)
+        return (time.perf_counter() - started) * 1000, sp.counters
+
+    for i in range(warmup):
+        one(i)
+
+    before = process_totals()
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, range(warmup, warmup + iterations)))
+    else:
+        results = [one(i) for i in range(warmup, warmup + iterations)]
+    wall = time.perf_counter() - started
+    after = process_totals()
+
+    latencies = [ms for ms, _ in results]
+
+    def per_op(counter):
+        return round(sum(counters.get(counter, 0) for _, counters in results) / iterations, 2)
+
+    return {
+        "iterations": iterations,
+        "throughput_ops": round(iterations / wall, 3) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "llm_calls_per_op": round((after["calls"] - before["calls"]) / iterations, 2),
+        "llm_tokens_per_op": round(
+            (after["input_tokens"] + after["output_tokens"] - before["input_tokens"] - before["output_tokens"]) / iterations, 1
+        ),
+        "mongo_round_trips_per_op": per_op("mongo_round_trips"),
+        "llm_json_reasks_per_op": per_op("llm_json_reasks"),
+    }
+
+# === Baselines ===
+
+# Counters that must not grow at all; timings may drift by the tolerance
+EXACT_KEYS = ("llm_calls_per_op", "llm_tokens_per_op", "mongo_round_trips_per_op", "llm_json_reasks_per_op")
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of human-readable regressions against the saved baseline."""
+    regressions = []
+    for name, row in results.items():
+        base = baseline.get("cases", {}).get(name)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if base[key] and row[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]} → {row[key]}")
+        if base["throughput_ops"] and row["throughput_ops"] < base["throughput_ops"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput_ops {base['throughput_ops']} → {row['throughput_ops']}")
+        for key in EXACT_KEYS:
+            if key in base and row[key] > base[key]:
+                regressions.append(f"{name}: {key} {base[key]} → {row[key]}")
+    return regressions
+
+
+def print_table(results, baseline=None):
+    print(f"{'case':<15}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'llm/op':>8}{'tok/op':>9}{'mongo/op':>10}")
+    for name, row in results.items():
+        line = (f"{name:<15}{row['throughput_ops']:>9.2f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+                f"{row['mean_ms']:>10.1f}{row['llm_calls_per_op']:>8.1f}{row['llm_tokens_per_op']:>9.0f}"
+                f"{row['mongo_round_trips_per_op']:>10.1f}")
+        base = (baseline or {}).get("cases", {}).get(name)
+        if base and base["p95_ms"]:
+            line += f"   p95 {100 * (row['p95_ms'] / base['p95_ms'] - 1):+.0f}% vs baseline"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark on fake LLM / embedding / Mongo")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma-separated subset of: " + ", ".join(CASES))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--llm-latency-ms", type=float, default=40.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--llm-malformed-rate", type=float, default=0.0,
+                        help="share of JSON responses with a field dropped (exercises repair / re-ask)")
+    parser.add_argument("--embed-latency-ms", type=float, default=15.0)
+    parser.add_argument("--mongo-latency-ms", type=float, default=1.0)
+    parser.add_argument("--countries", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimensions")
+    parser.add_argument("--baseline", help="compare against this baseline JSON; exit 1 on regression")
+    parser.add_argument("--save-baseline", help="write the results to this baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative latency/throughput drift")
+    args = parser.parse_args()
+
+    config = {
+        "llm_latency_ms": args.llm_latency_ms, "llm_jitter_ms": args.llm_jitter_ms,
+        "llm_malformed_rate": args.llm_malformed_rate,
+        "embed_latency_ms": args.embed_latency_ms, "mongo_latency_ms": args.mongo_latency_ms,
+        "countries": args.countries, "dim": args.dim, "concurrency": args.concurrency,
+    }
+    env = fakes.install(
+        llm_latency_ms=args.llm_latency_ms, llm_jitter_ms=args.llm_jitter_ms,
+        llm_malformed_rate=args.llm_malformed_rate, embed_latency_ms=args.embed_latency_ms, mongo_latency_ms=args.mongo_latency_ms,
+        dim=args.dim, n_countries=args.countries
+    )
+    # Per-trace log lines would drown the table
+    logging.getLogger("globallaunch.trace").setLevel(logging.WARNING)
+
+    results = {}
+    for name in [c.strip() for c in args.cases.split(",") if c.strip()]:
+        if name not in CASES:
+            parser.error(f"unknown case: {name}")
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = run_case(name, env, args.iterations, args.warmup, args.concurrency)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"⚠️ Baseline was recorded with a different config: {baseline.get('config')}")
+
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "cases": results}, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
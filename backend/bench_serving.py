@@ -0,0 +1,91 @@
+# bench_serving.py
+# Compares the Flask (WSGI) and FastAPI (ASGI) serving modes under concurrent load.
+#
+# Start both servers first, e.g.:
+#   gunicorn -w 1 --threads 8 -b :8000 app:app
+#   uvicorn asgi_app:app --port 8001
+# then:
+#   python bench_serving.py --wsgi http://localhost:8000 --asgi http://localhost:8001 \
+#       --route /chat --concurrency 100 --requests 500 --country DEU --country BRA
+
+import time
+import argparse
+import statistics
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def build_request(base_url, route, question, countries, session_id):
+    url = base_url.rstrip("/") + route
+    if route in ("/chat", "/chat/stream"):
+        fields = [("question", question), ("session_id", session_id)] + [("top_countries", c) for c in countries]
+        return urllib.request.Request(url, data=urllib.parse.urlencode(fields).encode(), method="POST")
+    return urllib.request.Request(url)
+
+
+def timed_call(request, timeout):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            ok = 200 <= response.status < 300
+    except Exception:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_mode(name, base_url, args):
+    requests = [
+        build_request(base_url, args.route, args.question, args.country, f"bench{i % args.sessions:017d}")
+        for i in range(args.requests)
+    ]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda r: timed_call(r, args.timeout), requests))
+    wall = time.perf_counter() - started
+
+    latencies = [lat for lat, ok in results if ok]
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        "mode": name,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "mean_ms": (statistics.mean(latencies) * 1000) if latencies else 0.0,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WSGI vs ASGI load comparison")
+    parser.add_argument("--wsgi", default="http://localhost:8000")
+    parser.add_argument("--asgi", default="http://localhost:8001")
+    parser.add_argument("--route", default="/chat")
+    parser.add_argument("--question", default="What are the licensing requirements for a fintech startup?")
+    parser.add_argument("--country", action="append", default=[], help="top country code (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=20, help="distinct chat session IDs to spread load over")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    rows = [run_mode("wsgi", args.wsgi, args), run_mode("asgi", args.asgi, args)]
+
+    print(f"{args.route} — {args.requests} requests at concurrency {args.concurrency}")
+    print(f"{'mode':<6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'errors':>8}")
+    for row in rows:
+        print(f"{row['mode']:<6}{row['throughput_rps']:>10.1f}{row['p50_ms']:>10.0f}"
+              f"{row['p95_ms']:>10.0f}{row['mean_ms']:>10.0f}{row['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,54 @@
 import os
 import time
-import random
-from dotenv import load_dotenv
-from pymongo import MongoClient
-import google.generativeai as genai
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from answer_cache import SemanticAnswerCache
+from services import get_collection, get_gemini_model, get_genai
+from tracing import set_attrs, traced
+from llm import PartialStreamError, generate_async, generate_stream, generate_stream_async, generate_text
+from usage import CHAT_TOKEN_BUDGET, TokenBudgetExceeded, request_ledger
 
-# === Setup === 
+# === Setup ===
+# Gemini and MongoDB handles come from the shared lazy registry (see services.py)
 
-# Load environment variables from .env file
-load_dotenv()
+def reports_col():
+    return get_collection("country_reports")
 
-# Configure Gemini API with the provided key
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+# === Session Settings ===
 
-# Initialize the Gemini model
-model = genai.GenerativeModel("gemini-1.5-pro")
+SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL", 1800))   # Idle time before a chat session is dropped
+MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", 500))           # Upper bound on sessions held in memory
+HISTORY_WINDOW = 6                                                # Verbatim turns kept before older ones are summarized
 
-# Set up MongoDB client and reference to country reports collection
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client[os.getenv("DB_NAME")]
-reports_col = db["country_reports"]
+# Older turns are summarized off the request path
+_summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+# Semantic answer cache for repeated questions about the same reports
+ANSWER_CACHE_EMBED_MODEL = os.getenv("CHAT_CACHE_EMBED_MODEL", "models/text-embedding-004")
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("CHAT_CACHE_THRESHOLD", 0.95)),
+    ttl_seconds=int(os.getenv("CHAT_CACHE_TTL", 3600))
+)
+
+# Context caching needs an explicitly versioned model and a minimum context size. 32,768
+# tokens is the API minimum for the 1.5 models; five summarized reports are ~2k tokens, so
+# with the default model caching never engages. Lower it only for a model that allows it.
+CACHE_MODEL = os.getenv("CHAT_CACHE_MODEL", "models/gemini-1.5-pro-002")
+CACHE_MIN_TOKENS = int(os.getenv("CHAT_CACHE_MIN_TOKENS", 32768))
+
+# Shown instead of an answer once the session's chat token budget (usage.CHAT_TOKEN_BUDGET) is spent
+BUDGET_REPLY = "This session has reached its usage limit. Please start a new analysis to keep chatting."
+
+# Sent as a stream error event when neither the stream nor the blocking fallback produced an answer
+UNAVAILABLE_REPLY = "The assistant is unavailable right now. Please try again shortly."
 
 # === Chat Prompt Template ===
 
-# Template for constructing the AI prompt based on user input and available country reports
-CHAT_PROMPT_TEMPLATE = """
+# Instructions plus the (per-session constant) report block — this is the cacheable prefix
+CHAT_CONTEXT_TEMPLATE = """
 You are GlobalLaunch AI — a strategic advisor helping startup founders expand into global markets.
 
 The user has already received a ranked list of top countries for expansion, along with detailed AI-generated reports for each.
@@ -37,15 +61,36 @@ Now they have a follow-up question. Use the following logic:
 Your inputs are structured, not prose — refer to actual indicators and signals when forming your reply. Keep your tone strategic and grounded in data.
 Your answers should be crisp, clear and concise. The user wouldn't want to see very long answers from you.
 
---- USER QUESTION ---
-{user_question}
-
 --- TOP COUNTRY REPORTS (SUMMARIZED) ---
 {formatted_reports}
+"""
+
+# The part that changes every turn
+CHAT_TURN_TEMPLATE = """
+--- CONVERSATION SO FAR ---
+{conversation_history}
+
+--- USER QUESTION ---
+{user_question}
 
 Respond intelligently below:
 """
 
+# Template for constructing the AI prompt based on user input and available country reports
+CHAT_PROMPT_TEMPLATE = CHAT_CONTEXT_TEMPLATE + CHAT_TURN_TEMPLATE
+
+# Used to fold older turns into a short running summary
+HISTORY_SUMMARY_PROMPT = """
+Summarize this conversation between a startup founder and GlobalLaunch AI in at most 5 short bullet points.
+Keep country names, numbers and any decisions the founder has made. Do not add anything new.
+
+Previous summary:
+{summary}
+
+New turns:
+{turns}
+"""
+
 # === Report Formatter (new schema)
 
 # Converts a report document into a concise, structured summary for the prompt
@@ -63,23 +108,31 @@ def format_report_for_prompt(report):
 
 # === Gemini-safe wrapper
 
-# Handles transient API failures using exponential backoff
-def safe_generate(prompt, max_retries=5):
-    for attempt in range(max_retries):
-        try:
-            return model.generate_content(prompt).text.strip()
-        except Exception as e:
-            wait_time = (2 ** attempt) + random.uniform(0.5, 3)
-            print(f"Gemini error: {e} — retrying in {wait_time:.1f}s...")
-            time.sleep(wait_time)
-    raise RuntimeError("Gemini failed after max retries.")
+# Handles transient API failures using exponential backoff (usage is recorded by llm.py)
+def safe_generate(prompt, max_retries=5, gen_model=None):
+    return generate_text(prompt, gen_model=gen_model, max_retries=max_retries)
 
-# === Main Chat Handler
+# Streams the Gemini answer chunk by chunk; retries, usage recording and PartialStreamError
+# (raised once text has reached the caller) come from llm.py
+def safe_generate_stream(prompt, max_retries=5, gen_model=None):
+    return generate_stream(prompt, gen_model=gen_model, max_retries=max_retries)
+
+# === Async variants (used by the ASGI app)
+# Same retry semantics as above, but waiting never blocks the event loop.
+
+async def safe_generate_async(prompt, max_retries=5, gen_model=None):
+    response = await generate_async(prompt, gen_model=gen_model, max_retries=max_retries)
+    return response.text.strip()
 
-# Generates a Gemini-based answer using the top countries and user question
-def generate_answer(question: str, top_countries: list) -> str:
+def safe_generate_stream_async(prompt, max_retries=5, gen_model=None):
+    return generate_stream_async(prompt, gen_model=gen_model, max_retries=max_retries)
+
+# === Report Context
+
+# Returns (formatted_reports, None) when all reports are available, or (None, reply) with a canned reply otherwise
+def load_report_context(top_countries: list):
     # Fetch reports only for the specified top countries
-    reports_cursor = reports_col.find(
+    reports_cursor = reports_col().find(
         {"country_code": {"$in": top_countries}},
         {"_id": 0}
     )
@@ -91,20 +144,398 @@ def generate_answer(question: str, top_countries: list) -> str:
 
     # Handle cases with no or incomplete report data
     if len(reports) == 0:
-        return "Sorry, my scope here is limited — I couldn't retrieve the reports for your top countries."
+        return None, "Sorry, my scope here is limited — I couldn't retrieve the reports for your top countries."
     elif missing:
-        return f"Some country reports were missing ({', '.join(missing)}), so I may not be able to fully answer your question."
+        return None, f"Some country reports were missing ({', '.join(missing)}), so I may not be able to fully answer your question."
 
     # Format the reports into a readable block for the prompt
     formatted_reports = "\n\n".join(
         format_report_for_prompt(r) for r in reports
     )
+    return formatted_reports, None
+
+# === Semantic Answer Cache
+
+# Current report version per country; regenerated reports get a new version
+def get_report_versions(top_countries: list):
+    return {
+        r["country_code"]: r.get("report_version", "legacy")
+        for r in reports_col().find(
+            {"country_code": {"$in": top_countries}},
+            {"_id": 0, "country_code": 1, "report_version": 1}
+        )
+    }
+
+# Returns (cache_key, question_embedding, cached_answer); key/embedding are None when the cache is unusable.
+# Entries are keyed on the question and reports only, so a session with history skips the cache
+# both ways: a follow-up ("tell me more about that") means something else in every conversation
+def lookup_cached_answer(question: str, top_countries: list, session=None):
+    if session is not None and session.has_history():
+        return None, None, None
+    try:
+        key = answer_cache.make_key(get_report_versions(top_countries))
+        embedding = get_genai().embed_content(
+            model=ANSWER_CACHE_EMBED_MODEL,
+            content=question.strip(),
+            task_type="semantic_similarity"
+        )["embedding"]
+    except Exception as e:
+        print(f"Answer cache unavailable: {e}")
+        return None, None, None
+    return key, embedding, answer_cache.lookup(key, embedding)
+
+def store_cached_answer(key, embedding, answer):
+    if key is not None and answer:
+        answer_cache.store(key, embedding, answer)
+
+# === Chat Sessions
+
+class ChatSession:
+    """
+    Per-session chat state:
+    - the report context, formatted once when the session is opened
+    - a rolling window of recent turns plus a summary of everything older (written in the
+      background; until it lands, the turns being summarized stay in the prompt verbatim)
+    - an optional Gemini context cache holding the instructions and reports
+    """
+
+    def __init__(self, session_id, top_countries):
+        self.session_id = session_id
+        self.top_countries = tuple(top_countries)
+        self.formatted_reports, self.reply = load_report_context(list(top_countries))
+        self.history = []          # [(question, answer), ...] — most recent last
+        self.summary = ""
+        self.pending = []          # Turns handed to the background summary, not in `summary` yet
+        self.cached_content = None
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+        if self.formatted_reports is not None:
+            self.cached_content = self._create_context_cache()
+
+    # Puts the static prefix into a Gemini context cache when the API and context size allow it
+    def _create_context_cache(self):
+        context = CHAT_CONTEXT_TEMPLATE.format(formatted_reports=self.formatted_reports)
+        genai = get_genai()
+        if not hasattr(genai, "caching") or len(context) // 4 < CACHE_MIN_TOKENS:
+            return None
+        try:
+            return genai.caching.CachedContent.create(
+                model=CACHE_MODEL,
+                display_name=f"chat-{self.session_id}",
+                contents=[context],
+                ttl=timedelta(seconds=SESSION_TTL_SECONDS)
+            )
+        except Exception as e:
+            print(f"Context caching unavailable for {self.session_id}: {e}")
+            return None
+
+    @property
+    def gen_model(self):
+        if self.cached_content is not None:
+            return get_genai().GenerativeModel.from_cached_content(cached_content=self.cached_content)
+        return get_gemini_model()
+
+    def is_expired(self, now=None):
+        return (now or time.time()) - self.last_used > SESSION_TTL_SECONDS
+
+    def has_history(self):
+        with self.lock:
+            return bool(self.history or self.pending or self.summary)
+
+    def format_history(self):
+        lines = []
+        with self.lock:
+            summary, turns = self.summary, self.pending + self.history
+        if summary:
+            lines.append(f"(Earlier) {summary}")
+        for question, answer in turns:
+            lines.append(f"User: {question}\nGlobalLaunch AI: {answer}")
+        return "\n\n".join(lines) or "(none)"
+
+    # Builds the prompt for a new question — only the turn part when the context is cached
+    def prompt_for(self, question):
+        self.last_used = time.time()
+        turn = CHAT_TURN_TEMPLATE.format(
+            conversation_history=self.format_history(),
+            user_question=question.strip()
+        )
+        if self.cached_content is not None:
+            return turn
+        return CHAT_CONTEXT_TEMPLATE.format(formatted_reports=self.formatted_reports) + turn
+
+    # Stores a finished turn; once the window overflows, the oldest turns are folded into the
+    # summary on a background thread (one summary at a time per session)
+    def record_turn(self, question, answer):
+        with self.lock:
+            self.history.append((question.strip(), answer.strip()))
+            if len(self.history) <= HISTORY_WINDOW or self.pending:
+                return
+            self.pending = self.history[:-HISTORY_WINDOW // 2]
+            self.history = self.history[-HISTORY_WINDOW // 2:]
+        _summary_pool.submit(self._summarize)
+
+    def _summarize(self):
+        turns = "\n".join(f"User: {q}\nGlobalLaunch AI: {a}" for q, a in self.pending)
+        try:
+            # Counted against the session's chat budget like the answers themselves
+            with request_ledger("chat", session_id=self.session_id, budget_tokens=CHAT_TOKEN_BUDGET,
+                                per_session=True):
+                summary = safe_generate(
+                    HISTORY_SUMMARY_PROMPT.format(summary=self.summary or "(none)", turns=turns),
+                    max_retries=2
+                )
+        except Exception as e:
+            print(f"History summary failed for {self.session_id}: {e}")
+            summary = (self.summary + "\n" + turns)[-2000:]
+        with self.lock:
+            self.summary = summary
+            self.pending = []
+
+    def close(self):
+        if self.cached_content is not None:
+            try:
+                self.cached_content.delete()
+            except Exception as e:
+                print(f"Failed to delete context cache for {self.session_id}: {e}")
+            self.cached_content = None
+
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+# Returns the live session for this ID, opening a new one if it is unknown, expired,
+# or was opened for a different set of top countries
+def get_chat_session(session_id, top_countries):
+    now = time.time()
+    stale = []
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session and (session.is_expired(now) or session.top_countries != tuple(top_countries)):
+            stale.append(_sessions.pop(session_id))
+            session = None
+
+    # Opening a session hits Mongo (and maybe the caching API), so do it outside the lock
+    if session is None:
+        session = ChatSession(session_id, top_countries)
+
+    with _sessions_lock:
+        current = _sessions.get(session_id)
+        if current is not None and current is not session and current.top_countries == session.top_countries:
+            stale.append(session)   # Another request opened the same session first
+            session = current
+        elif current is not session:
+            if current is not None:
+                stale.append(current)
+            _sessions[session_id] = session
+        _sessions.move_to_end(session_id)
+
+        # Evict expired sessions and keep the store bounded (least recently used first)
+        for sid in [sid for sid, s in _sessions.items() if s.is_expired(now)]:
+            stale.append(_sessions.pop(sid))
+        while len(_sessions) > MAX_SESSIONS:
+            stale.append(_sessions.popitem(last=False)[1])
+
+    for old in stale:
+        old.close()
+    return session
+
+# Drops all sessions and cached answers (used when reports are reset)
+def clear_chat_sessions():
+    answer_cache.invalidate()
+    with _sessions_lock:
+        stale = list(_sessions.values())
+        _sessions.clear()
+    for old in stale:
+        old.close()
+
+# === Prompt Builder
+
+# Returns (prompt, model, session, None) when the reports are available,
+# or (None, None, None, reply) with a canned reply otherwise
+def build_chat_prompt(question: str, top_countries: list, session_id=None):
+    if session_id:
+        session = get_chat_session(session_id, top_countries)
+        if session.formatted_reports is None:
+            return None, None, None, session.reply
+        return session.prompt_for(question), session.gen_model, session, None
+
+    formatted_reports, reply = load_report_context(top_countries)
+    if formatted_reports is None:
+        return None, None, None, reply
 
     # Fill in the prompt template with user input and report data
     prompt = CHAT_PROMPT_TEMPLATE.format(
-        user_question=question.strip(),
-        formatted_reports=formatted_reports
+        formatted_reports=formatted_reports,
+        conversation_history="(none)",
+        user_question=question.strip()
     )
+    return prompt, get_gemini_model(), None, None
+
+# === Chat Turn
+# Everything about a chat turn except the Gemini call itself: the prompt, the cached answer,
+# the streamed parts and the bookkeeping once the answer is complete. The sync and async
+# handlers below share it and differ only in how they wait for Gemini.
+
+class ChatTurn:
+    def __init__(self, question: str, top_countries: list, session_id=None):
+        self.started = time.perf_counter()
+        self.question = question
+        self.prompt, self.gen_model, self.session, self.reply = build_chat_prompt(question, top_countries, session_id)
+        self.cache_key = self.embedding = self.cached = None
+        if self.prompt is not None:
+            self.cache_key, self.embedding, self.cached = lookup_cached_answer(question, top_countries, self.session)
+            if self.cached is not None:
+                print("⚡ Answer served from semantic cache")
+        self.mode = "stream"
+        self.first_token_ms = None
+        self.parts = []
+
+    # True when no Gemini call is needed: a static reply or a cached answer
+    @property
+    def answered(self):
+        return self.prompt is None or self.cached is not None
+
+    # Records a complete answer in the cache and the conversation history
+    def complete(self, answer):
+        if self.cached is None:
+            store_cached_answer(self.cache_key, self.embedding, answer)
+        if self.session:
+            self.session.record_turn(self.question, answer)
+        return answer
+
+    # Events for a turn that needs no Gemini call
+    def answered_events(self):
+        if self.prompt is None:
+            return [
+                {"type": "token", "text": self.reply},
+                {"type": "done", "mode": "static", "first_token_ms": 0.0, "total_ms": 0.0}
+            ]
+        self.complete(self.cached)
+        elapsed_ms = round((time.perf_counter() - self.started) * 1000, 1)
+        return [
+            {"type": "token", "text": self.cached},
+            {"type": "done", "mode": "cache", "first_token_ms": elapsed_ms, "total_ms": elapsed_ms}
+        ]
+
+    def token(self, text):
+        if self.first_token_ms is None:
+            self.first_token_ms = (time.perf_counter() - self.started) * 1000
+            print(f"⏱️ Chat first token after {self.first_token_ms:.0f} ms")
+        self.parts.append(text)
+        return {"type": "token", "text": text}
+
+    # Maps a stream failure to its error event, or returns None when the turn
+    # should fall back to one blocking call
+    def stream_failed(self, e):
+        if isinstance(e, PartialStreamError):
+            print(f"Chat stream cut short: {e}")
+            self.parts = []
+            return {"type": "error", "message": "The response was interrupted. Please ask again."}
+        if isinstance(e, TokenBudgetExceeded):
+            print(f"Chat stream refused: {e}")
+            self.mode = "budget"
+            return {"type": "error", "message": BUDGET_REPLY}
+        print(f"Chat streaming unavailable ({e}) — falling back to blocking mode.")
+        self.mode = "blocking"
+        return None
+
+    def fallback_failed(self, e):
+        if isinstance(e, TokenBudgetExceeded):
+            print(f"Chat fallback refused: {e}")
+            self.mode = "budget"
+            return {"type": "error", "message": BUDGET_REPLY}
+        print(f"Chat fallback failed: {e}")
+        self.mode = "error"
+        return {"type": "error", "message": UNAVAILABLE_REPLY}
+
+    def done_event(self):
+        # Only complete answers become part of the conversation history and the cache
+        if self.parts:
+            self.complete("".join(self.parts))
+        total_ms = (time.perf_counter() - self.started) * 1000
+        return {
+            "type": "done",
+            "mode": self.mode,
+            "first_token_ms": round(self.first_token_ms or total_ms, 1),
+            "total_ms": round(total_ms, 1)
+        }
+
+# === Main Chat Handler
+
+# Generates a Gemini-based answer using the top countries and user question.
+# With a session ID, the report context is reused and prior turns are remembered.
+@traced("chat")
+def generate_answer(question: str, top_countries: list, session_id=None) -> str:
+    turn = ChatTurn(question, top_countries, session_id)
+    if turn.prompt is None:
+        return turn.reply
+    set_attrs(cache_hit=turn.cached is not None)
+    if turn.cached is not None:
+        return turn.complete(turn.cached)
 
     print("🔍 Sending prompt to Gemini...")
-    return safe_generate(prompt)
+    return turn.complete(safe_generate(turn.prompt, gen_model=turn.gen_model))
+
+# === Streaming Chat Handler
+
+# Yields chat events as dicts:
+#   {"type": "token", "text": ...}               — a piece of the answer
+#   {"type": "error", "message": ...}            — the stream broke after partial output, or no answer came
+#   {"type": "done", "mode": ..., "first_token_ms": ..., "total_ms": ...}
+# Falls back to one blocking call when the stream cannot be started at all; the stream's
+# retries already cover transient errors, so the fallback gets no retry budget of its own.
+# Every path ends with a "done" event.
+def stream_answer(question: str, top_countries: list, session_id=None):
+    turn = ChatTurn(question, top_countries, session_id)
+    if turn.answered:
+        yield from turn.answered_events()
+        return
+
+    print("🔍 Streaming prompt to Gemini...")
+    try:
+        for text in safe_generate_stream(turn.prompt, gen_model=turn.gen_model):
+            yield turn.token(text)
+    except Exception as e:
+        event = turn.stream_failed(e)
+        if event is None:
+            try:
+                event = turn.token(safe_generate(turn.prompt, max_retries=1, gen_model=turn.gen_model))
+            except Exception as e:
+                event = turn.fallback_failed(e)
+        yield event
+    yield turn.done_event()
+
+# === Async Chat Handlers
+# Prompt building and cache lookups are short (in-memory after a session's first turn),
+# so they run on a worker thread; the long Gemini wait is awaited on the event loop.
+
+async def generate_answer_async(question: str, top_countries: list, session_id=None) -> str:
+    turn = await asyncio.to_thread(ChatTurn, question, top_countries, session_id)
+    if turn.prompt is None:
+        return turn.reply
+    if turn.cached is not None:
+        return turn.complete(turn.cached)
+
+    print("🔍 Sending prompt to Gemini (async)...")
+    return turn.complete(await safe_generate_async(turn.prompt, gen_model=turn.gen_model))
+
+# Async counterpart of `stream_answer`, yielding the same events
+async def stream_answer_async(question: str, top_countries: list, session_id=None):
+    turn = await asyncio.to_thread(ChatTurn, question, top_countries, session_id)
+    if turn.answered:
+        for event in turn.answered_events():
+            yield event
+        return
+
+    print("🔍 Streaming prompt to Gemini (async)...")
+    try:
+        async for text in safe_generate_stream_async(turn.prompt, gen_model=turn.gen_model):
+            yield turn.token(text)
+    except Exception as e:
+        event = turn.stream_failed(e)
+        if event is None:
+            try:
+                event = turn.token(await safe_generate_async(turn.prompt, max_retries=1, gen_model=turn.gen_model))
+            except Exception as e:
+                event = turn.fallback_failed(e)
+        yield event
+    yield turn.done_event()
@@ -1,72 +1,289 @@
+# embed_sector_profiles.py
+# Backfills the sector-summary embeddings in country_semantics.
+#
+# One cursor sorted by _id feeds batches of summaries to get_embeddings (as many texts per
+# request as the model accepts), a shared rate limiter keeps requests under the Vertex AI
+# quota, and each round of batches is written with a single bulk_write. Progress is
+# checkpointed in job_checkpoints, so an interrupted run resumes after the last written
+# _id instead of starting over.
+#
+# Each vector is stored with `<field>_meta` = {model, summary_hash, embedded_at}. A run
+# only re-embeds documents whose vector is missing, whose summary changed since it was
+# embedded, or whose vector came from another model. Setting SEMANTIC_EMBEDDING_NEXT and
+# EMBED_MODEL_NEXT fills a second field next to the live one, so a new vector index can be
+# built and switched to (SEMANTIC_EMBEDDING / SEMANTIC_IDX / EMBED_MODEL) without downtime.
+#
+#   python embed_sector_profiles.py                   # embed new or changed summaries
+#   python embed_sector_profiles.py --reembed         # recompute every vector
+#   python embed_sector_profiles.py --restart         # ignore the saved checkpoint
+#   python embed_sector_profiles.py --adopt-existing  # tag vectors written before metadata existed
+
 import os
 import time
-from pymongo import MongoClient
-from dotenv import load_dotenv
-from vertexai.preview.language_models import TextEmbeddingModel
-import vertexai
+import random
+import hashlib
+import argparse
+from itertools import islice
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import UpdateOne
+from pymongo.errors import CursorNotFound
+from services import DEFAULT_EMBEDDING_MODEL, get_collection, get_embedding_model
+from ratelimit import get_limiter
+from packing import estimate_tokens
 
-# === Setup ===
+# === Config ===
 
-# Load environment variables from .env file
-load_dotenv()
+EMBED_MODEL = DEFAULT_EMBEDDING_MODEL
 
-# Initialize Vertex AI with the correct project and region
-vertexai.init(
-    project=os.getenv("PROJECT_ID"),
-    location="us-central1"
-)
+# Field name to store embeddings (dynamic via env variable)
+SEMANTIC_EMBEDDING = os.getenv("SEMANTIC_EMBEDDING")
 
-# Load Gemini embedding model
-model = TextEmbeddingModel.from_pretrained("gemini-embedding-001")
+# Optional second field/model filled alongside the live one during a model migration
+SEMANTIC_EMBEDDING_NEXT = os.getenv("SEMANTIC_EMBEDDING_NEXT")
+EMBED_MODEL_NEXT = os.getenv("EMBED_MODEL_NEXT")
 
-# Connect to MongoDB and select the relevant collection
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client[os.getenv("DB_NAME")]
-collection = db["country_semantics"]
+# Requests per minute against the Vertex AI quota, texts per request (0 = model maximum)
+# and requests in flight
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("EMBED_REQUESTS_PER_MINUTE", 300))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 0))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 4))
 
-# Field name to store embeddings (dynamic via env variable)
-SEMANTIC_EMBEDDING = os.getenv("SEMANTIC_EMBEDDING")
+# Texts per get_embeddings request allowed by Vertex AI; gemini-embedding-001 takes one
+MODEL_BATCH_LIMITS = {
+    "gemini-embedding-001": 1,
+    "text-embedding-004": 250,
+    "text-embedding-005": 250,
+    "text-multilingual-embedding-002": 250,
+}
+DEFAULT_BATCH_LIMIT = 250
 
-# Number of documents to process in one batch
-BATCH_SIZE = 10
-
-# === Embedding Loop ===
-
-# Keep embedding documents until all summaries are processed
-while True:
-    # Fetch a batch of documents that:
-    # - have a non-empty "summary" field
-    # - do NOT already have an embedding stored
-    docs = list(collection.find(
-        {
-            "summary": {"$exists": True, "$ne": ""},
-            SEMANTIC_EMBEDDING: {"$exists": False}
-        }
-    ).limit(BATCH_SIZE))
-
-    # Exit if all relevant documents are already embedded
-    if not docs:
-        print("✅ All documents embedded.")
-        break
-
-    # Process each document in the current batch
-    for doc in docs:
+# Vertex AI also caps the input tokens of one request
+MAX_BATCH_TOKENS = 20000
+
+# Documents per cursor fetch
+FETCH_BATCH = 500
+
+CHECKPOINTS = "job_checkpoints"
+
+# === Change detection ===
+
+def summary_hash(summary):
+    return hashlib.sha256(summary.encode("utf-8")).hexdigest()[:16]
+
+
+def meta_field(field):
+    return f"{field}_meta"
+
+
+def embedding_meta(doc, model_name):
+    return {
+        "model": model_name,
+        "summary_hash": summary_hash(doc["summary"]),
+        "embedded_at": datetime.now(timezone.utc),
+    }
+
+
+def is_stale(doc, field, model_name):
+    """
+    True when the doc's vector is missing, from another model, or older than its summary.
+    Every vector this job writes carries metadata, so missing metadata means no usable vector.
+    """
+    meta = doc.get(meta_field(field)) or {}
+    return meta.get("model") != model_name or meta.get("summary_hash") != summary_hash(doc["summary"])
+
+
+def adopt_existing(collection, field, model_name):
+    """
+    Tags vectors written before metadata existed as current, without calling the API.
+    Only safe when they are known to come from `model_name` and today's summaries.
+    """
+    docs = collection.find(
+        {field: {"$exists": True}, meta_field(field): {"$exists": False}},
+        {"summary": 1}
+    )
+    ops = [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {meta_field(field): embedding_meta(doc, model_name)}})
+        for doc in docs if doc.get("summary")
+    ]
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    print(f"Adopted {len(ops)} existing vectors in {field} as {model_name}")
+    return len(ops)
+
+# === Cursor & batching ===
+
+def iter_pending(collection, query, after_id=None, projection=None):
+    """
+    Yields matching documents in _id order from one cursor. If the server drops the
+    cursor mid-run, it is reopened after the last _id seen.
+    """
+    while True:
+        cursor_query = dict(query, _id={"$gt": after_id}) if after_id is not None else query
+        cursor = collection.find(
+            cursor_query, projection or {"summary": 1, "country_code": 1, "sector": 1}
+        ).sort("_id", 1).batch_size(FETCH_BATCH)
         try:
-            summary = doc["summary"]
-            
-            # Generate embedding from summary text
-            embedding = model.get_embeddings([summary])[0].values
-
-            # Store the embedding in the document
-            collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": {SEMANTIC_EMBEDDING: embedding}}
-            )
-
-            print(f"Embedded {doc['country_code']} - {doc['sector']}")
-            
-            # Respect Vertex AI rate limit (~5 requests/min)
-            time.sleep(12.5)
+            for doc in cursor:
+                after_id = doc["_id"]
+                yield doc
+            return
+        except CursorNotFound:
+            print(f"Cursor expired — reopening after {after_id}")
+
+
+def batch_limit(model_name, requested=0):
+    limit = MODEL_BATCH_LIMITS.get(model_name, DEFAULT_BATCH_LIMIT)
+    return min(requested, limit) if requested else limit
+
+
+def iter_batches(docs, size, max_tokens=MAX_BATCH_TOKENS):
+    """Groups documents into request-sized batches (by count and estimated tokens)."""
+    batch, tokens = [], 0
+    for doc in docs:
+        doc_tokens = estimate_tokens(doc["summary"])
+        if batch and (len(batch) >= size or tokens + doc_tokens > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(doc)
+        tokens += doc_tokens
+    if batch:
+        yield batch
 
+# === Embedding ===
+
+def embed_batch(model, limiter, batch, max_retries=5):
+    """Vectors for the batch's summaries, or None once retries are exhausted."""
+    texts = [doc["summary"] for doc in batch]
+    for attempt in range(max_retries):
+        limiter.acquire()
+        try:
+            return [e.values for e in model.get_embeddings(texts)]
         except Exception as e:
-            print(f"Failed {doc.get('country_code')} - {doc.get('sector')}: {e}")
+            wait = (2 ** attempt) + random.uniform(0.5, 3)
+            print(f"Embedding error: {e} — retrying in {wait:.1f}s...")
+            time.sleep(wait)
+    return None
+
+# === Checkpoints ===
+
+def load_checkpoint(checkpoints, job_id):
+    state = checkpoints.find_one({"_id": job_id})
+    if not state or state.get("status") == "done":
+        return None
+    return state
+
+
+def save_checkpoint(checkpoints, job_id, **fields):
+    checkpoints.update_one(
+        {"_id": job_id},
+        {"$set": {**fields, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+# === Job ===
+
+def run_backfill(collection=None, model=None, limiter=None, checkpoints=None, field=None,
+                 model_name=EMBED_MODEL, reembed=False, restart=False,
+                 batch_size=EMBED_BATCH_SIZE, workers=EMBED_WORKERS):
+    """
+    Embeds missing or stale summaries into `field` with `model_name`; returns
+    {"embedded", "unchanged", "failed", "requests", "seconds"}.
+    """
+    collection = collection if collection is not None else get_collection("country_semantics")
+    checkpoints = checkpoints if checkpoints is not None else get_collection(CHECKPOINTS)
+    model = model or get_embedding_model(model_name)
+    limiter = limiter or get_limiter("vertex_embeddings", EMBED_REQUESTS_PER_MINUTE)
+    field = field or SEMANTIC_EMBEDDING
+
+    job_id = f"embed_sector_profiles:{field}:{model_name}:{'reembed' if reembed else 'changed'}"
+    state = None if restart else load_checkpoint(checkpoints, job_id)
+    after_id = state["last_id"] if state else None
+    embedded = state["embedded"] if state else 0
+    failed_ids = list(state.get("failed_ids", [])) if state else []
+    if state:
+        print(f"Resuming {job_id} after _id {after_id} ({embedded} already embedded)")
+
+    # Staleness is decided client-side from the hash and model tag; the projection
+    # carries the metadata, never the vectors themselves
+    query = {"summary": {"$exists": True, "$ne": ""}}
+    projection = {"summary": 1, "country_code": 1, "sector": 1, meta_field(field): 1}
+    unchanged = 0
+
+    def pending():
+        nonlocal unchanged
+        for doc in iter_pending(collection, query, after_id, projection):
+            if reembed or is_stale(doc, field, model_name):
+                yield doc
+            else:
+                unchanged += 1
+
+    size = batch_limit(model_name, batch_size)
+    batches = iter_batches(pending(), size)
+    started, requests = time.perf_counter(), 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # One round = one batch per worker, written together and then checkpointed
+            round_batches = list(islice(batches, workers))
+            if not round_batches:
+                break
+            vectors = list(pool.map(lambda b: embed_batch(model, limiter, b), round_batches))
+            requests += len(round_batches)
+
+            ops = []
+            for batch, batch_vectors in zip(round_batches, vectors):
+                if batch_vectors is None:
+                    failed_ids.extend(doc["_id"] for doc in batch)
+                    continue
+                ops.extend(
+                    UpdateOne({"_id": doc["_id"]}, {"$set": {field: vector, meta_field(field): embedding_meta(doc, model_name)}})
+                    for doc, vector in zip(batch, batch_vectors)
+                )
+            if ops:
+                collection.bulk_write(ops, ordered=False)
+                embedded += len(ops)
+
+            after_id = round_batches[-1][-1]["_id"]
+            save_checkpoint(checkpoints, job_id, status="running", last_id=after_id,
+                            embedded=embedded, failed_ids=failed_ids[-1000:], model=model_name)
+            elapsed = time.perf_counter() - started
+            print(f"Embedded {embedded} (failed {len(failed_ids)}) — {embedded / elapsed if elapsed else 0:.1f}/s")
+
+    save_checkpoint(checkpoints, job_id, status="done", last_id=after_id,
+                    embedded=embedded, failed_ids=failed_ids[-1000:], model=model_name)
+    seconds = round(time.perf_counter() - started, 2)
+    print(f"✅ Done [{field} / {model_name}]: {embedded} embedded, {unchanged} unchanged, "
+          f"{len(failed_ids)} failed, {requests} requests in {seconds}s")
+    return {"embedded": embedded, "unchanged": unchanged, "failed": len(failed_ids),
+            "requests": requests, "seconds": seconds}
+
+
+def embedding_targets():
+    """(field, model) pairs to keep current: the live field, plus the next one mid-migration."""
+    targets = [(SEMANTIC_EMBEDDING, EMBED_MODEL)]
+    if SEMANTIC_EMBEDDING_NEXT and EMBED_MODEL_NEXT:
+        targets.append((SEMANTIC_EMBEDDING_NEXT, EMBED_MODEL_NEXT))
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill sector-summary embeddings in country_semantics")
+    parser.add_argument("--reembed", action="store_true", help="recompute vectors that already exist")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="texts per request (0 = model maximum)")
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS)
+    parser.add_argument("--adopt-existing", action="store_true",
+                        help="tag untagged vectors in the live field as current instead of re-embedding them")
+    args = parser.parse_args()
+
+    if args.adopt_existing:
+        adopt_existing(get_collection("country_semantics"), SEMANTIC_EMBEDDING, EMBED_MODEL)
+
+    for field, model_name in embedding_targets():
+        run_backfill(field=field, model_name=model_name, reembed=args.reembed, restart=args.restart,
+                     batch_size=args.batch_size, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,885 @@
+# fakes.py
+# Offline stand-ins for Gemini, Vertex AI embeddings and MongoDB.
+#
+# `install()` swaps them into the service registry (services.override), so the pipeline
+# modules run unchanged with no network access — used by bench_pipeline.py and
+# load_test.py. Everything is deterministic: the same prompt always gets the same
+# answer, the same text always gets the same embedding, and simulated latencies use
+# a seeded jitter.
+
+import os
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import operator
+import itertools
+import threading
+from copy import deepcopy
+from types import SimpleNamespace
+
+import services
+from tracing import incr
+
+SECTORS = [
+    "fintech", "healthtech", "edtech", "ecommerce", "cleantech",
+    "logistics", "SaaS", "cybersecurity", "AI-ML", "retail",
+    "agritech", "mobility", "proptech", "govtech", "biotech"
+]
+
+COUNTRY_CODES = [
+    "ARE", "ARG", "AUS", "BGD", "BRA", "CAN", "CHE", "CHL", "CHN", "COL",
+    "DEU", "DNK", "EGY", "ESP", "EST", "FIN", "FRA", "GBR", "GHA", "IDN",
+    "IND", "IRL", "ISR", "ITA", "JPN", "KEN", "KOR", "MAR", "MEX", "MYS",
+    "NGA", "NLD", "NOR", "NZL", "PAK", "PER", "PHL", "POL", "PRT", "RWA",
+    "SAU", "SGP", "SWE", "THA", "TUR", "TWN", "UKR", "USA", "VNM", "ZAF"
+]
+
+YEARS = ("2019", "2020", "2021", "2022", "2023")
+
+
+def _rng(*parts):
+    """Random generator seeded from the given values (stable across runs and processes)."""
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+class _Latency:
+    """Sleeps for a base latency plus seeded jitter; both in milliseconds."""
+
+    def __init__(self, base_ms=0.0, jitter_ms=0.0, seed=0):
+        self.base_ms = base_ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_ms(self):
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        return self.base_ms + jitter
+
+    def wait(self):
+        ms = self.next_ms()
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    async def wait_async(self):
+        ms = self.next_ms()
+        if ms > 0:
+            await asyncio.sleep(ms / 1000)
+
+# === Fake Gemini ===
+
+def _usage(prompt, text):
+    prompt_text = prompt if isinstance(prompt, str) else json.dumps(prompt, default=str)
+    return SimpleNamespace(
+        prompt_token_count=max(1, len(prompt_text) // 4),
+        candidates_token_count=max(1, len(text) // 4),
+        total_token_count=max(1, len(prompt_text) // 4) + max(1, len(text) // 4)
+    )
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeGenerativeModel:
+    """
+    Answers every pipeline prompt with well-formed output of the expected shape:
+    sector lists, chunk insights, final reports, semantic profiles and chat text.
+    `latency_ms` is the time to the full response (or to the first streamed chunk);
+    streamed chunks then arrive every `chunk_ms`.
+    """
+
+    def __init__(self, model_name="fake-gemini", latency_ms=0.0, jitter_ms=0.0, chunk_ms=0.0,
+                 stream_chunks=8, failure_rate=0.0, malformed_rate=0.0, seed=0):
+        self.model_name = model_name
+        self.latency = _Latency(latency_ms, jitter_ms, seed)
+        self.chunk_ms = chunk_ms
+        self.stream_chunks = stream_chunks
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self._failures = random.Random(seed + 1)
+        self._failures_lock = threading.Lock()
+        self.calls = 0
+
+    # --- Response synthesis ---
+
+    def respond(self, prompt, schema=None):
+        prompt = prompt if isinstance(prompt, str) else json.dumps(prompt, default=str)
+        rng = _rng(prompt)
+        if schema is not None and "previous JSON answer" in prompt:
+            return json.dumps(self._from_schema(schema, rng))   # Field re-ask (llm.generate_json)
+        if "startup classification assistant" in prompt:
+            return json.dumps(self._sectors(prompt, rng))
+        if "founder-facing" in prompt:
+            return json.dumps(self._final_report(prompt, rng))
+        if "business_environment" in prompt and "entry_considerations" in prompt:
+            return json.dumps(self._chunk_insights(prompt, rng))
+        if "keyed by sector name" in prompt and schema is not None:
+            return json.dumps({sector: self._semantic_profile(prompt, _rng(prompt, sector))
+                               for sector in schema.get("properties", {})})
+        if '"summary"' in prompt and "indicators" in prompt:
+            return json.dumps(self._semantic_profile(prompt, rng))
+        if "Summarize this conversation" in prompt:
+            return "The user asked about market entry and regulation; key answers covered licensing and costs."
+        return self._chat_answer(prompt, rng)
+
+    def _sectors(self, prompt, rng):
+        idea = prompt.split('"""')[1] if prompt.count('"""') >= 2 else prompt
+        found = [s for s in SECTORS if s.lower() in idea.lower()]
+        if not found:
+            found = rng.sample(SECTORS, 2)
+        return found[:3]
+
+    def _country(self, prompt):
+        match = re.search(r"(?:into|country:?|for the country)\s+([A-Z0-9]{3})\b", prompt) or \
+            re.search(r"\b([A-Z]{3})\b", prompt)
+        return match.group(1) if match else "XXX"
+
+    def _sentences(self, rng, topic, n):
+        return [
+            f"{topic} indicator moved {rng.uniform(-5, 12):.1f}% between {rng.choice(YEARS[:3])} "
+            f"and {rng.choice(YEARS[3:])}, scoring {rng.uniform(40, 95):.1f}."
+            for _ in range(n)
+        ]
+
+    def _chunk_insights(self, prompt, rng):
+        return {
+            "business_environment": self._sentences(rng, "Business", rng.randint(1, 3)),
+            "infrastructure_and_digital": self._sentences(rng, "Digital", rng.randint(1, 3)),
+            "economic_and_trade_outlook": self._sentences(rng, "Trade", rng.randint(1, 3)),
+            "regulatory_and_risk": self._sentences(rng, "Regulatory", rng.randint(1, 3)),
+            "entry_considerations": self._sentences(rng, "Entry", rng.randint(1, 3)),
+        }
+
+    def _final_report(self, prompt, rng):
+        country = self._country(prompt)
+        return {
+            "executive_summary": f"{country} offers a stable entry point: " + " ".join(self._sentences(rng, "Overall", 2)),
+            "business_environment": self._sentences(rng, "Business", 3),
+            "infrastructure_and_digital": self._sentences(rng, "Digital", 3),
+            "economic_and_trade_outlook": self._sentences(rng, "Trade", 3),
+            "regulatory_and_risk": self._sentences(rng, "Regulatory", 3),
+            "entry_considerations": {
+                "market_opportunity_signals": self._sentences(rng, "Demand", 2),
+                "sector_specific_notes": self._sentences(rng, "Sector", 2),
+                "go_to_market_advice": self._sentences(rng, "GTM", 2),
+            }
+        }
+
+    def _semantic_profile(self, prompt, rng):
+        country = self._country(prompt)
+        return {
+            "summary": f"{country}: " + " ".join(self._sentences(rng, "Sector", 6)),
+            "indicators": [
+                {"name": "gdp_growth_percent", "value": f"{rng.uniform(-2, 8):.2f}"},
+                {"name": "mobile_broadband_coverage_percent", "value": f"{rng.uniform(40, 100):.1f}"},
+                {"name": "ease_of_doing_business_score", "value": f"{rng.uniform(40, 90):.1f}"},
+            ]
+        }
+
+    def _chat_answer(self, prompt, rng):
+        return " ".join(self._sentences(rng, "Market", rng.randint(3, 6)))
+
+    def _from_schema(self, schema, rng):
+        """Any value matching a Gemini response schema."""
+        kind = schema["type"]
+        if kind == "OBJECT":
+            return {key: self._from_schema(sub, rng) for key, sub in schema.get("properties", {}).items()}
+        if kind == "ARRAY":
+            return [self._from_schema(schema["items"], rng) for _ in range(2)]
+        if kind == "STRING":
+            return rng.choice(schema["enum"]) if "enum" in schema else self._sentences(rng, "Detail", 1)[0]
+        if kind in ("NUMBER", "INTEGER"):
+            return rng.randint(0, 100)
+        return True
+
+    def _malformed(self, text, rng):
+        """Drops one top-level field from a JSON object, as a flaky model sometimes does."""
+        try:
+            value = json.loads(text)
+        except ValueError:
+            return text
+        if isinstance(value, dict) and value:
+            value.pop(rng.choice(sorted(value)))
+        return json.dumps(value)
+
+    # --- GenerativeModel API ---
+
+    def _maybe_fail(self):
+        if self.failure_rate:
+            with self._failures_lock:
+                failed = self._failures.random() < self.failure_rate
+            if failed:
+                raise RuntimeError("Simulated Gemini failure")
+
+    def _stream_pieces(self, text):
+        words = text.split(" ")
+        size = max(1, math.ceil(len(words) / self.stream_chunks))
+        return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "")
+                for i in range(0, len(words), size)]
+
+    def _text_for(self, prompt, generation_config=None):
+        schema = (generation_config or {}).get("response_schema")
+        text = self.respond(prompt, schema)
+        if schema is not None and self.malformed_rate:
+            with self._failures_lock:
+                malformed = self._failures.random() < self.malformed_rate
+            if malformed:
+                text = self._malformed(text, _rng(prompt, "malformed"))
+        return text
+
+    def generate_content(self, prompt, stream=False, generation_config=None, **kwargs):
+        self.calls += 1
+        self.latency.wait()
+        self._maybe_fail()
+        text = self._text_for(prompt, generation_config)
+        if not stream:
+            return FakeResponse(text, _usage(prompt, text))
+        return self._stream(prompt, text)
+
+    def _stream(self, prompt, text):
+        pieces = self._stream_pieces(text)
+        for i, piece in enumerate(pieces):
+            if i and self.chunk_ms:
+                time.sleep(self.chunk_ms / 1000)
+            yield FakeResponse(piece, _usage(prompt, text) if i == len(pieces) - 1 else None)
+
+    async def generate_content_async(self, prompt, stream=False, generation_config=None, **kwargs):
+        self.calls += 1
+        await self.latency.wait_async()
+        self._maybe_fail()
+        text = self._text_for(prompt, generation_config)
+        if not stream:
+            return FakeResponse(text, _usage(prompt, text))
+        return self._stream_async(prompt, text)
+
+    async def _stream_async(self, prompt, text):
+        pieces = self._stream_pieces(text)
+        for i, piece in enumerate(pieces):
+            if i and self.chunk_ms:
+                await asyncio.sleep(self.chunk_ms / 1000)
+            yield FakeResponse(piece, _usage(prompt, text) if i == len(pieces) - 1 else None)
+
+# === Fake embeddings ===
+
+def embed_text(text, dim=256):
+    """
+    Deterministic unit vector for `text`: hashed word (and word-pair) features, so texts
+    that share vocabulary land close together — enough for vector search and the answer
+    cache to behave realistically.
+    """
+    words = re.findall(r"[a-z0-9\-]+", text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector = [0.0] * dim
+    for feature in features:
+        digest = hashlib.md5(feature.encode()).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeEmbeddingModel:
+    """Mimics vertexai TextEmbeddingModel.get_embeddings."""
+
+    def __init__(self, dim=256, latency_ms=0.0, jitter_ms=0.0, seed=0):
+        self.dim = dim
+        self.latency = _Latency(latency_ms, jitter_ms, seed)
+        self.calls = 0
+
+    def get_embeddings(self, texts, **kwargs):
+        self.calls += 1
+        self.latency.wait()
+        return [SimpleNamespace(values=embed_text(text, self.dim)) for text in texts]
+
+
+class FakeGenai:
+    """Stands in for the configured `google.generativeai` module (no context caching)."""
+
+    def __init__(self, model, embedder):
+        self._model = model
+        self._embedder = embedder
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, name=None, **kwargs):
+        return self._model
+
+    def embed_content(self, model=None, content="", **kwargs):
+        self._embedder.latency.wait()
+        return {"embedding": embed_text(content, self._embedder.dim)}
+
+# === Fake MongoDB ===
+
+_MISSING = object()
+
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _match_condition(value, condition):
+    if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if (value is not _MISSING) != bool(arg):
+                    return False
+            elif op == "$ne":
+                if value is not _MISSING and value == arg:
+                    return False
+            elif op == "$in":
+                values = value if isinstance(value, list) else [value]
+                if not any(v in arg for v in values):
+                    return False
+            elif op == "$nin":
+                values = value if isinstance(value, list) else [value]
+                if any(v in arg for v in values):
+                    return False
+            elif op == "$all":
+                if not isinstance(value, list) or not all(a in value for a in arg):
+                    return False
+            elif op == "$regex":
+                flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+                if not isinstance(value, str) or not re.search(arg, value, flags):
+                    return False
+            elif op == "$options":
+                continue
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is _MISSING or value is None:
+                    return False
+                if op == "$gt" and not value > arg: return False
+                if op == "$gte" and not value >= arg: return False
+                if op == "$lt" and not value < arg: return False
+                if op == "$lte" and not value <= arg: return False
+            else:
+                raise NotImplementedError(f"Fake Mongo does not support {op}")
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value is not _MISSING and value == condition
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif not _match_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        result = {}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for path in include:
+            value = _get_path(doc, path)
+            if value is not _MISSING:
+                _set_path(result, path, deepcopy(value))
+        return result
+    result = deepcopy(doc)
+    for path, flag in projection.items():
+        if not flag:
+            _unset_path(result, path)
+    return result
+
+
+def _apply_update(doc, update, inserting=False):
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            for path, value in fields.items():
+                _set_path(doc, path, deepcopy(value))
+        elif op == "$setOnInsert":
+            continue
+        elif op == "$inc":
+            for path, amount in fields.items():
+                current = _get_path(doc, path)
+                _set_path(doc, path, (0 if current is _MISSING else current) + amount)
+        elif op == "$unset":
+            for path in fields:
+                _unset_path(doc, path)
+        elif op == "$push":
+            for path, value in fields.items():
+                current = _get_path(doc, path)
+                _set_path(doc, path, ([] if current is _MISSING else current) + [deepcopy(value)])
+        else:
+            raise NotImplementedError(f"Fake Mongo does not support {op}")
+
+
+def _cosine(a, b):
+    dot = sum(map(operator.mul, a, b))
+    na = math.sqrt(sum(map(operator.mul, a, a))) or 1.0
+    nb = math.sqrt(sum(map(operator.mul, b, b))) or 1.0
+    return dot / (na * nb)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for path, order in reversed(keys):
+            self._docs.sort(key=lambda d: (_get_path(d, path) is _MISSING, _get_path(d, path)), reverse=order < 0)
+        return self
+
+    def skip(self, n):
+        self._docs = self._docs[n:]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def limit(self, n):
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self._docs)
+
+    def to_list(self, length=None):
+        return list(self._docs[:length] if length else self._docs)
+
+
+class _Result(SimpleNamespace):
+    pass
+
+
+class FakeConnectionPool:
+    """Bounded like pymongo's pool: each round trip holds one of `size` connections."""
+
+    def __init__(self, size):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {"checkouts": 0, "checked_out": 0, "max_checked_out": 0,
+                       "checkout_wait_ms_total": 0.0, "checkout_wait_ms_max": 0.0}
+
+    def checkout(self):
+        started = time.perf_counter()
+        self._slots.acquire()
+        wait_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["checked_out"] += 1
+            self._stats["max_checked_out"] = max(self._stats["max_checked_out"], self._stats["checked_out"])
+            self._stats["checkout_wait_ms_total"] += wait_ms
+            self._stats["checkout_wait_ms_max"] = max(self._stats["checkout_wait_ms_max"], wait_ms)
+
+    def checkin(self):
+        with self._lock:
+            self._stats["checked_out"] -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["max_pool_size"] = self.size
+        stats["checkout_wait_ms_total"] = round(stats["checkout_wait_ms_total"], 1)
+        stats["checkout_wait_ms_max"] = round(stats["checkout_wait_ms_max"], 1)
+        return stats
+
+
+class FakeCollection:
+    """
+    In-memory collection covering the pymongo calls the backend makes, including an
+    exact (brute-force) `$vectorSearch` aggregation stage. Every call counts as one
+    round trip on the current trace span and holds a pool connection for `latency_ms`.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name, latency_ms=0.0, pool=None, database=None):
+        self.name = name
+        self.database = database
+        self.latency = _Latency(latency_ms)
+        self.pool = pool
+        self._docs = []
+        self._lock = threading.RLock()
+
+    def _round_trip(self):
+        incr("mongo_round_trips")
+        if self.pool is None:
+            self.latency.wait()
+            return
+        self.pool.checkout()
+        try:
+            self.latency.wait()
+        finally:
+            self.pool.checkin()
+
+    def _find_docs(self, query):
+        return [d for d in self._docs if matches(d, query)]
+
+    # --- Reads ---
+
+    def find(self, query=None, projection=None, **kwargs):
+        self._round_trip()
+        with self._lock:
+            return FakeCursor([_project(d, projection) for d in self._find_docs(query)])
+
+    def find_one(self, query=None, projection=None, **kwargs):
+        self._round_trip()
+        with self._lock:
+            for doc in self._docs:
+                if matches(doc, query):
+                    return _project(doc, projection)
+        return None
+
+    def count_documents(self, query=None, **kwargs):
+        self._round_trip()
+        with self._lock:
+            return len(self._find_docs(query))
+
+    def distinct(self, key, query=None):
+        self._round_trip()
+        with self._lock:
+            values = []
+            for doc in self._find_docs(query):
+                value = _get_path(doc, key)
+                if value is not _MISSING and value not in values:
+                    values.append(value)
+            return values
+
+    def aggregate(self, pipeline, **kwargs):
+        self._round_trip()
+        with self._lock:
+            docs = list(self._docs)
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == "$vectorSearch":
+                docs = self._vector_search(docs, arg)
+            elif op == "$match":
+                docs = [d for d in docs if matches(d, arg)]
+            elif op == "$project":
+                docs = [self._project_stage(d, arg) for d in docs]
+            elif op == "$limit":
+                docs = docs[:arg]
+            elif op == "$sort":
+                docs = FakeCursor(docs).sort(list(arg.items())).to_list()
+            else:
+                raise NotImplementedError(f"Fake Mongo does not support {op}")
+        return iter([deepcopy(d) for d in docs])
+
+    def _vector_search(self, docs, spec):
+        query = spec["queryVector"]
+        path = spec["path"]
+        candidates = [d for d in docs if isinstance(_get_path(d, path), list)]
+        if "filter" in spec:
+            candidates = [d for d in candidates if matches(d, spec["filter"])]
+        # Atlas reports cosine similarity rescaled to [0, 1]
+        scored = [{**doc, "__vector_score": (1 + _cosine(query, _get_path(doc, path))) / 2} for doc in candidates]
+        scored.sort(key=lambda d: -d["__vector_score"])
+        return scored[:spec.get("limit", len(scored))]
+
+    def _project_stage(self, doc, spec):
+        result = {}
+        if spec.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        excluded = [k for k, v in spec.items() if v == 0 and k != "_id"]
+        if excluded:
+            result = {k: v for k, v in doc.items() if k not in excluded and k != "__vector_score"}
+        for key, value in spec.items():
+            if key == "_id" or value == 0:
+                continue
+            if isinstance(value, dict) and value.get("$meta") == "vectorSearchScore":
+                result[key] = doc.get("__vector_score", 0.0)
+            elif isinstance(value, str) and value.startswith("$"):
+                found = _get_path(doc, value[1:])
+                if found is not _MISSING:
+                    result[key] = found
+            else:
+                found = _get_path(doc, key)
+                if found is not _MISSING:
+                    _set_path(result, key, found)
+        return result
+
+    # --- Writes ---
+
+    def insert_one(self, doc):
+        self._round_trip()
+        with self._lock:
+            doc.setdefault("_id", next(self._ids))
+            self._docs.append(deepcopy(doc))
+        return _Result(inserted_id=doc["_id"])
+
+    def insert_many(self, docs):
+        self._round_trip()
+        ids = []
+        with self._lock:
+            for doc in docs:
+                doc.setdefault("_id", next(self._ids))
+                self._docs.append(deepcopy(doc))
+                ids.append(doc["_id"])
+        return _Result(inserted_ids=ids)
+
+    def _update(self, query, update, upsert, many):
+        with self._lock:
+            targets = self._find_docs(query)
+            if not many:
+                targets = targets[:1]
+            for doc in targets:
+                _apply_update(doc, update)
+            if targets or not upsert:
+                return _Result(matched_count=len(targets), modified_count=len(targets), upserted_id=None)
+            doc = {k: deepcopy(v) for k, v in (query or {}).items() if not k.startswith("$") and not isinstance(v, dict)}
+            _apply_update(doc, update, inserting=True)
+            doc.setdefault("_id", next(self._ids))
+            self._docs.append(doc)
+            return _Result(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+
+    def update_one(self, query, update, upsert=False, **kwargs):
+        self._round_trip()
+        return self._update(query, update, upsert, many=False)
+
+    def update_many(self, query, update, upsert=False, **kwargs):
+        self._round_trip()
+        return self._update(query, update, upsert, many=True)
+
+    def replace_one(self, query, replacement, upsert=False, **kwargs):
+        self._round_trip()
+        return self._replace(query, replacement, upsert)
+
+    def _replace(self, query, replacement, upsert):
+        with self._lock:
+            for i, doc in enumerate(self._docs):
+                if matches(doc, query):
+                    self._docs[i] = {"_id": doc["_id"], **deepcopy(replacement)}
+                    return _Result(matched_count=1, modified_count=1, upserted_id=None)
+            if upsert:
+                doc = {"_id": next(self._ids), **deepcopy(replacement)}
+                self._docs.append(doc)
+                return _Result(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return _Result(matched_count=0, modified_count=0, upserted_id=None)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        """pymongo UpdateOne / UpdateMany / ReplaceOne / InsertOne / DeleteOne / DeleteMany in one round trip."""
+        self._round_trip()
+        counts = {"inserted_count": 0, "matched_count": 0, "modified_count": 0, "deleted_count": 0, "upserted_count": 0}
+        with self._lock:
+            for op in requests:
+                kind = type(op).__name__
+                if kind in ("UpdateOne", "UpdateMany"):
+                    result = self._update(op._filter, op._doc, getattr(op, "_upsert", False), many=kind == "UpdateMany")
+                elif kind == "ReplaceOne":
+                    result = self._replace(op._filter, op._doc, getattr(op, "_upsert", False))
+                elif kind == "InsertOne":
+                    doc = deepcopy(op._doc)
+                    doc.setdefault("_id", next(self._ids))
+                    self._docs.append(doc)
+                    counts["inserted_count"] += 1
+                    continue
+                elif kind in ("DeleteOne", "DeleteMany"):
+                    before = len(self._docs)
+                    targets = self._find_docs(op._filter)
+                    targets = targets if kind == "DeleteMany" else targets[:1]
+                    self._docs = [d for d in self._docs if not any(d is t for t in targets)]
+                    counts["deleted_count"] += before - len(self._docs)
+                    continue
+                else:
+                    raise NotImplementedError(f"Fake Mongo does not support {kind}")
+                counts["matched_count"] += result.matched_count
+                counts["modified_count"] += result.modified_count
+                counts["upserted_count"] += result.upserted_id is not None
+        return _Result(**counts)
+
+    def delete_many(self, query):
+        self._round_trip()
+        with self._lock:
+            before = len(self._docs)
+            self._docs = [d for d in self._docs if not matches(d, query)]
+            return _Result(deleted_count=before - len(self._docs))
+
+    def delete_one(self, query):
+        self._round_trip()
+        with self._lock:
+            for i, doc in enumerate(self._docs):
+                if matches(doc, query):
+                    del self._docs[i]
+                    return _Result(deleted_count=1)
+        return _Result(deleted_count=0)
+
+    def create_index(self, *args, **kwargs):
+        return "fake_index"
+
+
+class FakeDatabase:
+    _names = itertools.count(1)
+
+    def __init__(self, latency_ms=0.0, pool=None):
+        # Unique per instance, so in-process caches keyed on the name never mix two fakes
+        self.name = f"fake{next(self._names)}"
+        self.latency_ms = latency_ms
+        self.pool = pool
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(name, self.latency_ms, self.pool, self)
+            return self._collections[name]
+
+    def list_collection_names(self):
+        return list(self._collections)
+
+
+class FakeMongoClient:
+    """One shared in-memory database, whatever DB_NAME says."""
+
+    def __init__(self, latency_ms=0.0, max_pool_size=None):
+        self.pool = FakeConnectionPool(max_pool_size or services.MONGO_POOL_OPTIONS["maxPoolSize"])
+        self.db = FakeDatabase(latency_ms, self.pool)
+
+    def __getitem__(self, name):
+        return self.db
+
+    def close(self):
+        pass
+
+# === Synthetic dataset ===
+
+def _profile_fields(rng, year):
+    """One year of indicators under the same flat keys the real chunk files use."""
+    y = year
+    fields = {
+        f"{y}.ease_of_doing_business.overall_score": rng.uniform(45, 90),
+        f"{y}.ease_of_doing_business.starting_business_score": rng.uniform(50, 98),
+        f"{y}.ease_of_doing_business.getting_electricity.score": rng.uniform(40, 99),
+        f"{y}.ease_of_doing_business.registering_property.score": rng.uniform(40, 95),
+        f"{y}.ease_of_doing_business.getting_credit.score": rng.uniform(30, 95),
+        f"{y}.ease_of_doing_business.protecting_minority_investors.score": rng.uniform(30, 90),
+        f"{y}.ease_of_doing_business.paying_taxes.score": rng.uniform(40, 95),
+        f"{y}.ease_of_doing_business.trading_across_borders.score": rng.uniform(40, 100),
+        f"{y}.ease_of_doing_business.enforcing_contracts.score": rng.uniform(35, 85),
+        f"{y}.ease_of_doing_business.resolving_insolvency.score": rng.uniform(20, 95),
+        f"{y}.macroeconomic_indicators.gdp_current_usd_billions": rng.uniform(10, 3000),
+        f"{y}.macroeconomic_indicators.gdp_growth_percent": rng.uniform(-3, 9),
+        f"{y}.macroeconomic_indicators.inflation_rate_percent": rng.uniform(0, 25),
+        f"{y}.macroeconomic_indicators.unemployment_rate_percent": rng.uniform(2, 20),
+        f"{y}.macroeconomic_indicators.current_account_balance_percent_gdp": rng.uniform(-8, 10),
+        f"{y}.macroeconomic_indicators.public_debt_percent_of_gdp": rng.uniform(20, 130),
+        f"{y}.macroeconomic_indicators.exchange_rate_vs_usd": rng.uniform(0.5, 300),
+        f"{y}.digital_connectivity.gsma_connectivity_index": rng.uniform(30, 95),
+        f"{y}.digital_connectivity.mobile_broadband_coverage_percent": rng.uniform(50, 100),
+        f"{y}.digital_connectivity.mobile_ownership_percent": rng.uniform(40, 99),
+        f"{y}.digital_connectivity.connectivity.affordability.device_affordability_40pct_usd": rng.uniform(5, 90),
+        f"{y}.digital_connectivity.connectivity.affordability.tax_mobile_data_percent": rng.uniform(0, 30),
+        f"{y}.digital_connectivity.connectivity.affordability.tax_handsets_percent": rng.uniform(0, 40),
+        f"{y}.digital_connectivity.connectivity.affordability.sector_specific_taxes_percent": rng.uniform(0, 15),
+        f"{y}.digital_connectivity.connectivity.consumer_readiness.literacy_percent": rng.uniform(55, 100),
+        f"{y}.digital_connectivity.connectivity.content_and_services.e_government_score": rng.uniform(30, 98),
+        f"{y}.digital_connectivity.connectivity.content_and_services.social_media_penetration_percent": rng.uniform(20, 95),
+        f"{y}.digital_connectivity.connectivity.online_security.cybersecurity_index_score": rng.uniform(20, 100),
+        f"{y}.trade_profile.average_applied_tariff_percent": rng.uniform(0, 18),
+        f"{y}.trade_profile.binding_tariff_coverage_percent": rng.uniform(50, 100),
+        f"{y}.trade_profile.import_duties_on_capital_goods_percent": rng.uniform(0, 15),
+        f"{y}.trade_profile.import_duties_on_intermediate_goods_percent": rng.uniform(0, 15),
+        f"{y}.trade_profile.duty_free_import_share_percent": rng.uniform(10, 90),
+        f"{y}.trade_profile.number_of_distinct_duty_rates": float(rng.randint(3, 40)),
+        f"{y}.trade_profile.coefficient_of_tariff_variation": rng.uniform(50, 200),
+        f"{y}.foreign_direct_investment.fdi_net_inflows_usd_millions": rng.uniform(50, 80000),
+        f"{y}.foreign_direct_investment.fdi_inward_stock_usd_millions": rng.uniform(1000, 900000),
+    }
+    return {k: round(v, 2) for k, v in fields.items()}
+
+
+def seed_dataset(db, n_countries=50, dim=256, embedding_path="embedding", seed=0):
+    """
+    Fills country_profiles (3 chunks per country) and country_semantics (one embedded
+    summary per country and sector). Returns the country codes used.
+    """
+    codes = COUNTRY_CODES[:n_countries] + [f"X{i:02d}" for i in range(max(0, n_countries - len(COUNTRY_CODES)))]
+    profiles, semantics = db["country_profiles"], db["country_semantics"]
+    for code in codes:
+        rng = _rng(seed, code)
+        flat = {}
+        for year in YEARS:
+            flat.update(_profile_fields(rng, year))
+        keys = sorted(flat)
+        for i in range(3):
+            part = {k: flat[k] for k in keys[i::3]}
+            profiles._docs.append({"_id": next(FakeCollection._ids), "country_code": code,
+                                   "chunk_id": f"{code}_chunk{i + 1}", "chunk_data": part})
+        for sector in SECTORS:
+            summary = (f"{code} {sector} market: " +
+                       " ".join(FakeGenerativeModel()._sentences(_rng(seed, code, sector), sector, 5)))
+            semantics._docs.append({
+                "_id": next(FakeCollection._ids),
+                "country_code": code,
+                "sector": sector,
+                "summary": summary,
+                "key_indicators": {},
+                embedding_path: embed_text(summary, dim)
+            })
+    return codes
+
+# === Installation ===
+
+def install(llm_latency_ms=0.0, llm_jitter_ms=0.0, llm_chunk_ms=0.0, llm_failure_rate=0.0, llm_malformed_rate=0.0,
+            embed_latency_ms=0.0, mongo_latency_ms=0.0, mongo_pool_size=None, dim=256, n_countries=50, seed=0):
+    """
+    Registers the fakes with the service registry and seeds the in-memory database.
+    Call before the pipeline modules are first used; returns the installed fakes.
+    """
+    os.environ.setdefault("DB_NAME", "globallaunch_fake")
+    os.environ.setdefault("SEMANTIC_EMBEDDING", "embedding")
+    os.environ.setdefault("SEMANTIC_IDX", "fake_vector_index")
+    os.environ.setdefault("PERSIST_LLM_USAGE", "1")
+
+    model = FakeGenerativeModel(latency_ms=llm_latency_ms, jitter_ms=llm_jitter_ms, chunk_ms=llm_chunk_ms,
+                                failure_rate=llm_failure_rate, malformed_rate=llm_malformed_rate, seed=seed)
+    embedder = FakeEmbeddingModel(dim=dim, latency_ms=embed_latency_ms, seed=seed)
+    genai = FakeGenai(model, embedder)
+    client = FakeMongoClient(latency_ms=mongo_latency_ms, max_pool_size=mongo_pool_size)
+
+    services.reset()
+    services.override("mongo", client)
+    services.override("genai", genai)
+    services.override(f"embedding:{services.DEFAULT_EMBEDDING_MODEL}", embedder)
+    for key_env in ("GOOGLE_API_KEY", "GOOGLE_MAIN_API_KEY"):
+        services.override(f"gemini:{services.DEFAULT_GEMINI_MODEL}:{key_env}", model)
+
+    codes = seed_dataset(client.db, n_countries=n_countries, dim=dim,
+                         embedding_path=os.environ["SEMANTIC_EMBEDDING"], seed=seed)
+    return SimpleNamespace(model=model, embedder=embedder, genai=genai, client=client,
+                           db=client.db, country_codes=codes)
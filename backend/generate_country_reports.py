@@ -1,42 +1,35 @@
-import os
 import json
-import time
-import random
-from dotenv import load_dotenv
-from pymongo import MongoClient
-import google.generativeai as genai
+import hashlib
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from services import get_collection
+from tracing import bind, set_attrs, span, traced
+from llm import StructuredOutputError, generate_json
+from schemas import CHUNK_INSIGHTS_SCHEMA, INSIGHT_KEYS, REPORT_SCHEMA
+from packing import data_format, estimate_tokens, flatten_chunks, pack_fields, render
+from usage import TokenBudgetExceeded, budget_exhausted
 
 # === Environment & API Setup ===
-
-load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel("gemini-1.5-pro")
-
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client[os.getenv("DB_NAME")]
-profiles_col = db["country_profiles"]
-reports_col = db["country_reports"]
+# Gemini and MongoDB are built lazily by the shared registry (see services.py)
 
 # === Prompt Templates ===
 
-# Prompt used to analyze a single chunk of structured data and return sector-relevant insights.
+# Prompt used to analyze a pack of structured data and return sector-relevant insights.
 CHUNK_PROMPT = """
 You are GlobalLaunch AI, a strategic market advisor helping startups assess country-specific expansion opportunities.
 
 Below is a structured chunk of economic, digital, and regulatory data for the country {country_code}, relevant to sectors: {sectors}.
+{data_format}
 
 Your task is to extract insights and trend interpretations that rely primarily on **top-level numerical signals**.
 
-Focus on fields with exactly two dots in the key — for example:
-- `2023.digital_connectivity.mobile_ownership_percent`
-- `2018.ease_of_doing_business.getting_credit.score`
+Focus on top-level fields rather than deeply nested ones — for example:
+- `dc.mobile_ownership_percent`
+- `eodb.getting_credit.score`
 -  using `.details.` or any deeper keys in final output.
 
 However, if **no usable data is found for a category**, you must still write a general but realistic insight based on the country's profile. Stay sector-relevant and strategic even without numbers.
 
-Return your output as strict minified JSON. Do **not** use markdown, do **not** prefix with ```json, and do **not** format it as YAML or list-based text. Just valid machine-parseable JSON.
-Your output must start with `{{` and contain only these five keys:
+Return a JSON object with only these five keys:
 - "business_environment"
 - "infrastructure_and_digital"
 - "economic_and_trade_outlook"
@@ -91,78 +84,33 @@ Emphasize percentage shifts, scores, and changes across years.
 
 # === Utility Functions ===
 
-def safe_generate(prompt, max_retries=5):
-    """Robust Gemini API wrapper with retries and exponential backoff."""
-    for attempt in range(max_retries):
-        try:
-            return model.generate_content(prompt).text.strip()
-        except Exception as e:
-            wait = (2 ** attempt) + random.uniform(0.5, 3)
-            print(f"Gemini error: {e} — retrying in {wait:.1f}s...")
-            time.sleep(wait)
-    raise RuntimeError("Gemini failed after max retries.")
-
-def parse_gemini_json(text):
-    """Clean and parse a JSON-like string response from Gemini."""
-    try:
-        text = text.strip().strip("`")
-        if text.lower().startswith("json"):
-            text = text[4:].strip()
-        if not text.startswith("{"):
-            text = "{" + text
-        if not text.endswith("}"):
-            text += "}"
-
-        parsed = json.loads(text)
-
-        # Ensure required keys are present
-        required_keys = [
-            "business_environment",
-            "infrastructure_and_digital",
-            "economic_and_trade_outlook",
-            "regulatory_and_risk",
-            "entry_considerations",
-        ]
-        for key in required_keys:
-            if key not in parsed:
-                raise ValueError(f"Missing key: {key}")
-
-        return parsed
-
-    except Exception as e:
-        print("Failed to parse Gemini JSON:")
-        print(text[:500])
-        raise RuntimeError(f"JSONParseError: {e}")
+def safe_generate_json(prompt, schema, max_retries=5, reasks=1):
+    """Gemini call in JSON mode: retries, schema validation and per-field repair (see llm.py)."""
+    return generate_json(prompt, schema, max_retries=max_retries, reasks=reasks)
 
+@traced("process_chunk")
 def process_chunk(chunk_data, country_code, sectors):
-    """Generate insights for a single chunk of profile data."""
+    """Generate insights for one pack of profile fields (see packing.py)."""
     try:
-        trimmed_data = json.dumps(chunk_data)[:11000]  # Truncate oversized chunks
+        packed = render(chunk_data)
+        set_attrs(fields=len(chunk_data), data_tokens_est=estimate_tokens(packed))
         prompt = CHUNK_PROMPT.format(
             country_code=country_code,
             sectors=", ".join(sectors),
-            chunk_data=trimmed_data
+            data_format=data_format(),
+            chunk_data=packed
         )
-        response = safe_generate(prompt)
-
-        if response.startswith("```json"):
-            response = response.strip("` \n")[len("json"):].strip()
-
-        return json.loads(response)
+        return safe_generate_json(prompt, CHUNK_INSIGHTS_SCHEMA)
 
+    except TokenBudgetExceeded:
+        raise
     except Exception as e:
         print(f"Chunk error: {e}")
         return None
 
 def merge_structured_insights(insights):
     """Merge multiple chunk-level insights into a unified structure."""
-    merged = {
-        "business_environment": [],
-        "infrastructure_and_digital": [],
-        "economic_and_trade_outlook": [],
-        "regulatory_and_risk": [],
-        "entry_considerations": []
-    }
+    merged = {key: [] for key in INSIGHT_KEYS}
     for insight in insights:
         for key in merged:
             merged[key].extend(insight.get(key, []))
@@ -170,48 +118,62 @@ def merge_structured_insights(insights):
 
 # === Main Pipeline Function ===
 
-def generate_final_reports(startup_desc: str, shortlist: list):
+@traced("country_report")
+def generate_country_report(startup_desc: str, item: dict, profiles_col, reports_col):
     """
-    For each country in the shortlist:
-    - Load chunked profile data
-    - Generate insights from chunks
-    - Merge and summarize into a final report
-    - Store in MongoDB
+    Generates (or reuses from cache) the report for one shortlisted country. Returns the
+    stored report's version, or None when no report was saved (skipped or failed).
     """
-    for item in shortlist:
-        country_code = item["country_code"]
-        sectors = item["matched_sectors"]
-
-        # Check cache to avoid reprocessing
-        cached = reports_col.find_one({
-            "country_code": country_code,
-            "matched_sectors": {"$all": sectors},
-            "report_generated": True
-        })
-        if cached:
-            print(f"Skipping (cached): {country_code}")
-            continue
-
-        # Load chunked profile data for the country
-        chunks = list(profiles_col.find({"country_code": country_code}))
-        if not chunks:
-            print(f"Skipping {country_code} — no profile chunks found.")
-            continue
-
-        # Run chunk processing in parallel using threads
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = [
-                executor.submit(
-                    process_chunk,
-                    chunk.get("chunk_data", {}),
-                    country_code,
-                    sectors
-                )
-                for chunk in chunks
-            ]
+    country_code = item["country_code"]
+    sectors = item["matched_sectors"]
+    set_attrs(country_code=country_code)
+
+    # Check cache to avoid reprocessing; a report written for another idea does not count
+    cached = reports_col.find_one({
+        "country_code": country_code,
+        "matched_sectors": {"$all": sectors},
+        "startup_desc": startup_desc,
+        "report_generated": True
+    }, {"_id": 0, "report_version": 1})
+    set_attrs(cache_hit=bool(cached))
+    if cached:
+        print(f"Skipping (cached): {country_code}")
+        return cached.get("report_version", "legacy")
+
+    # Degrade gracefully once the request's token budget is spent: keep the shortlist, skip new reports
+    if budget_exhausted():
+        print(f"Skipping {country_code} — token budget exhausted.")
+        set_attrs(budget_skipped=True)
+        return
+
+    # Load chunked profile data for the country
+    chunks = list(profiles_col.find({"country_code": country_code}))
+    if not chunks:
+        print(f"Skipping {country_code} — no profile chunks found.")
+        return
+
+    # Repack all chunk fields by sector relevance into the fewest prompts under the token budget
+    packs, pack_stats = pack_fields(flatten_chunks(chunks), sectors)
+    set_attrs(chunks=len(chunks), **pack_stats)
+
+    # Run pack processing in parallel using threads (bound to this trace); once the budget
+    # runs out mid-report, queued packs are cancelled and no partial report is written
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [
+            executor.submit(bind(process_chunk), pack, country_code, sectors)
+            for pack in packs
+        ]
+        try:
             all_insights = [r for r in (f.result() for f in as_completed(futures)) if r]
+        except TokenBudgetExceeded:
+            for future in futures:
+                future.cancel()
+            print(f"Skipping {country_code} — token budget exhausted mid-report.")
+            set_attrs(budget_skipped=True)
+            return
 
-        try:
+    try:
+        with span("report_synthesis", country_code=country_code):
             # Combine chunk-level insights
             merged = merge_structured_insights(all_insights)
             final_insights = json.dumps(merged, indent=2)
@@ -224,28 +186,52 @@ def generate_final_reports(startup_desc: str, shortlist: list):
                 startup_desc=startup_desc
             )
 
-            response = safe_generate(final_prompt)
-
-            if response.startswith("```json"):
-                response = response.strip("` ").split("\n", 1)[1].strip()
-
-            # Parse and store the final report in MongoDB
-            parsed = parse_gemini_json(response)
-            reports_col.update_one(
-                {"country_code": country_code},
-                {"$set": {
-                    "country_code": country_code,
-                    "matched_sectors": sectors,
-                    "startup_desc": startup_desc,
-                    "report_generated": True,
-                    **parsed
-                }},
-                upsert=True
-            )
-            print(f"Report saved: {country_code}")
-
-        except Exception as e:
-            print(f"Failed {country_code} — {e}")
-
+            # Schema-checked report; only invalid fields are re-asked, never the whole report
+            parsed = safe_generate_json(final_prompt, REPORT_SCHEMA, reasks=2)
+
+        # Content hash lets downstream caches (e.g. chatbot answers) notice regenerated reports
+        report_version = hashlib.sha256(
+            json.dumps(parsed, sort_keys=True).encode()
+        ).hexdigest()[:12]
+        reports_col.update_one(
+            {"country_code": country_code},
+            {"$set": {
+                "country_code": country_code,
+                "matched_sectors": sectors,
+                "startup_desc": startup_desc,
+                "report_generated": True,
+                "report_version": report_version,
+                **parsed
+            }},
+            upsert=True
+        )
+        print(f"Report saved: {country_code}")
+        return report_version
+
+    except TokenBudgetExceeded:
+        print(f"Skipping {country_code} — token budget exhausted before synthesis.")
+        set_attrs(budget_skipped=True)
+    except StructuredOutputError as e:
+        print(f"Failed {country_code} — report still invalid after repair: {e}")
+    except Exception as e:
+        print(f"Failed {country_code} — {e}")
 
+def generate_final_reports(startup_desc: str, shortlist: list, profiles_col=None, reports_col=None):
+    """
+    For each country in the shortlist:
+    - Load chunked profile data
+    - Generate insights from chunks
+    - Merge and summarize into a final report
+    - Store in MongoDB
+    Returns {country_code: report_version} for the countries that have a report for this idea.
+    Collections default to the shared client; callers may inject their own handles.
+    """
+    profiles_col = profiles_col if profiles_col is not None else get_collection("country_profiles")
+    reports_col = reports_col if reports_col is not None else get_collection("country_reports")
 
+    versions = {}
+    for item in shortlist:
+        version = generate_country_report(startup_desc, item, profiles_col, reports_col)
+        if version:
+            versions[item["country_code"]] = version
+    return versions
@@ -1,23 +1,22 @@
 import os
 import json
-import time
-import google.generativeai as genai
-from dotenv import load_dotenv
+import hashlib
+import argparse
 from pathlib import Path
-from pymongo import MongoClient
+from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pymongo import UpdateOne
+from services import get_collection, get_gemini_model
+from llm import StructuredOutputError, generate_json
+from schemas import SEMANTIC_PROFILE_SCHEMA, multi_sector_profile_schema, top_level_field
+from packing import data_format, pack_fields, render
 
 # === Setup ===
-load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_MAIN_API_KEY"))
-model = genai.GenerativeModel("gemini-1.5-pro")
-
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client[os.getenv("DB_NAME")]
-semantics_collection = db["country_semantics"]
+# Offline job — uses the secondary Gemini key; clients come from the shared registry
+API_KEY_ENV = "GOOGLE_MAIN_API_KEY"
 
 CHUNK_DIR = Path("data/chunked_country_jsons")
 OUTPUT_DIR = Path("data/country_semantics")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 SECTORS = [
     "fintech", "healthtech", "edtech", "ecommerce", "cleantech",
@@ -25,14 +24,23 @@ SECTORS = [
     "agritech", "mobility", "proptech", "govtech", "biotech"
 ]
 
-START_COUNTRY = "AGO"
-START_SECTOR = "fintech"
+# Profiles generated concurrently and finished profiles per bulk upsert
+SEMANTICS_WORKERS = int(os.getenv("SEMANTICS_WORKERS", 8))
+WRITE_BATCH = int(os.getenv("SEMANTICS_WRITE_BATCH", 30))
+
+# Multi-sector mode: one prompt per (country, pack) covers up to SECTORS_PER_PROMPT sectors.
+# Summaries are kept shorter there so all of them fit in one response's output tokens.
+MULTI_SECTOR = os.getenv("SEMANTICS_MULTI_SECTOR", "0") == "1"
+SECTORS_PER_PROMPT = int(os.getenv("SECTORS_PER_PROMPT", 15))
+SUMMARY_MAX_CHARS = 3000
+MULTI_SECTOR_SUMMARY_MAX_CHARS = 1000
 
 # === Prompt ===
 CHUNK_PROMPT_TEMPLATE = """
 You are a global business analyst creating country-level investment insights.
 
 Given the following structured data for country: {country_code} and sector: {sector}, generate a concise, sector-specific profile using ONLY the provided data.
+{data_format}
 
   Your goal:
 - Describe the country's strengths, risks, and trends that affect companies in the "{sector}" space.
@@ -40,45 +48,117 @@ Given the following structured data for country: {country_code} and sector: {sec
 - Link data points explicitly to sector relevance. For example, for healthtech, mention internet access, regulatory transparency, medical supply chain reliability, etc.
 - Keep it focused, realistic, and grounded in data — do not speculate beyond what's present.
 
-  Return JSON like:
-{{
-  "summary": "...",  # ≤3000 chars
-  "indicators": {{ ... }}
-}}
+  Return a JSON object with:
+- "summary": the profile text (at most 3000 characters)
+- "indicators": a list of {{"name": ..., "value": ...}} pairs for the key indicators you cite
+
+  Chunked Country Data:
+{chunk_data}
+"""
+
+# Same data, every requested sector's lens in one call
+MULTI_SECTOR_PROMPT_TEMPLATE = """
+You are a global business analyst creating country-level investment insights.
+
+Given the following structured data for country: {country_code}, generate a concise profile for EACH of these sectors, using ONLY the provided data: {sectors}.
+{data_format}
+
+  For every sector:
+- Describe the country's strengths, risks, and trends that affect companies in that sector.
+- Include concrete numerical indicators (e.g. 5G %, inflation, FDI, business scores).
+- Link data points explicitly to that sector's needs. For example, for healthtech, mention internet access, regulatory transparency, medical supply chain reliability, etc.
+- Keep it focused, realistic, and grounded in data — do not speculate beyond what's present.
+
+  Return a JSON object keyed by sector name (exactly the sectors listed above). Each value has:
+- "summary": the profile text (at most {max_chars} characters)
+- "indicators": a list of {{"name": ..., "value": ...}} pairs for the key indicators you cite
 
   Chunked Country Data:
 {chunk_data}
 """
 
+# Changing a prompt (or its data encoding) marks every finished profile as outdated
+PROMPT_VERSION = hashlib.sha256(
+    (CHUNK_PROMPT_TEMPLATE + MULTI_SECTOR_PROMPT_TEMPLATE + data_format()).encode("utf-8")
+).hexdigest()[:8]
+
 # === Prompt + Parse ===
 def prompt_chunk(country_code, sector, chunk_data):
     try:
-        trimmed_data = json.dumps(chunk_data)[:11000]
         prompt = CHUNK_PROMPT_TEMPLATE.format(
             country_code=country_code,
             sector=sector,
-            chunk_data=trimmed_data
+            data_format=data_format(),
+            chunk_data=render(chunk_data)
+        )
+        result = generate_json(
+            prompt, SEMANTIC_PROFILE_SCHEMA,
+            gen_model=get_gemini_model(api_key_env=API_KEY_ENV), max_retries=3
         )
-        response = model.generate_content(prompt).text.strip()
+        return finish_profile(result, SUMMARY_MAX_CHARS)
 
-        if response.startswith("```json"):
-            response = response.strip("` \n")
-            response = response[len("json"):].strip()
+    except Exception as e:
+        print(f"Exception while generating semantic profile: {e}")
+        return {"summary": "", "indicators": {}, "error": str(e)}
 
-        result = json.loads(response)
+def prompt_sectors(country_code, sectors, chunk_data):
+    """
+    One call for several sectors; returns {sector: profile}. Only failing sectors are re-asked,
+    and when re-asking runs out only the sectors still invalid are marked failed.
+    """
+    try:
+        prompt = MULTI_SECTOR_PROMPT_TEMPLATE.format(
+            country_code=country_code,
+            sectors=", ".join(sectors),
+            max_chars=MULTI_SECTOR_SUMMARY_MAX_CHARS,
+            data_format=data_format(),
+            chunk_data=render(chunk_data)
+        )
+        invalid = {}
+        try:
+            result = generate_json(
+                prompt, multi_sector_profile_schema(sectors),
+                gen_model=get_gemini_model(api_key_env=API_KEY_ENV), max_retries=3
+            )
+        except StructuredOutputError as e:
+            if not isinstance(e.value, dict):
+                raise
+            result = e.value
+            for path, message in e.errors:
+                invalid.setdefault(top_level_field(path), f"{path}: {message}")
+            print(f"Semantic profiles for {country_code} still invalid: {', '.join(sorted(invalid))}")
+        return {
+            sector: {"summary": "", "indicators": {}, "error": invalid[sector]} if sector in invalid
+            else finish_profile(result[sector], MULTI_SECTOR_SUMMARY_MAX_CHARS)
+            for sector in sectors
+        }
 
-        # Ensure summary length limit
-        summary = result.get("summary", "")
-        if len(summary) > 3000:
-            summary = summary[:3000].rsplit(" ", 1)[0] + "..."
-            result["summary"] = summary
+    except Exception as e:
+        print(f"Exception while generating semantic profiles: {e}")
+        return {sector: {"summary": "", "indicators": {}, "error": str(e)} for sector in sectors}
 
-        return result
+def finish_profile(result, max_chars):
+    result["indicators"] = indicators_to_dict(result["indicators"])
 
-    except Exception as e:
-        print(f"Exception while parsing LLM output: {e}")
-        print("Raw response:\n", response if 'response' in locals() else 'No response')
-        return {"summary": "", "indicators": {}, "error": str(e)}
+    # Ensure summary length limit
+    summary = result.get("summary", "")
+    if len(summary) > max_chars:
+        summary = summary[:max_chars].rsplit(" ", 1)[0] + "..."
+        result["summary"] = summary
+
+    return result
+
+# Name/value pairs from the schema back into the {name: value} map stored in Mongo
+def indicators_to_dict(pairs):
+    indicators = {}
+    for pair in pairs:
+        value = pair["value"]
+        try:
+            value = float(value.replace(",", "").rstrip("%"))
+        except ValueError:
+            pass
+        indicators[pair["name"]] = value
+    return indicators
 
 # === Merge Chunks ===
 def merge_chunks(results):
@@ -89,35 +169,142 @@ def merge_chunks(results):
     return full_summary.strip(), indicators
 
 # === Core Function ===
-def generate_semantic_profile(country_code, sector, chunk_filepaths):
-    chunks = []
+def load_country_fields(chunk_filepaths):
+    fields = {}
     for chunk_path in sorted(chunk_filepaths):
         with open(chunk_path, "r", encoding="utf-8") as f:
-            chunk_data = json.load(f)
-        if not chunk_data:
-            chunks.append({"summary": "", "indicators": {}})
-            continue
-        result = prompt_chunk(country_code, sector, chunk_data)
-        chunks.append(result)
-        time.sleep(0.5)  # Gemini rate limit
+            fields.update(json.load(f) or {})
+    return fields
+
+def build_profile(country_code, sector, chunks):
     summary, indicators = merge_chunks(chunks)
     return {
         "sector": sector,
         "country_code": country_code,
         "summary": summary,
-        "key_indicators": indicators
+        "key_indicators": indicators,
+        "failed": not summary or any("error" in chunk for chunk in chunks)
     }
 
-# === Control Flow Helpers ===
-def should_resume(country_code, sector):
-    if country_code < START_COUNTRY:
-        return False
-    if country_code == START_COUNTRY and SECTORS.index(sector) < SECTORS.index(START_SECTOR):
-        return False
-    return True
+def generate_semantic_profile(country_code, sector, fields):
+    # All of the country's fields, repacked by relevance to this sector under the token budget
+    packs, _ = pack_fields(fields, [sector])
+    chunks = [prompt_chunk(country_code, sector, pack) for pack in packs]
+    return build_profile(country_code, sector, chunks)
+
+def generate_sector_profiles(country_code, sectors, fields):
+    """Multi-sector mode: one call per pack covers every sector; split back into per-sector profiles."""
+    packs, _ = pack_fields(fields, sectors)
+    results = [prompt_sectors(country_code, sectors, pack) for pack in packs]
+    return [build_profile(country_code, sector, [r[sector] for r in results]) for sector in sectors]
+
+# === Completion State ===
+# Each finished profile records the hash of the data and prompt it came from, so a rerun
+# skips it — and redoes it on its own once the chunk data or the prompt changes.
+def source_hash(fields):
+    payload = json.dumps(fields, sort_keys=True, default=str) + PROMPT_VERSION
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+def completed_work(semantics_col):
+    done = {}
+    for doc in semantics_col.find({"generation.source_hash": {"$exists": True}},
+                                  {"country_code": 1, "sector": 1, "generation.source_hash": 1}):
+        done[(doc["country_code"], doc["sector"])] = doc["generation"]["source_hash"]
+    return done
+
+def save_profiles(results, semantics_col, output_dir=OUTPUT_DIR):
+    """Writes a batch of finished profiles: JSON files in `output_dir` plus one bulk upsert."""
+    if results:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    ops = []
+    for semantic, fields_hash in results:
+        out_path = Path(output_dir) / f"{semantic['country_code']}_{semantic['sector']}.json"
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(semantic, f, indent=2)
+        ops.append(UpdateOne(
+            {"country_code": semantic["country_code"], "sector": semantic["sector"]},
+            {"$set": {
+                **semantic,
+                "generation": {
+                    "source_hash": fields_hash,
+                    "prompt_version": PROMPT_VERSION,
+                    "generated_at": datetime.now(timezone.utc),
+                }
+            }},
+            upsert=True
+        ))
+    if ops:
+        semantics_col.bulk_write(ops, ordered=False)
+        print(f"Updated MongoDB: {len(ops)} profiles")
+
+# === Runner ===
+def run_profiles(country_codes, load_fields, semantics_col=None, sectors=SECTORS,
+                 workers=SEMANTICS_WORKERS, write_batch=WRITE_BATCH, force=False,
+                 multi_sector=MULTI_SECTOR, sectors_per_prompt=SECTORS_PER_PROMPT, output_dir=OUTPUT_DIR):
+    """
+    Generates every missing or outdated (country, sector) profile on a worker pool.
+    `load_fields(country_code)` returns the country's merged chunk data; it is called
+    once per country. Gemini calls share the process rate limiter (LLM_REQUESTS_PER_MINUTE).
+    With `multi_sector`, each task asks for up to `sectors_per_prompt` sectors at once.
+    Each profile is also written as JSON to `output_dir`.
+    Returns {"generated", "skipped", "failed"}.
+    """
+    semantics_col = semantics_col if semantics_col is not None else get_collection("country_semantics")
+    done = {} if force else completed_work(semantics_col)
+    counts = {"generated": 0, "skipped": 0, "failed": 0}
+    finished, in_flight = [], set()
+
+    def collect(futures):
+        for future in futures:
+            semantics, fields_hash = future.result()
+            for semantic in semantics:
+                label = f"{semantic['country_code']} [{semantic['sector']}]"
+                if semantic.pop("failed"):
+                    counts["failed"] += 1
+                    print(f"Failed for {label}")
+                    continue
+                counts["generated"] += 1
+                print(f"Generated {label}")
+                finished.append((semantic, fields_hash))
+        if len(finished) >= write_batch:
+            save_profiles(finished, semantics_col, output_dir)
+            finished.clear()
+
+    def task(country_code, group, fields, fields_hash):
+        if multi_sector:
+            return generate_sector_profiles(country_code, group, fields), fields_hash
+        return [generate_semantic_profile(country_code, group[0], fields)], fields_hash
+
+    group_size = max(1, sectors_per_prompt) if multi_sector else 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for country_code in country_codes:
+            fields = load_fields(country_code)
+            fields_hash = source_hash(fields)
+            pending = [s for s in sectors if done.get((country_code, s)) != fields_hash]
+            counts["skipped"] += len(sectors) - len(pending)
+            for i in range(0, len(pending), group_size):
+                # Keep the queue bounded so chunk data is only held for countries in progress
+                while len(in_flight) >= workers * 2:
+                    completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(completed)
+                in_flight.add(pool.submit(task, country_code, pending[i:i + group_size], fields, fields_hash))
+        collect(wait(in_flight).done)
+
+    save_profiles(finished, semantics_col, output_dir)
+    print(f"Done: {counts['generated']} generated, {counts['skipped']} already current, {counts['failed']} failed")
+    return counts
 
 # === Main Pipeline ===
 def main():
+    parser = argparse.ArgumentParser(description="Generate sector profiles for every country in the chunk files")
+    parser.add_argument("--workers", type=int, default=SEMANTICS_WORKERS)
+    parser.add_argument("--countries", help="comma-separated ISO codes (default: all)")
+    parser.add_argument("--sectors", help="comma-separated sectors (default: all)")
+    parser.add_argument("--force", action="store_true", help="regenerate profiles that are already current")
+    parser.add_argument("--multi-sector", action="store_true", default=MULTI_SECTOR,
+                        help="one prompt per country pack for all sectors instead of one per sector")
+    args = parser.parse_args()
+
     print("Script Started")
 
     if not CHUNK_DIR.exists():
@@ -132,28 +319,19 @@ def main():
         country_code = parts[0]
         chunk_files_by_country.setdefault(country_code, []).append(file)
 
-    for country_code in sorted(chunk_files_by_country):
-        for sector in SECTORS:
-            if not should_resume(country_code, sector):
-                continue
-
-            print(f"\nProcessing {country_code} | Sector: {sector}")
-            semantic = generate_semantic_profile(country_code, sector, chunk_files_by_country[country_code])
-
-            if "summary" in semantic:
-                out_path = OUTPUT_DIR / f"{country_code}_{sector}.json"
-                with open(out_path, "w", encoding="utf-8") as f:
-                    json.dump(semantic, f, indent=2)
-                print(f"Saved to {out_path.name}")
-
-                semantics_collection.update_one(
-                    {"country_code": country_code, "sector": sector},
-                    {"$set": semantic},
-                    upsert=True
-                )
-                print(f"Updated MongoDB: {country_code} [{sector}]")
-            else:
-                print(f"Failed for {country_code} {sector}")
+    countries = sorted(chunk_files_by_country)
+    if args.countries:
+        countries = [c for c in countries if c in args.countries.split(",")]
+    sectors = args.sectors.split(",") if args.sectors else SECTORS
+
+    run_profiles(
+        countries,
+        lambda code: load_country_fields(chunk_files_by_country[code]),
+        sectors=sectors,
+        workers=args.workers,
+        force=args.force,
+        multi_sector=args.multi_sector
+    )
 
 if __name__ == "__main__":
     main()
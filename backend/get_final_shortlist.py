@@ -1,65 +1,72 @@
 # Final get_shortlist with Intelligent Heuristics + Caps + Boosting Logic
 
 import os
-import math
-from dotenv import load_dotenv
-from pymongo import MongoClient
+import heapq
+from collections import defaultdict
 from fallback_sector_detection import detect_sectors
-import vertexai
-from vertexai.preview.language_models import TextEmbeddingModel
-from google.oauth2 import service_account
+from services import get_collection, get_embedding_model
+from tracing import traced, set_attrs
+from hybrid_search import cosine_score, get_lexical_index, rrf_fuse
+from prefilter import get_sector_prefilter, unit
+from schemas import SECTORS
+from scoring import combine_score, compute_static_components, score_upper_bound
+from static_scores import get_static_scores
+from timeseries import trend_components
+
+# === Setup ===
+# Vertex AI (credentials, vertexai.init, embedding model) and MongoDB are built lazily
+# by the shared registry on first use — see services.py
 
-# === Setup: Load environment variables and initialize services ===
-load_dotenv()
-
-# Load Google Cloud credentials
-credentials = service_account.Credentials.from_service_account_file(os.getenv("GOOGLE_CLOUD_CREDENTIALS"))
+# Embedding and index paths for vector search
+PATH_NAME = os.getenv("SEMANTIC_EMBEDDING")
+INDEX_NAME = os.getenv("SEMANTIC_IDX")
 
-# Initialize Vertex AI with credentials and project settings
-vertexai.init(
-    project=os.getenv("PROJECT_ID"),
-    location="us-central1",
-    credentials=credentials
-)
+# ANN candidates: vector-only search, and the smaller pool used when BM25 adds recall
+NUM_CANDIDATES = int(os.getenv("VECTOR_NUM_CANDIDATES", 500))
+HYBRID_NUM_CANDIDATES = int(os.getenv("HYBRID_NUM_CANDIDATES", 200))
 
-# Load embedding model
-embedding_model = TextEmbeddingModel.from_pretrained("gemini-embedding-001")
+# Fuse BM25 over the sector summaries with vector search (see hybrid_search.py)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+LEXICAL_TOP_K = 50
 
-# Connect to MongoDB
-client = MongoClient(os.getenv("MONGODB_URI"))
-db = client[os.getenv("DB_NAME")]
-semantics_col = db["country_semantics"]
-profiles_col = db["country_profiles"]
+# Ideas with at least this many sector-specific terms skip the ANN call (0 = never skip)
+HYBRID_SKIP_ANN_MIN_TERMS = int(os.getenv("HYBRID_SKIP_ANN_MIN_TERMS", 3))
 
-# Embedding and index paths for vector search
-PATH_NAME = os.getenv("SEMANTIC_EMBEDDING")
-INDEX_NAME = os.getenv("SEMANTIC_IDX")
+# Find each sector's top N by branch-and-bound over exact scores (see prefilter.py)
+# instead of scoring every search hit; a country then ranks by its best sector
+SHORTLIST_PREFILTER = os.getenv("SHORTLIST_PREFILTER", "0") == "1"
 
-# Weights for each scoring dimension
-WEIGHTS = {
-    "vector": 0.4,
-    "eodb": 0.15,
-    "macro": 0.08,        # Slightly dampened macro
-    "digital": 0.17,      # Slightly boosted digital
-    "trade": 0.08,        # Slightly capped trade
-    "fdi": 0.12           # Slightly dampened FDI
-}
+# Margin for rounding in combine_score when comparing a bound to an exact score
+BOUND_SLACK = 1e-4
 
 # === Embedding function: converts user query into embedding ===
+@traced("embed_query")
 def embed_query(text):
-    return embedding_model.get_embeddings([text])[0].values
+    return get_embedding_model().get_embeddings([text])[0].values
+
+# $vectorSearch filters take equality only (no case-insensitive regex), so match the
+# sector as stored: the SECTORS spelling the semantics job writes
+def sector_filter(sector):
+    canonical = next((s for s in SECTORS if s.lower() == sector.lower()), sector)
+    return {"sector": {"$in": list(dict.fromkeys([canonical, sector]))}}
 
 # === Vector Search: searches semantic collection using query embedding and sector ===
-def vector_search_country_semantics(query_embedding, sector, top_k=200):
+# The sector is filtered inside the ANN search (the index declares `sector` as a filter
+# field), so all numCandidates come from the requested sector
+@traced("vector_search_country_semantics")
+def vector_search_country_semantics(query_embedding, sector, top_k=200, semantics_col=None,
+                                    num_candidates=NUM_CANDIDATES):
+    semantics_col = semantics_col if semantics_col is not None else get_collection("country_semantics")
+    set_attrs(sector=sector, num_candidates=num_candidates)
     return list(semantics_col.aggregate([
         {"$vectorSearch": {
             "index": INDEX_NAME,
             "path": PATH_NAME,
             "queryVector": query_embedding,
-            "numCandidates": 500,
-            "limit": top_k
+            "numCandidates": num_candidates,
+            "limit": min(top_k, num_candidates),
+            "filter": sector_filter(sector)
         }},
-        {"$match": {"sector": {"$regex": f"^{sector}$", "$options": "i"}}},
         {"$project": {
             "_id": 0,
             "country_code": 1,
@@ -67,131 +74,154 @@ def vector_search_country_semantics(query_embedding, sector, top_k=200):
         }}
     ]))
 
-# === Field Utilities ===
-
-# Extract latest value for a field that ends with the given suffix
-def get_latest_field(data, suffix):
-    values = [(k, v) for k, v in data.items() if k.endswith(suffix) and isinstance(v, (int, float))]
-    if not values:
-        return None
-    return sorted(values, key=lambda x: x[0], reverse=True)[0][1]
-
-# Flatten all chunks for a country into a single dict
-def get_country_profile_flat(country_code):
-    flat = {}
-    for chunk in profiles_col.find({"country_code": country_code}):
-        flat.update(chunk.get("chunk_data", {}))
-    return flat
-
-# Normalize a value to 0-1 range (optionally invert it)
-def safe_norm(val, max_val=100, invert=False):
-    if val is None:
-        return 0.0
-    norm = min(val / max_val, 1.0)
-    return 1.0 - norm if invert else norm
-
-# Apply log scaling to reduce skew of large values
-def log_scale(val):
-    return math.log(val + 1) / 10 if val and val > 0 else 0.0
-
-# === Scoring Function: Compute a final score using all indicators ===
-def compute_score(vec_score, flat, country_code=None):
-    valid_fields = 0
-    total_fields = 0
-
-    # Local utility to normalize and track field coverage
-    def norm_and_count(field, invert=False, max_val=100):
-        nonlocal valid_fields, total_fields
-        total_fields += 1
-        val = get_latest_field(flat, field)
-        if val is not None:
-            valid_fields += 1
-        return safe_norm(val, max_val=max_val, invert=invert)
-
-    # EODB (Ease of Doing Business) sub-scores
-    eodb_fields = [
-        "ease_of_doing_business.starting_business_score",
-        "ease_of_doing_business.getting_electricity.score",
-        "ease_of_doing_business.registering_property.score",
-        "ease_of_doing_business.getting_credit.score",
-        "ease_of_doing_business.protecting_minority_investors.score",
-        "ease_of_doing_business.paying_taxes.score",
-        "ease_of_doing_business.trading_across_borders.score",
-        "ease_of_doing_business.enforcing_contracts.score",
-        "ease_of_doing_business.resolving_insolvency.score",
-        "ease_of_doing_business.overall_score"
-    ]
-    eodb = sum(norm_and_count(f) for f in eodb_fields) / len(eodb_fields)
-
-    # Macroeconomic indicators
-    macro_fields = [
-        ("macroeconomic_indicators.gdp_growth_percent", False),
-        ("macroeconomic_indicators.inflation_rate_percent", True),
-        ("macroeconomic_indicators.unemployment_rate_percent", True),
-        ("macroeconomic_indicators.current_account_balance_percent_gdp", False),
-        ("macroeconomic_indicators.public_debt_percent_of_gdp", True)
-    ]
-    macro = sum(norm_and_count(f, invert=inv) for f, inv in macro_fields) / len(macro_fields)
-
-    # Digital infrastructure and readiness indicators
-    digital_fields = [
-        ("digital_connectivity.gsma_connectivity_index", False),
-        ("digital_connectivity.mobile_broadband_coverage_percent", False),
-        ("digital_connectivity.mobile_ownership_percent", False),
-        ("connectivity.affordability.device_affordability_40pct_usd", True),
-        ("connectivity.affordability.tax_mobile_data_percent", True),
-        ("connectivity.affordability.tax_handsets_percent", True),
-        ("connectivity.affordability.sector_specific_taxes_percent", True),
-        ("connectivity.consumer_readiness.literacy_percent", False),
-        ("connectivity.content_and_services.e_government_score", False),
-        ("connectivity.content_and_services.social_media_penetration_percent", False),
-        ("connectivity.online_security.cybersecurity_index_score", False)
-    ]
-    digital = sum(norm_and_count(f, invert=inv) for f, inv in digital_fields) / len(digital_fields)
-
-    # Trade indicators (capped to 0.8 to avoid overboosting)
-    trade_fields = [
-        ("trade_profile.average_applied_tariff_percent", True),
-        ("trade_profile.binding_tariff_coverage_percent", False),
-        ("trade_profile.import_duties_on_capital_goods_percent", True),
-        ("trade_profile.import_duties_on_intermediate_goods_percent", True),
-        ("trade_profile.duty_free_import_share_percent", False)
+# Exact vector scores for a few known countries (no ANN), on the same [0, 1] scale.
+# Uses the vector search's sector filter, so both paths see the same documents
+@traced("exact_vector_scores")
+def exact_vector_scores(query_embedding, sector, codes, semantics_col=None):
+    semantics_col = semantics_col if semantics_col is not None else get_collection("country_semantics")
+    if not codes:
+        return {}
+    docs = semantics_col.find(
+        {**sector_filter(sector), "country_code": {"$in": list(codes)}},
+        {"_id": 0, "country_code": 1, PATH_NAME: 1}
+    )
+    return {
+        doc["country_code"]: cosine_score(query_embedding, doc[PATH_NAME])
+        for doc in docs if isinstance(doc.get(PATH_NAME), list)
+    }
+
+# === Hybrid Search: BM25 + vector, fused by reciprocal rank ===
+@traced("hybrid_search_country_semantics")
+def hybrid_search_country_semantics(user_input, query_embedding, sector, top_k=200, semantics_col=None):
+    index = get_lexical_index(semantics_col)
+    lexical = index.search(user_input, sector, LEXICAL_TOP_K)
+    lexical_codes = [code for code, _ in lexical]
+    specific = index.specific_terms(user_input, sector)
+    skip_ann = bool(HYBRID_SKIP_ANN_MIN_TERMS and lexical and len(specific) >= HYBRID_SKIP_ANN_MIN_TERMS)
+    set_attrs(sector=sector, lexical_hits=len(lexical), specific_terms=len(specific), ann_skipped=skip_ann)
+
+    if skip_ann:
+        # Keyword-heavy idea: the lexical hits are the candidates; score them exactly
+        vector_scores = exact_vector_scores(query_embedding, sector, lexical_codes, semantics_col)
+    else:
+        vector_scores = {
+            doc["country_code"]: doc["score"]
+            for doc in vector_search_country_semantics(
+                query_embedding, sector, top_k, semantics_col, num_candidates=HYBRID_NUM_CANDIDATES
+            )
+        }
+        # Lexical hits the ANN pass missed still need a vector score for scoring
+        missing = [code for code in lexical_codes if code not in vector_scores]
+        vector_scores.update(exact_vector_scores(query_embedding, sector, missing, semantics_col))
+
+    vector_ranking = sorted(vector_scores, key=lambda code: -vector_scores[code])
+    fused = [code for code, _ in rrf_fuse(vector_ranking, lexical_codes) if code in vector_scores][:top_k]
+
+    # Fusion only picks the candidates; each is scored on its own vector similarity, which
+    # is the scale combine_score is tuned to
+    lexical_scores = dict(lexical)
+    return [
+        {
+            "country_code": code,
+            "score": vector_scores[code],
+            "vector_score": vector_scores[code],
+            "lexical_score": lexical_scores.get(code, 0.0)
+        }
+        for code in fused
     ]
-    trade_raw = sum(norm_and_count(f, invert=inv) for f, inv in trade_fields) / len(trade_fields)
-    trade = min(trade_raw, 0.8)
 
-    # FDI indicators (log-scaled)
-    fdi_vals = [
-        get_latest_field(flat, "foreign_direct_investment.fdi_net_inflows_usd_millions"),
-        get_latest_field(flat, "foreign_direct_investment.fdi_inward_stock_usd_millions")
+
+def search_country_semantics(user_input, query_embedding, sector, semantics_col=None):
+    if HYBRID_RETRIEVAL:
+        return hybrid_search_country_semantics(user_input, query_embedding, sector, semantics_col=semantics_col)
+    return vector_search_country_semantics(query_embedding, sector, semantics_col=semantics_col)
+
+# === Static components ===
+
+# Static score components from country_static_scores (see static_scores.py); countries
+# not materialized yet are computed from their profiles, fetched in one query
+def get_static_components(codes, profiles_col=None, static_col=None):
+    table = get_static_scores(static_col)
+    components = {code: table[code] for code in codes if code in table}
+    missing = [code for code in codes if code not in components]
+    if missing:
+        profiles_col = profiles_col if profiles_col is not None else get_collection("country_profiles")
+        flats = defaultdict(dict)
+        for chunk in profiles_col.find({"country_code": {"$in": missing}}, {"_id": 0, "country_code": 1, "chunk_data": 1}):
+            flats[chunk["country_code"]].update(chunk.get("chunk_data", {}))
+        trends = trend_components({code: flats.get(code, {}) for code in missing})
+        for code in missing:
+            components[code] = compute_static_components(flats.get(code, {}), trends[code])
+    set_attrs(static_misses=len(missing))
+    return components
+
+# === Branch-and-bound top N for one sector ===
+# Countries are visited in order of their score upper bound and scored exactly from the
+# embeddings the sector table holds in memory; the search stops once the next bound cannot
+# beat the N-th best exact score.
+@traced("prefilter_top_n")
+def prefilter_top_n(query_vector, sector, top_n=5, semantics_col=None, profiles_col=None, static_col=None,
+                    weights=None):
+    table = get_sector_prefilter(sector, PATH_NAME, semantics_col)
+    vector_bounds = table.vector_bounds(query_vector)
+    static = get_static_components(list(vector_bounds), profiles_col, static_col)
+
+    candidates = sorted(
+        ((score_upper_bound(bound, static[code], weights), code) for code, bound in vector_bounds.items()),
+        reverse=True
+    )
+
+    query = unit(query_vector)
+    best, evaluated = [], 0   # best: min-heap of (score, code, vector score)
+    for bound, code in candidates:
+        if len(best) >= top_n and bound + BOUND_SLACK < best[0][0]:
+            break
+        vec = table.vector_score(query, code)
+        entry = (combine_score(vec, static[code], weights), code, vec)
+        evaluated += 1
+        if len(best) < top_n:
+            heapq.heappush(best, entry)
+        elif entry > best[0]:
+            heapq.heapreplace(best, entry)
+
+    set_attrs(sector=sector, candidates=len(candidates), evaluated=evaluated,
+              pruned=len(candidates) - evaluated)
+    return [
+        {"country_code": code, "score": vec, "aggregate_score": score}
+        for score, code, vec in sorted(best, reverse=True)
     ]
-    total_fields += len(fdi_vals)
-    fdi_non_null = [v for v in fdi_vals if v is not None]
-    valid_fields += len(fdi_non_null)
-    fdi = sum(log_scale(v) for v in fdi_non_null) / len(fdi_vals) if fdi_vals else 0.0
-
-    # Data coverage adjustment (boost for countries with more complete data)
-    coverage = valid_fields / total_fields if total_fields > 0 else 1.0
-    coverage_adjust = 0.5 + 0.5 * coverage
-
-    # Final weighted score
-    final_score = (
-        vec_score * WEIGHTS["vector"] +
-        eodb * WEIGHTS["eodb"] +
-        macro * WEIGHTS["macro"] +
-        digital * WEIGHTS["digital"] +
-        trade * WEIGHTS["trade"] +
-        fdi * WEIGHTS["fdi"]
-    ) * coverage_adjust
-
-    # Additional micro-boost for AI/digital/FDI-heavy performers (e.g. India)
-    if vec_score > 0.8 and digital > 0.6 and fdi > 1.1:
-        final_score += 0.01
-
-    return round(final_score, 4)
 
 # === Final Shortlist ===
-def get_shortlist(user_input, top_n=5):
+# The idea-dependent work (sector detection, embedding, retrieval) is kept in a state dict,
+# so the same candidates can be re-ranked under other weights or sectors without redoing it.
+# Collections default to the shared client; callers may inject their own handles
+
+# {sector: {country_code: vector score}} for each sector's search hits
+def retrieve_candidates(user_input, query_vector, sectors, semantics_col=None):
+    return {
+        sector: {
+            doc["country_code"]: doc["score"]
+            for doc in search_country_semantics(user_input, query_vector, sector, semantics_col=semantics_col)
+        }
+        for sector in sectors
+    }
+
+# {country_code: {"score", "matched_sectors"}} over the sectors' candidates; a country is scored
+# with the first sector it matched. Sectors without cached candidates are retrieved into the state
+def candidate_hits(state, sectors, semantics_col=None):
+    missing = [sector for sector in sectors if sector not in state["candidates"]]
+    if missing:
+        state["candidates"].update(retrieve_candidates(state["idea"], state["query_vector"], missing, semantics_col))
+
+    hits = {}
+    for sector in sectors:
+        for code, vec in state["candidates"][sector].items():
+            hit = hits.setdefault(code, {"score": vec, "matched_sectors": set()})
+            hit["matched_sectors"].add(sector)
+    return hits
+
+@traced("shortlist_state")
+def build_shortlist_state(user_input, semantics_col=None):
     # Detect relevant sectors from user input
     sectors = detect_sectors(user_input)
 
@@ -200,22 +230,36 @@ def get_shortlist(user_input, top_n=5):
 
     print(f"🔎 Detected sectors: {sectors}")
 
+    # The prefilter scores from the query vector directly, so it needs no retrieved candidates
+    candidates = {} if SHORTLIST_PREFILTER else retrieve_candidates(user_input, query_vector, sectors, semantics_col)
+    return {"idea": user_input, "sectors": sectors, "query_vector": query_vector, "candidates": candidates}
+
+# Top N for a shortlist state; `sectors` and `weights` override the detected sectors and WEIGHTS
+@traced("rank_shortlist")
+def rank_shortlist(state, top_n=5, sectors=None, weights=None, semantics_col=None, profiles_col=None,
+                   static_col=None):
+    sectors = sectors or state["sectors"]
+    set_attrs(sectors=len(sectors), custom_weights=weights is not None)
     scored = {}
 
-    # Iterate through all detected sectors and score each country
-    for sector in sectors:
-        for doc in vector_search_country_semantics(query_vector, sector):
-            code = doc["country_code"]
-            vec = doc["score"]
-            if code not in scored:
-                flat = get_country_profile_flat(code)
-                final_score = compute_score(vec, flat, country_code=code)
-                scored[code] = {
-                    "aggregate_score": final_score,
-                    "matched_sectors": set([sector])
-                }
-            else:
-                scored[code]["matched_sectors"].add(sector)
+    if SHORTLIST_PREFILTER:
+        # Exact top N per sector; a country keeps its best sector score
+        for sector in sectors:
+            for doc in prefilter_top_n(state["query_vector"], sector, top_n, semantics_col, profiles_col,
+                                       static_col, weights):
+                entry = scored.setdefault(doc["country_code"], {"aggregate_score": 0.0, "matched_sectors": set()})
+                entry["aggregate_score"] = max(entry["aggregate_score"], doc["aggregate_score"])
+                entry["matched_sectors"].add(sector)
+    else:
+        hits = candidate_hits(state, sectors, semantics_col)
+
+        # Static components are precomputed, so scoring is one multiply-add per country
+        static = get_static_components(list(hits), profiles_col, static_col)
+        for code, hit in hits.items():
+            scored[code] = {
+                "aggregate_score": combine_score(hit["score"], static[code], weights),
+                "matched_sectors": hit["matched_sectors"]
+            }
 
     # Sort by score and return top N results
     result = [
@@ -228,6 +272,12 @@ def get_shortlist(user_input, top_n=5):
     ]
     return result[:top_n]
 
+@traced("get_shortlist")
+def get_shortlist(user_input, top_n=5, semantics_col=None, profiles_col=None, static_col=None):
+    state = build_shortlist_state(user_input, semantics_col)
+    return rank_shortlist(state, top_n, semantics_col=semantics_col, profiles_col=profiles_col,
+                          static_col=static_col)
+
 # === CLI Test ===
 if __name__ == "__main__":
     user_input = "Property valuation API using public land records and AI"
@@ -0,0 +1,155 @@
+# hybrid_search.py
+# In-process lexical retrieval over country_semantics, fused with vector search.
+#
+# A BM25 index over each sector's summaries (plus key-indicator names) catches exact
+# terms in an idea — "land records", "microfinance", "5G" — that dense similarity
+# blurs. Lexical and vector rankings are combined with reciprocal rank fusion (RRF),
+# which needs no score calibration between the two. The index is built from Mongo on
+# first use and rebuilt after HYBRID_INDEX_TTL_SECONDS, so regenerated summaries show
+# up without a restart.
+
+import os
+import re
+import math
+import time
+import operator
+import threading
+from collections import Counter, defaultdict
+from services import collection_key, get_collection
+
+# Rebuild interval for the in-memory index
+HYBRID_INDEX_TTL_SECONDS = float(os.getenv("HYBRID_INDEX_TTL_SECONDS", 600))
+
+# BM25 parameters and the RRF rank constant (60 is the usual choice)
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "into", "is",
+    "it", "its", "of", "on", "or", "that", "the", "their", "this", "to", "using", "via", "was",
+    "which", "while", "will", "with", "app", "platform", "startup", "service", "services",
+}
+
+# === Tokenizing ===
+
+def tokenize(text):
+    """Lowercased words (digits kept, so "5G" and "4g" survive) plus adjacent-word bigrams."""
+    words = [w for w in re.findall(r"[a-z0-9]+", text.lower().replace("_", " ")) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def document_text(doc):
+    """What a country_semantics document is searchable by: its summary and indicator names."""
+    indicators = " ".join(doc.get("key_indicators") or {})
+    return f"{doc.get('summary', '')} {indicators}"
+
+# === BM25 ===
+
+class SectorIndex:
+    """BM25 over one sector's documents (one per country)."""
+
+    def __init__(self, docs):
+        self.codes = []
+        self.lengths = []
+        self.postings = defaultdict(list)   # term -> [(doc index, term frequency)]
+        for code, tokens in docs:
+            index = len(self.codes)
+            self.codes.append(code)
+            self.lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((index, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def __len__(self):
+        return len(self.codes)
+
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.codes) - df + 0.5) / (df + 0.5))
+
+    def doc_freq(self, term):
+        return len(self.postings.get(term, ()))
+
+    def search(self, terms, top_k=50):
+        scores = defaultdict(float)
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for index, tf in postings:
+                norm = 1 - BM25_B + BM25_B * self.lengths[index] / (self.avg_length or 1)
+                scores[index] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+        return [(self.codes[index], round(score, 4)) for index, score in ranked]
+
+
+class LexicalIndex:
+    """Per-sector BM25 indexes over country_semantics."""
+
+    def __init__(self, docs):
+        by_sector = defaultdict(list)
+        for doc in docs:
+            if doc.get("summary"):
+                by_sector[doc["sector"].lower()].append((doc["country_code"], tokenize(document_text(doc))))
+        self.sectors = {sector: SectorIndex(entries) for sector, entries in by_sector.items()}
+        self.built_at = time.time()
+
+    def search(self, query, sector, top_k=50):
+        """[(country_code, bm25 score)] best first; empty when nothing matches."""
+        index = self.sectors.get(sector.lower())
+        return index.search(tokenize(query), top_k) if index else []
+
+    def specific_terms(self, query, sector, max_df_share=0.2):
+        """
+        Query words that occur in the sector, but in few of its documents (names, jargon).
+        Bigrams are left out so one specific phrase counts once per word, not three times.
+        """
+        index = self.sectors.get(sector.lower())
+        if not index:
+            return []
+        limit = max(1, int(max_df_share * len(index)))
+        return [t for t in dict.fromkeys(tokenize(query)) if " " not in t and 0 < index.doc_freq(t) <= limit]
+
+
+_index = None
+_index_source = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index(semantics_col=None):
+    """The shared index, rebuilt when stale or when a different collection is passed in."""
+    global _index, _index_source
+    semantics_col = semantics_col if semantics_col is not None else get_collection("country_semantics")
+    source = collection_key(semantics_col)
+    with _index_lock:
+        stale = _index is None or time.time() - _index.built_at > HYBRID_INDEX_TTL_SECONDS
+        if stale or _index_source != source:
+            docs = semantics_col.find({}, {"_id": 0, "country_code": 1, "sector": 1, "summary": 1, "key_indicators": 1})
+            _index, _index_source = LexicalIndex(docs), source
+        return _index
+
+
+def invalidate_lexical_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+# === Fusion ===
+
+def rrf_fuse(*rankings, k=RRF_K):
+    """Reciprocal rank fusion of ranked code lists; returns [(code, fused score)] best first."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, code in enumerate(ranking, start=1):
+            fused[code] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
+
+
+def cosine_score(a, b):
+    """Cosine similarity rescaled to [0, 1], the scale Atlas reports as vectorSearchScore."""
+    dot = sum(map(operator.mul, a, b))
+    na = math.sqrt(sum(map(operator.mul, a, a))) or 1.0
+    nb = math.sqrt(sum(map(operator.mul, b, b))) or 1.0
+    return (1 + dot / (na * nb)) / 2
@@ -0,0 +1,264 @@
+# llm.py
+# Single entry point for Gemini calls: rate limiting (see ratelimit.py), retries with
+# exponential backoff, usage recording (see usage.py) and token-budget enforcement.
+# `generate_json` adds schema-constrained JSON output with validation and repair.
+
+import json
+import time
+import random
+import asyncio
+from services import get_gemini_model
+from tracing import incr
+from schemas import repair, to_gemini_schema, top_level_field, validate
+from usage import check_budget, record_call
+from ratelimit import get_llm_limiter
+
+
+def _model_name(gen_model):
+    return getattr(gen_model, "model_name", type(gen_model).__name__)
+
+
+def _prompt_chars(prompt):
+    return len(prompt) if isinstance(prompt, str) else 0
+
+
+# === Retry policy ===
+# Shared by the blocking, async and streaming calls: exponential backoff with jitter
+# between attempts, no wait after the last one, and one failed call on the ledger.
+
+def _backoff(attempt, max_retries, error, what="Gemini"):
+    """Seconds to wait before the next attempt, or None when `attempt` was the last."""
+    if attempt == max_retries - 1:
+        print(f"{what} error: {error}")
+        return None
+    wait = (2 ** attempt) + random.uniform(0.5, 3)
+    print(f"{what} error: {error} — retrying in {wait:.1f}s...")
+    return wait
+
+
+def _record(response, gen_model, started, retries, prompt, ok=True):
+    latency_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+    record_call(response, _model_name(gen_model), latency_ms, retries=retries,
+                prompt_chars=_prompt_chars(prompt), ok=ok)
+
+
+def generate(prompt, gen_model=None, max_retries=5, **kwargs):
+    """Calls generate_content with retries; returns the raw response."""
+    gen_model = gen_model or get_gemini_model()
+    check_budget()
+    for attempt in range(max_retries):
+        get_llm_limiter().acquire()
+        started = time.perf_counter()
+        try:
+            response = gen_model.generate_content(prompt, **kwargs)
+        except Exception as e:
+            wait = _backoff(attempt, max_retries, e)
+            if wait is None:
+                break
+            time.sleep(wait)
+            continue
+        _record(response, gen_model, started, attempt, prompt)
+        return response
+    _record(None, gen_model, None, max_retries, prompt, ok=False)
+    raise RuntimeError("Gemini failed after max retries.")
+
+
+def generate_text(prompt, gen_model=None, max_retries=5, **kwargs):
+    """Same as `generate`, returning the stripped response text."""
+    return generate(prompt, gen_model=gen_model, max_retries=max_retries, **kwargs).text.strip()
+
+
+async def generate_async(prompt, gen_model=None, max_retries=5, **kwargs):
+    """Async `generate`: waits for the limiter and between retries without blocking the event loop."""
+    gen_model = gen_model or get_gemini_model()
+    check_budget()
+    for attempt in range(max_retries):
+        await get_llm_limiter().acquire_async()
+        started = time.perf_counter()
+        try:
+            response = await gen_model.generate_content_async(prompt, **kwargs)
+        except Exception as e:
+            wait = _backoff(attempt, max_retries, e)
+            if wait is None:
+                break
+            await asyncio.sleep(wait)
+            continue
+        _record(response, gen_model, started, attempt, prompt)
+        return response
+    _record(None, gen_model, None, max_retries, prompt, ok=False)
+    raise RuntimeError("Gemini failed after max retries.")
+
+# === Streaming ===
+# Retries only while nothing has been emitted: once text has reached the caller, restarting
+# the generation would duplicate it, so the failure is raised as PartialStreamError instead.
+
+class PartialStreamError(RuntimeError):
+    """Raised when a Gemini stream fails after some text was already emitted."""
+
+
+def _chunk_text(chunk):
+    """The text of a streamed chunk; chunks without parts (e.g. the final stop chunk) give ""."""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def generate_stream(prompt, gen_model=None, max_retries=5, **kwargs):
+    """Yields the response text chunk by chunk; usage is recorded from the last chunk."""
+    gen_model = gen_model or get_gemini_model()
+    check_budget()
+    for attempt in range(max_retries):
+        get_llm_limiter().acquire()
+        started = time.perf_counter()
+        chunk, emitted = None, False
+        try:
+            for chunk in gen_model.generate_content(prompt, stream=True, **kwargs):
+                text = _chunk_text(chunk)
+                if text:
+                    emitted = True
+                    yield text
+        except Exception as e:
+            if emitted:
+                _record(chunk, gen_model, started, attempt, prompt, ok=False)
+                raise PartialStreamError(f"Gemini stream interrupted: {e}") from e
+            wait = _backoff(attempt, max_retries, e, "Gemini stream")
+            if wait is None:
+                break
+            time.sleep(wait)
+            continue
+        _record(chunk, gen_model, started, attempt, prompt)
+        return
+    _record(None, gen_model, None, max_retries, prompt, ok=False)
+    raise RuntimeError("Gemini stream failed after max retries.")
+
+
+async def generate_stream_async(prompt, gen_model=None, max_retries=5, **kwargs):
+    """Async `generate_stream`, with the same retry and recording behaviour."""
+    gen_model = gen_model or get_gemini_model()
+    check_budget()
+    for attempt in range(max_retries):
+        await get_llm_limiter().acquire_async()
+        started = time.perf_counter()
+        chunk, emitted = None, False
+        try:
+            async for chunk in await gen_model.generate_content_async(prompt, stream=True, **kwargs):
+                text = _chunk_text(chunk)
+                if text:
+                    emitted = True
+                    yield text
+        except Exception as e:
+            if emitted:
+                _record(chunk, gen_model, started, attempt, prompt, ok=False)
+                raise PartialStreamError(f"Gemini stream interrupted: {e}") from e
+            wait = _backoff(attempt, max_retries, e, "Gemini stream")
+            if wait is None:
+                break
+            await asyncio.sleep(wait)
+            continue
+        _record(chunk, gen_model, started, attempt, prompt)
+        return
+    _record(None, gen_model, None, max_retries, prompt, ok=False)
+    raise RuntimeError("Gemini stream failed after max retries.")
+
+# === Structured (JSON) output ===
+
+class StructuredOutputError(RuntimeError):
+    """Raised when a JSON response still fails its schema after repair and re-asking."""
+
+    def __init__(self, message, value=None, errors=None):
+        super().__init__(message)
+        self.value = value
+        self.errors = errors or []
+
+
+REASK_PROMPT = """
+Your previous JSON answer to the task below had invalid or missing fields: {fields}.
+Problems: {problems}
+
+Return ONLY a JSON object with exactly these keys, filled in correctly for the same task: {fields}.
+
+--- ORIGINAL TASK ---
+{prompt}
+"""
+
+
+def _json_config(schema, generation_config=None):
+    config = dict(generation_config or {})
+    config["response_mime_type"] = "application/json"
+    config["response_schema"] = to_gemini_schema(schema)
+    return config
+
+
+def _parse_json(text):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        # JSON mode should never need this, but models behind proxies sometimes still fence output
+        cleaned = text.strip().strip("`").strip()
+        if cleaned.lower().startswith("json"):
+            cleaned = cleaned[4:].strip()
+        return json.loads(cleaned)
+
+
+def generate_json(prompt, schema, gen_model=None, max_retries=5, reasks=1, generation_config=None):
+    """
+    Calls Gemini in JSON mode with `schema` and returns a value that validates against it.
+
+    Invalid fields are first repaired locally (see schemas.repair). For an object, any
+    top-level fields still invalid are re-asked on their own, up to `reasks` times; the
+    fields that were already valid are kept. Raises StructuredOutputError if that fails.
+    """
+    response = generate(prompt, gen_model=gen_model, max_retries=max_retries,
+                        generation_config=_json_config(schema, generation_config))
+    try:
+        value = _parse_json(response.text)
+    except (json.JSONDecodeError, ValueError) as e:
+        if not reasks:
+            raise StructuredOutputError(f"Unparseable JSON: {e}")
+        # Nothing usable to keep — ask for the whole value again
+        incr("llm_json_reasks")
+        return generate_json(prompt, schema, gen_model, max_retries, reasks - 1, generation_config)
+
+    errors = validate(value, schema)
+    if not errors:
+        return value
+
+    incr("llm_json_repairs")
+    value = repair(value, schema)
+    errors = validate(value, schema)
+
+    while errors and reasks and schema["type"] == "OBJECT" and isinstance(value, dict):
+        reasks -= 1
+        incr("llm_json_reasks")
+        failing = sorted({top_level_field(path) for path, _ in errors})
+        sub_schema = {
+            "type": "OBJECT",
+            "properties": {key: schema["properties"][key] for key in failing},
+            "required": failing,
+        }
+        reask = REASK_PROMPT.format(
+            fields=", ".join(failing),
+            problems="; ".join(f"{path}: {message}" for path, message in errors[:10]),
+            prompt=prompt
+        )
+        try:
+            patch = _parse_json(generate(reask, gen_model=gen_model, max_retries=max_retries,
+                                         generation_config=_json_config(sub_schema, generation_config)).text)
+        except (json.JSONDecodeError, ValueError):
+            continue
+        if isinstance(patch, dict):
+            value = {**value, **{key: patch[key] for key in failing if key in patch}}
+            value = repair(value, schema)
+            errors = validate(value, schema)
+
+    if errors and reasks and schema["type"] != "OBJECT":
+        incr("llm_json_reasks")
+        return generate_json(prompt, schema, gen_model, max_retries, reasks - 1, generation_config)
+
+    if errors:
+        raise StructuredOutputError(
+            f"JSON failed validation: {'; '.join(f'{p}: {m}' for p, m in errors[:5])}",
+            value=value, errors=errors
+        )
+    return value
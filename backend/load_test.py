@@ -0,0 +1,418 @@
+# load_test.py
+# Load generator for the HTTP API. It replays whole user sessions and steps up the
+# concurrency to find the saturation point.
+#
+# Start the Flask app on the offline fakes (fakes.py). It is served by a bounded pool
+# of worker threads, so it saturates the way a threaded production worker would:
+#   python load_test.py serve --port 8100 --threads 16 --llm-latency-ms 400 --llm-rpm 600
+# then drive it:
+#   python load_test.py run --url http://localhost:8100 --levels 1,2,4,8,16,32 --duration 30
+#
+# Each virtual user loops over the flow
+#   /submit_text → /run_pipeline → /get_reports → /get_graph ×N → /chat ×M
+# At each concurrency level the driver reports throughput, latency percentiles per
+# route and error rates. It also samples the server's worker threads, Mongo pool and
+# LLM rate limiter to say which of them saturated first. `run` also works against any
+# server (e.g. gunicorn on real services); resource sampling then falls back to
+# /pool_stats.
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import argparse
+import threading
+import statistics
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+STATS_PATH = "/_loadtest/stats"
+
+IDEAS = [
+    "Mobile fintech app offering micro-loans to small merchants using AI-ML credit scoring",
+    "SaaS platform for logistics companies to optimise last-mile delivery routes",
+    "Healthtech telemedicine service connecting rural patients with specialists",
+    "Edtech marketplace for vocational courses with AI tutors",
+    "Cleantech startup selling solar-powered cold storage to agritech cooperatives",
+    "Proptech platform valuing property with public land records and AI",
+]
+
+QUESTIONS = [
+    "What are the licensing requirements for launching here?",
+    "Which of these countries has the best digital infrastructure?",
+    "How risky is the regulatory environment?",
+    "Where is inflation lowest and why does it matter for pricing?",
+    "What go-to-market approach would you recommend first?",
+]
+
+GRAPH_CATEGORIES = ["ease_of_doing_business", "macroeconomic_indicators", "digital_connectivity", "trade_profile"]
+
+# Utilisation at or above this share of capacity counts as saturated
+SATURATED = 0.9
+
+# === Serving on the fakes ===
+
+class PooledWSGIServer(WSGIServer):
+    """wsgiref server that hands each connection to a fixed pool of worker threads."""
+
+    def __init__(self, address, handler, threads):
+        super().__init__(address, handler)
+        self.threads = threads
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi-worker")
+        self._lock = threading.Lock()
+        self.worker_stats = {"busy": 0, "max_busy": 0, "queued": 0, "max_queued": 0,
+                             "queue_wait_ms_total": 0.0, "queue_wait_ms_max": 0.0, "handled": 0}
+
+    def _bump(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self.worker_stats[key] += delta
+            self.worker_stats["max_busy"] = max(self.worker_stats["max_busy"], self.worker_stats["busy"])
+            self.worker_stats["max_queued"] = max(self.worker_stats["max_queued"], self.worker_stats["queued"])
+
+    def process_request(self, request, client_address):
+        self._bump(queued=1)
+        self._pool.submit(self._work, request, client_address, time.perf_counter())
+
+    def _work(self, request, client_address, queued_at):
+        wait_ms = (time.perf_counter() - queued_at) * 1000
+        self._bump(queued=-1, busy=1, queue_wait_ms_total=wait_ms)
+        with self._lock:
+            self.worker_stats["queue_wait_ms_max"] = max(self.worker_stats["queue_wait_ms_max"], wait_ms)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._bump(busy=-1, handled=1)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.worker_stats)
+        stats["threads"] = self.threads
+        stats["queue_wait_ms_total"] = round(stats["queue_wait_ms_total"], 1)
+        stats["queue_wait_ms_max"] = round(stats["queue_wait_ms_max"], 1)
+        return stats
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(args):
+    import fakes
+    os.environ["LLM_REQUESTS_PER_MINUTE"] = str(args.llm_rpm)
+    env = fakes.install(
+        llm_latency_ms=args.llm_latency_ms, llm_jitter_ms=args.llm_jitter_ms, llm_chunk_ms=args.llm_chunk_ms,
+        embed_latency_ms=args.embed_latency_ms, mongo_latency_ms=args.mongo_latency_ms,
+        mongo_pool_size=args.mongo_pool_size, n_countries=args.countries
+    )
+    # Imported after the fakes are registered — pipeline modules read their config at import
+    import logging
+    from app import app
+    from ratelimit import limiter_stats
+    logging.getLogger("globallaunch.trace").setLevel(logging.WARNING)
+
+    server = None
+
+    def with_stats(environ, start_response):
+        if environ.get("PATH_INFO") == STATS_PATH:
+            body = json.dumps({
+                "workers": server.stats(),
+                "mongo_pool": env.client.pool.stats(),
+                "rate_limiters": limiter_stats(),
+            }).encode()
+            start_response("200 OK", [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+            return [body]
+        return app(environ, start_response)
+
+    server = make_server(
+        "0.0.0.0", args.port, with_stats,
+        server_class=lambda address, handler: PooledWSGIServer(address, handler, args.threads),
+        handler_class=QuietHandler
+    )
+    server.request_queue_size = 1024
+    print(f"Serving on fakes at http://localhost:{args.port} with {args.threads} worker threads "
+          f"(Mongo pool {env.client.pool.size}, LLM limit {args.llm_rpm or 'none'} rpm)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+# === Driver ===
+
+class Recorder:
+    """Collects (route, latency, ok) samples from every virtual user."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, route, seconds, ok):
+        with self._lock:
+            self.samples.append((route, seconds, ok))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def call(base_url, route, recorder, label=None, data=None, timeout=120.0):
+    """Performs one request; returns the parsed JSON body (or None) and records the sample."""
+    url = base_url.rstrip("/") + route
+    body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+    request = urllib.request.Request(url, data=body, method="POST" if body is not None else "GET")
+    started = time.perf_counter()
+    ok, payload = False, None
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            raw = response.read()
+            ok = 200 <= response.status < 300
+            if response.headers.get_content_type() == "application/json":
+                payload = json.loads(raw)
+    except (urllib.error.URLError, OSError, ValueError):
+        ok = False
+    recorder.add(label or route, time.perf_counter() - started, ok)
+    return payload if ok else None
+
+
+def run_flow(base_url, user, flow, recorder, args):
+    """One full session: idea → shortlist → reports → graphs → chat."""
+    rng = random.Random(f"{user}-{flow}")
+    idea = f"{rng.choice(IDEAS)} (user {user}, session {flow})"
+
+    submitted = call(base_url, "/submit_text", recorder, data={"text": idea}, timeout=args.timeout)
+    if submitted is None:
+        return
+    session_id = submitted.get("session_id", "")
+    pipeline = call(base_url, "/run_pipeline", recorder, data={"idea": idea, "session_id": session_id},
+                    timeout=args.timeout)
+    if pipeline is None:
+        return
+    top = pipeline.get("top_countries", [])
+
+    call(base_url, "/get_reports", recorder, timeout=args.timeout)
+    for _ in range(args.graphs):
+        if not top:
+            break
+        route = f"/get_graph/{rng.choice(top)}/{rng.choice(GRAPH_CATEGORIES)}"
+        call(base_url, route, recorder, label="/get_graph", timeout=args.timeout)
+    for turn in range(args.chats):
+        call(base_url, "/chat", recorder, data={
+            "question": f"{rng.choice(QUESTIONS)} ({turn})",
+            "top_countries": top,
+            "session_id": session_id
+        }, timeout=args.timeout)
+
+
+def sample_server(base_url, stop, samples, interval=0.5):
+    """Polls the server's resource stats until `stop` is set."""
+    while not stop.is_set():
+        for path in (STATS_PATH, "/pool_stats"):
+            try:
+                with urllib.request.urlopen(base_url.rstrip("/") + path, timeout=5) as response:
+                    data = json.loads(response.read())
+                samples.append((time.perf_counter(), path, data))
+                break
+            except (urllib.error.URLError, OSError, ValueError):
+                continue
+        stop.wait(interval)
+
+
+def resource_pressure(samples):
+    """
+    Peak utilisation (0–1) of each server-side resource over a level, with the time at
+    which it first reached SATURATED (None if it never did).
+    """
+    resources = {}
+
+    def note(name, utilisation, at):
+        entry = resources.setdefault(name, {"peak": 0.0, "saturated_at": None})
+        entry["peak"] = max(entry["peak"], round(utilisation, 3))
+        if utilisation >= SATURATED and entry["saturated_at"] is None:
+            entry["saturated_at"] = at
+
+    previous_waits = {}
+    previous_at = None
+    for at, path, data in samples:
+        if path == STATS_PATH:
+            workers = data["workers"]
+            # The stats request itself occupies one worker; queued requests push demand past 100%
+            note("worker_threads", (workers["busy"] - 1 + workers["queued"]) / workers["threads"], at)
+            pool = data["mongo_pool"]
+            note("mongo_pool", pool["checked_out"] / pool["max_pool_size"], at)
+            for name, limiter in data["rate_limiters"].items():
+                if limiter["rate_per_minute"] and previous_at is not None:
+                    # Callers queued right now mean demand exceeds the rate; otherwise use the
+                    # share of the interval that callers spent waiting
+                    waited_ms = limiter["wait_ms_total"] - previous_waits.get(name, 0.0)
+                    elapsed_ms = max((at - previous_at) * 1000, 1.0)
+                    note(f"rate_limiter:{name}", 1.0 if limiter["waiting"] else min(1.0, waited_ms / elapsed_ms), at)
+                previous_waits[name] = limiter["wait_ms_total"]
+            previous_at = at
+        else:
+            options = data.get("options", {})
+            size = options.get("maxPoolSize") or 1
+            note("mongo_pool", data.get("checked_out", 0) / size, at)
+    return resources
+
+
+def run_level(base_url, users, args):
+    recorder = Recorder()
+    stop = threading.Event()
+    samples = []
+    sampler = threading.Thread(target=sample_server, args=(base_url, stop, samples), daemon=True)
+    sampler.start()
+
+    deadline = time.perf_counter() + args.duration
+    flows = queue.Queue()
+
+    def user_loop(user):
+        flow = 0
+        while time.perf_counter() < deadline:
+            run_flow(base_url, user, flow, recorder, args)
+            flows.put(1)
+            flow += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user_loop, range(users)))
+    wall = time.perf_counter() - started
+    stop.set()
+    sampler.join()
+
+    routes = {}
+    for route, seconds, ok in recorder.samples:
+        entry = routes.setdefault(route, {"latencies": [], "errors": 0})
+        if ok:
+            entry["latencies"].append(seconds * 1000)
+        else:
+            entry["errors"] += 1
+
+    total = len(recorder.samples)
+    errors = sum(1 for _, _, ok in recorder.samples if not ok)
+    pressure = resource_pressure(samples)
+    for entry in pressure.values():
+        if entry["saturated_at"] is not None:
+            entry["saturated_at"] = round(entry["saturated_at"] - started, 1)
+    return {
+        "users": users,
+        "flows": flows.qsize(),
+        "requests": total,
+        "throughput_rps": round((total - errors) / wall, 2) if wall else 0.0,
+        "flows_per_min": round(flows.qsize() / wall * 60, 2) if wall else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "routes": {
+            route: {
+                "count": len(entry["latencies"]) + entry["errors"],
+                "p50_ms": round(percentile(entry["latencies"], 50), 1),
+                "p95_ms": round(percentile(entry["latencies"], 95), 1),
+                "p99_ms": round(percentile(entry["latencies"], 99), 1),
+                "mean_ms": round(statistics.mean(entry["latencies"]), 1) if entry["latencies"] else 0.0,
+                "errors": entry["errors"],
+            }
+            for route, entry in sorted(routes.items())
+        },
+        "resources": pressure,
+    }
+
+
+def first_saturated(resources):
+    saturated = [(entry["saturated_at"], name) for name, entry in resources.items() if entry["saturated_at"] is not None]
+    return min(saturated)[1] if saturated else None
+
+
+def print_level(result):
+    print(f"\n=== {result['users']} users: {result['throughput_rps']} req/s, {result['flows_per_min']} flows/min, "
+          f"errors {100 * result['error_rate']:.1f}% ===")
+    print(f"{'route':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for route, row in result["routes"].items():
+        print(f"{route:<16}{row['count']:>7}{row['p50_ms']:>10.0f}{row['p95_ms']:>10.0f}{row['p99_ms']:>10.0f}{row['errors']:>8}")
+    if result["resources"]:
+        print("resources (peak demand / capacity): " + ", ".join(
+            f"{name} {100 * entry['peak']:.0f}%" for name, entry in sorted(result["resources"].items())
+        ))
+
+
+def run(args):
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    results = []
+    for users in levels:
+        print(f"Running {users} concurrent users for {args.duration}s...", file=sys.stderr)
+        result = run_level(args.url, users, args)
+        results.append(result)
+        print_level(result)
+
+    # Saturation: the first level where adding users stops adding throughput, or errors appear
+    saturation = None
+    for previous, current in zip(results, results[1:]):
+        gain = current["throughput_rps"] / previous["throughput_rps"] - 1 if previous["throughput_rps"] else 0.0
+        if gain < args.min_gain or current["error_rate"] > args.max_error_rate:
+            saturation = previous
+            break
+
+    print("\n=== Summary ===")
+    print(f"{'users':>6}{'req/s':>10}{'flows/min':>11}{'errors':>9}  first saturated resource")
+    for result in results:
+        print(f"{result['users']:>6}{result['throughput_rps']:>10.2f}{result['flows_per_min']:>11.2f}"
+              f"{100 * result['error_rate']:>8.1f}%  {first_saturated(result['resources']) or '-'}")
+    if saturation:
+        print(f"\nThroughput stops scaling after {saturation['users']} users "
+              f"(~{saturation['throughput_rps']} req/s); "
+              f"first resource to saturate: {first_saturated(saturation['resources']) or first_saturated(results[-1]['resources']) or 'none observed (client-bound?)'}")
+    else:
+        print("\nThroughput kept scaling up to the highest level tested.")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"levels": results, "saturation_users": saturation["users"] if saturation else None}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Session-flow load test for the GlobalLaunch API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="serve the Flask app on the offline fakes")
+    serve_parser.add_argument("--port", type=int, default=8100)
+    serve_parser.add_argument("--threads", type=int, default=16, help="WSGI worker threads")
+    serve_parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    serve_parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    serve_parser.add_argument("--llm-chunk-ms", type=float, default=30.0)
+    serve_parser.add_argument("--llm-rpm", type=float, default=0.0, help="LLM requests per minute (0 = unlimited)")
+    serve_parser.add_argument("--embed-latency-ms", type=float, default=80.0)
+    serve_parser.add_argument("--mongo-latency-ms", type=float, default=2.0)
+    serve_parser.add_argument("--mongo-pool-size", type=int, default=None, help="defaults to MONGO_MAX_POOL_SIZE")
+    serve_parser.add_argument("--countries", type=int, default=50)
+
+    run_parser = commands.add_parser("run", help="replay session flows at increasing concurrency")
+    run_parser.add_argument("--url", default="http://localhost:8100")
+    run_parser.add_argument("--levels", default="1,2,4,8,16", help="comma-separated concurrent user counts")
+    run_parser.add_argument("--duration", type=float, default=30.0, help="seconds per level")
+    run_parser.add_argument("--graphs", type=int, default=4, help="/get_graph calls per session")
+    run_parser.add_argument("--chats", type=int, default=3, help="/chat calls per session")
+    run_parser.add_argument("--timeout", type=float, default=120.0)
+    run_parser.add_argument("--min-gain", type=float, default=0.1, help="throughput gain below which a level counts as saturated")
+    run_parser.add_argument("--max-error-rate", type=float, default=0.01)
+    run_parser.add_argument("--output", help="write all results to this JSON file")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
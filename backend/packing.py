@@ -0,0 +1,274 @@
+# packing.py
+# Packs a country's profile fields into as few LLM prompts as possible under a token budget.
+#
+# Chunk data is serialized compactly (abbreviated key prefixes, rounded numbers, and by
+# default a table with each field named once and one row per year), fields are ranked by relevance to the detected sectors, and the most relevant
+# ones are poured into prompts until each reaches the budget. Fields that do not fit in
+# PACK_MAX_PROMPTS prompts are dropped, least relevant first — never cut mid-value.
+
+import os
+import json
+import math
+
+# Tokens of chunk data per prompt (instructions come on top) and prompts per country/sector
+PACK_TOKEN_BUDGET = int(os.getenv("PACK_TOKEN_BUDGET", 6000))
+PACK_MAX_PROMPTS = int(os.getenv("PACK_MAX_PROMPTS", 3))
+
+# "table" (field dictionary + one row per year) or "json" (flat keys, no whitespace)
+PROMPT_DATA_ENCODING = os.getenv("PROMPT_DATA_ENCODING", "table")
+
+# How each encoding is explained to the model (prompts take it as {data_format})
+DATA_FORMAT_NOTES = {
+    "table": "The data is a table: a numbered dictionary of `category.field` names, then one CSV row per year "
+             "whose columns follow those numbers (blank = no data). Abbreviated category prefixes are listed above it.",
+    "json": "The data is a JSON object keyed by `year.category.field`. Abbreviated category prefixes are listed above it.",
+}
+
+# Digit-heavy data tokenises denser than prose, so estimate conservatively
+CHARS_PER_TOKEN = 3
+
+# Long category prefixes → short ones; the prompt carries a legend for those used
+KEY_ALIASES = [
+    ("digital_connectivity.connectivity.", "dc.c."),
+    ("digital_connectivity.", "dc."),
+    ("ease_of_doing_business.", "eodb."),
+    ("macroeconomic_indicators.", "macro."),
+    ("foreign_direct_investment.", "fdi."),
+    ("trade_profile.", "trade."),
+    ("regulatory_indicators.", "reg."),
+    ("corruption_perceptions.", "cpi."),
+]
+
+# Key fragments that matter most per sector (matched as substrings of the full key)
+SECTOR_FIELD_HINTS = {
+    "fintech": ["getting_credit", "protecting_minority_investors", "mobile_ownership", "affordability",
+                "online_security", "inflation", "exchange_rate", "regulatory", "corruption"],
+    "healthtech": ["literacy", "mobile_broadband", "infrastructure", "e_government", "regulatory", "gdp"],
+    "edtech": ["literacy", "school_life", "affordability", "mobile_broadband", "social_media"],
+    "ecommerce": ["mobile_ownership", "social_media", "affordability", "trading_across_borders", "tariff",
+                  "import_duties", "online_security"],
+    "cleantech": ["getting_electricity", "fdi", "greenfield", "regulatory", "public_debt"],
+    "logistics": ["trading_across_borders", "tariff", "import_duties", "duty", "infrastructure",
+                  "registering_property"],
+    "SaaS": ["download_speed", "upload_speed", "latency", "online_security", "enforcing_contracts", "tlds"],
+    "cybersecurity": ["online_security", "cybersecurity", "regulatory", "e_government"],
+    "AI-ML": ["download_speed", "5g", "literacy", "school_life", "fdi", "online_security"],
+    "retail": ["gdp", "inflation", "unemployment", "import_duties", "tariff", "social_media"],
+    "agritech": ["trading_across_borders", "tariff", "registering_property", "getting_credit",
+                 "mobile_broadband", "2g", "3g"],
+    "mobility": ["infrastructure", "4g", "5g", "mobile_ownership", "regulatory", "registering_property"],
+    "proptech": ["registering_property", "getting_credit", "enforcing_contracts", "inflation", "public_debt"],
+    "govtech": ["e_government", "corruption", "regulatory", "online_security"],
+    "biotech": ["fdi", "protecting_minority_investors", "regulatory", "trading_across_borders", "import_duties"],
+}
+
+# Headline signals every report can use, whatever the sector
+CORE_FIELD_HINTS = ["overall_score", "gdp_growth", "inflation_rate", "gsma_connectivity_index", "fdi_net_inflows"]
+
+# === Compact serialization ===
+
+def short_key(key):
+    for long, short in KEY_ALIASES:
+        if long in key:
+            return key.replace(long, short, 1)
+    return key
+
+
+def compact_value(value):
+    """
+    Rounds numbers to the precision a prompt needs: whole numbers from 100 up, three
+    significant figures below (so 0.004 stays 0.004); returns None for empty values.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            return None
+        value = round(value) if abs(value) >= 100 else float(f"{value:.3g}")
+        return int(value) if float(value).is_integer() else value
+    if value in ("", None, [], {}):
+        return None
+    return value
+
+
+def legend(keys):
+    """One line naming the abbreviated prefixes that appear in `keys`."""
+    used = [(long, short) for long, short in KEY_ALIASES if any(f".{short}" in f".{k}" for k in keys)]
+    if not used:
+        return ""
+    return "Key prefixes: " + ", ".join(f"{short[:-1]}={long[:-1]}" for long, short in used)
+
+
+def render(fields, encoding=None):
+    """Prompt text for one pack: the prefix legend plus the table (or whitespace-free JSON)."""
+    compact = {short_key(k): v for k, v in fields.items()}
+    if (encoding or PROMPT_DATA_ENCODING) == "table":
+        body = render_table(compact)
+    else:
+        body = json.dumps(compact, separators=(",", ":"), ensure_ascii=False, default=str)
+    header = legend(compact)
+    return f"{header}\n{body}" if header else body
+
+
+def data_format(encoding=None):
+    return DATA_FORMAT_NOTES[encoding or PROMPT_DATA_ENCODING]
+
+
+def render_table(fields):
+    """
+    Fields as a table: each field is named once in a numbered dictionary, then one CSV
+    row per year (blank = no data). Keys without a year go in an "all" row.
+    """
+    columns, rows = {}, {}
+    for key, value in fields.items():
+        year, path = _split_year(key)
+        column = columns.setdefault(path, len(columns) + 1)
+        rows.setdefault(year, {})[column] = value
+
+    lines = ["Fields:"]
+    lines += [f"{number} {path}" for path, number in columns.items()]
+    lines.append("year," + ",".join(str(n) for n in columns.values()))
+    for year in sorted(rows, key=lambda y: (y is None, y)):
+        cells = [_cell(rows[year].get(n)) for n in columns.values()]
+        lines.append(f"{'all' if year is None else year}," + ",".join(cells).rstrip(","))
+    return "\n".join(lines)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    text = value if isinstance(value, str) else json.dumps(value, separators=(",", ":"), default=str)
+    return json.dumps(text, ensure_ascii=False) if any(c in text for c in ',"\n') else text
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+# === Relevance ===
+
+def _split_year(key):
+    head, _, rest = key.partition(".")
+    return (int(head), rest) if head.isdigit() and rest else (None, key)
+
+
+def relevance(key, sectors, latest_year=None):
+    """Higher is more useful: sector hints, headline signals and recent years win; deep keys lose."""
+    year, path = _split_year(key)
+    hints = {hint for sector in sectors for hint in SECTOR_FIELD_HINTS.get(sector, [])}
+    score = 1.0 + min(2, sum(hint in path for hint in hints))
+    if any(hint in path for hint in CORE_FIELD_HINTS):
+        score += 0.5
+    if year is not None and latest_year is not None:
+        score += max(0.0, 0.5 - 0.1 * (latest_year - year))
+    score -= 0.25 * max(0, path.count(".") - 1)
+    if ".details." in f".{path}.":
+        score -= 1.0
+    return score
+
+# === Packing ===
+
+def flatten_chunks(chunks):
+    """Merges the `chunk_data` of a country's chunk documents (or plain dicts) into one map."""
+    fields = {}
+    for chunk in chunks:
+        fields.update(chunk["chunk_data"] if "chunk_data" in chunk else chunk)
+    return fields
+
+
+def pack_fields(fields, sectors, token_budget=None, max_prompts=None, encoding=None):
+    """
+    Splits `fields` into the fewest packs whose rendered size stays under `token_budget`,
+    most relevant fields first. Related fields (same category) stay together where possible.
+    Returns (packs, stats).
+    """
+    token_budget = token_budget or PACK_TOKEN_BUDGET
+    max_prompts = max_prompts or PACK_MAX_PROMPTS
+    encoding = encoding or PROMPT_DATA_ENCODING
+
+    cleaned = {k: v for k, v in ((k, compact_value(v)) for k, v in fields.items()) if v is not None}
+    years = [y for y, _ in map(_split_year, cleaned) if y is not None]
+    latest = max(years) if years else None
+    scored = sorted(cleaned, key=lambda k: (-relevance(k, sectors, latest), k))
+
+    # Room per pack once the legend and braces (or table header and row labels) are paid for
+    overhead = estimate_tokens(legend([short_key(k) for k in cleaned])) + 2
+    rows = {_split_year(k)[0] for k in cleaned}
+    if encoding == "table":
+        overhead += estimate_tokens("Fields:\nyear\n" + "0000,\n" * len(rows))
+    room = max(1, token_budget - overhead)
+
+    if encoding == "table":
+        # A cell, plus its column when the pack does not have it yet: the dictionary line,
+        # the header number and one separator in every row (blank cells still cost a comma)
+        digits = len(str(len(cleaned)))
+
+        def column_of(key):
+            return _split_year(short_key(key))[1]
+
+        def column_cost(column):
+            return (2 * digits + 3 + len(column) + len(rows)) / CHARS_PER_TOKEN
+
+        def cost(key, columns=None):
+            column = column_of(key)
+            opened = 0 if columns is not None and column in columns else column_cost(column)
+            return len(_cell(cleaned[key])) / CHARS_PER_TOKEN + opened
+    else:
+        def column_of(key):
+            return None
+
+        def cost(key, columns=None):
+            return estimate_tokens(json.dumps({short_key(key): cleaned[key]}, separators=(",", ":"), default=str))
+
+    # Rough cut to what can fit at all, paying for each column once; the exact cost
+    # depends on the pack a field lands in
+    kept, planned, seen = [], 0, set()
+    for key in scored:
+        c = cost(key, seen)
+        if planned + c > room * max_prompts:
+            continue
+        kept.append(key)
+        planned += c
+        seen.add(column_of(key))
+
+    # Keep categories together: order by each category's best rank, then pour into packs
+    position = {key: i for i, key in enumerate(scored)}
+    rank = {}
+    for key in kept:
+        rank.setdefault(_category(key), position[key])
+    kept.sort(key=lambda key: (rank[_category(key)], position[key]))
+
+    # Next-fit keeps categories contiguous; once every pack is open, leftovers go to any pack with room
+    packs, sizes, columns, placed = [], [], [], 0
+    for key in kept:
+        if packs and sizes[-1] + cost(key, columns[-1]) <= room:
+            target = len(packs) - 1
+        elif len(packs) < max_prompts and cost(key) <= room:
+            packs.append({})
+            sizes.append(0)
+            columns.append(set())
+            target = len(packs) - 1
+        else:
+            target = next((i for i in range(len(packs)) if sizes[i] + cost(key, columns[i]) <= room), None)
+            if target is None:
+                continue
+        sizes[target] += cost(key, columns[target])
+        columns[target].add(column_of(key))
+        packs[target][key] = cleaned[key]
+        placed += 1
+
+    stats = {
+        "packed_prompts": len(packs),
+        "packed_fields": placed,
+        "dropped_fields": len(cleaned) - placed,
+        "packed_tokens_est": round(sum(sizes) + overhead * len(packs)),
+    }
+    return [dict(sorted(p.items())) for p in packs], stats
+
+
+def _category(key):
+    _, path = _split_year(key)
+    return path.split(".", 1)[0]
@@ -1,19 +1,155 @@
 # pdf_reader.py
 
+import os
+import re
+from collections import Counter
 import fitz  # PyMuPDF: used to read and extract text from PDFs
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
 from fallback_sector_detection import detect_sectors  # Custom logic for sector detection
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+# Extraction budgets — keep memory and latency bounded for very long decks
+MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 60))
+MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", 60000))
+
+# Long-document path: every page up to this count is read and ranked before the excerpt
+# is cut, so a dense page late in a long deck is not lost to the page budget
+SCAN_MAX_PAGES = int(os.getenv("PDF_SCAN_MAX_PAGES", 500))
+
+# Size of the excerpt sent on to sector classification and embedding
+EXCERPT_CHARS = int(os.getenv("PDF_EXCERPT_CHARS", 8000))
+
+WORD_RE = re.compile(r"[A-Za-z][A-Za-z\-]{2,}")
+NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?%?")
+PAGE_NUMBER_RE = re.compile(r"^(?:page\s*)?\d+(?:\s*(?:/|of)\s*\d+)?$", re.IGNORECASE)
+
+# What PyMuPDF raises for bad input: FileDataError (a RuntimeError) for empty or damaged
+# files, but mupdf's own FzErrorFormat, which is not a RuntimeError, for data that is not
+# a PDF at all. Both are re-raised as UnreadablePDFError.
+PDF_ERRORS = (fitz.FileDataError, fitz.mupdf.FzErrorBase)
+
+
+class UnreadablePDFError(ValueError):
+    """Raised for uploads that are empty, damaged or not a PDF."""
+
+
+def iter_page_text(doc, max_pages: int = MAX_PAGES, max_chars: int = MAX_CHARS) -> Iterator[str]:
+    """
+    Lazily yields the text of each page of an open PyMuPDF document.
+    Stops after `max_pages` pages or once `max_chars` characters have been produced
+    (the last page is cut to fit the character budget).
+    """
+    remaining = max_chars
+    for page_number in range(min(doc.page_count, max_pages)):
+        if remaining <= 0:
+            break
+        text = doc.load_page(page_number).get_text()
+        if len(text) > remaining:
+            text = text[:remaining]
+        remaining -= len(text)
+        yield text
+
+
+def extract_text_from_stream(data: bytes, max_pages: int = MAX_PAGES, max_chars: int = MAX_CHARS) -> str:
     """
-    Extracts and returns all text from a PDF file using PyMuPDF.
+    Extracts text from in-memory PDF bytes (e.g. an upload) without touching disk.
+    Raises UnreadablePDFError when the bytes are not a readable PDF.
     """
-    doc = fitz.open(pdf_path)  # Open the PDF file
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text()  # Extract text from each page
-    doc.close()  # Close the document to free resources
-    return full_text.strip()  # Return the cleaned, concatenated text
+    try:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            return "".join(iter_page_text(doc, max_pages, max_chars)).strip()
+    except PDF_ERRORS as e:
+        raise UnreadablePDFError(f"not a readable PDF: {e}") from e
+
+
+def extract_text_from_pdf(pdf_path: str, max_pages: int = MAX_PAGES, max_chars: int = MAX_CHARS) -> str:
+    """
+    Extracts and returns the text from a PDF file using PyMuPDF, within the page/character budget.
+    """
+    with fitz.open(pdf_path) as doc:
+        return "".join(iter_page_text(doc, max_pages, max_chars)).strip()
+
+
+# === Long-Document Path ===
+
+def extract_pages(data: bytes, max_pages: int = SCAN_MAX_PAGES) -> List[str]:
+    """
+    Returns the text of each page (in order), up to `max_pages`. The PDF is parsed once,
+    in-process: PyMuPDF holds the GIL, and handing the bytes to other processes meant
+    copying and re-parsing the whole file per worker. Raises UnreadablePDFError when the
+    bytes are not a readable PDF.
+    """
+    try:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            return [doc.load_page(i).get_text() for i in range(min(doc.page_count, max_pages))]
+    except PDF_ERRORS as e:
+        raise UnreadablePDFError(f"not a readable PDF: {e}") from e
+
+
+def _normalize_line(line: str) -> str:
+    # Digits stay: lines that differ only in their figures ("Revenue 2023: $4M") are content
+    return line.strip().lower()
+
+
+def strip_boilerplate(pages: List[str], min_share: float = 0.5) -> List[str]:
+    """
+    Removes lines that repeat on at least `min_share` of the pages (headers, footers,
+    confidentiality notices) and bare page numbers ("7", "Page 7 of 40").
+    """
+    if len(pages) < 3:
+        return pages
+    counts = Counter()
+    for text in pages:
+        counts.update({_normalize_line(line) for line in text.splitlines() if line.strip()})
+    threshold = max(3, int(len(pages) * min_share))
+    repeated = {line for line, n in counts.items() if n >= threshold}
+    return [
+        "\n".join(
+            line for line in text.splitlines()
+            if line.strip() and _normalize_line(line) not in repeated and not PAGE_NUMBER_RE.match(line.strip())
+        )
+        for text in pages
+    ]
+
+
+def page_density(text: str) -> float:
+    """
+    Information-density score for a page: distinct content words plus numbers
+    (market sizes, growth rates, prices carry most of the signal in a pitch deck).
+    """
+    words = {w.lower() for w in WORD_RE.findall(text)}
+    numbers = NUMBER_RE.findall(text)
+    return len(words) + 2 * len(numbers)
+
+
+def salient_excerpt(pages: List[str], max_chars: int = EXCERPT_CHARS) -> str:
+    """
+    Builds a bounded excerpt from the densest pages. The first page (usually the
+    pitch itself) is always kept; selected pages are emitted in document order.
+    """
+    candidates = [i for i, text in enumerate(pages) if text.strip()]
+    if not candidates:
+        return ""
+    ranked = [candidates[0]] + sorted(candidates[1:], key=lambda i: -page_density(pages[i]))
+
+    chosen, used = [], 0
+    for i in ranked:
+        size = len(pages[i]) + 2
+        if chosen and used + size > max_chars:
+            continue  # A smaller, less dense page may still fit
+        chosen.append(i)
+        used += size
+
+    excerpt = "\n\n".join(pages[i].strip() for i in sorted(chosen))
+    return excerpt[:max_chars].strip()
+
+
+def detect_sectors_from_text(text: str, max_results: int = 3) -> Tuple[List[str], str]:
+    """
+    Detects relevant business sectors in already-extracted PDF text.
+    Returns the detected sectors and the text itself.
+    """
+    sectors = detect_sectors(text, max_results=max_results)
+    return sectors, text
 
 
 def detect_sectors_from_pdf(pdf_path: str, max_results: int = 3) -> Tuple[List[str], str]:
@@ -24,11 +160,23 @@ def detect_sectors_from_pdf(pdf_path: str, max_results: int = 3) -> Tuple[List[s
         - The full raw extracted text from the PDF
     """
     text = extract_text_from_pdf(pdf_path)  # Step 1: Extract raw text from PDF
-    sectors = detect_sectors(text, max_results=max_results)  # Step 2: Detect top sectors
-    return sectors, text  # Return both sector list and raw text
+    return detect_sectors_from_text(text, max_results=max_results)  # Step 2: Detect top sectors
+
+
+def detect_sectors_from_pdf_bytes(data: bytes, max_results: int = 3) -> Tuple[List[str], str]:
+    """
+    Same as `detect_sectors_from_pdf`, but for PDF bytes already held in memory.
+    Long decks go through the long-document path: every page (up to SCAN_MAX_PAGES) is
+    extracted and cleaned of boilerplate, then the densest pages across the whole document
+    form an excerpt of at most EXCERPT_CHARS characters, which is what gets classified and
+    returned (and later embedded by the pipeline).
+    """
+    pages = strip_boilerplate(extract_pages(data))
+    text = salient_excerpt(pages)
+    return detect_sectors_from_text(text, max_results=max_results)
 
 
-# === CLI test block === 
+# === CLI test block ===
 if __name__ == "__main__":
     test_path = "samples/sample_pitchdeck.pdf"  # Path to the PDF used for testing
     sectors, raw_text = detect_sectors_from_pdf(test_path)
@@ -0,0 +1,214 @@
+# pipeline.py
+# What the Flask (app.py) and ASGI (asgi_app.py) apps share: upload checks, session IDs,
+# the country pipeline, /rerank, /sensitivity and the metrics text. It imports neither
+# app, so each serving mode builds only its own framework and clients.
+
+import os
+import re
+import secrets
+from get_final_shortlist import build_shortlist_state, candidate_hits, get_static_components, rank_shortlist
+from sensitivity import SENSITIVITY_MAX_SAMPLES, analysis_slots, analyze as analyze_sensitivity
+from scoring import resolve_weights
+from schemas import SECTORS
+from generate_country_reports import generate_final_reports
+from plot_graphs import generate_country_graphs
+from services import get_collection, pool_metrics
+from tracing import span, histograms, set_attrs
+from ratelimit import limiter_stats
+from usage import request_ledger, PIPELINE_TOKEN_BUDGET
+
+# Uploads are processed in memory; cap their size so a single request stays bounded
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", 25)) * 1024 * 1024
+
+# Allowed file types for upload
+ALLOWED_EXTENSIONS = {"pdf"}
+
+# Check if uploaded file is a PDF
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+# Session IDs are random and issued by the server, never derived from the idea text, so
+# neither a shared idea nor knowing it gives access to another user's chat or usage
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{22}$")
+
+def generate_session_id():
+    return secrets.token_urlsafe(16)
+
+# A client-supplied session ID if it has the issued format, else None
+def session_id_from(value):
+    return value if value and SESSION_ID_PATTERN.match(value) else None
+
+# Per-session shortlist state (idea, query vector, per-sector candidate vector scores) and the
+# version of each report saved for it, so /rerank never re-embeds, re-searches or re-reports
+SHORTLIST_SESSIONS = "shortlist_sessions"
+SHORTLIST_TOP_N = 5
+
+# === Country pipeline ===
+
+# Shortlist → reports → graphs for one idea
+# Returns (final_codes, usage summary); LLM calls past PIPELINE_TOKEN_BUDGET are skipped
+def run_country_pipeline(idea, session_id):
+    with request_ledger("run_pipeline", session_id=session_id, budget_tokens=PIPELINE_TOKEN_BUDGET) as ledger, \
+            span("run_pipeline", session_id=session_id):
+        # All stages share the one pooled client; hand them their collections explicitly
+        profiles_col = get_collection("country_profiles")
+        semantics_col = get_collection("country_semantics")
+
+        state = build_shortlist_state(idea, semantics_col=semantics_col)
+        final_top = rank_shortlist(state, SHORTLIST_TOP_N, semantics_col=semantics_col, profiles_col=profiles_col)
+        final_codes = [c["country_code"] for c in final_top]
+
+        reported = report_countries(idea, final_top, profiles_col)
+
+        get_collection(SHORTLIST_SESSIONS).update_one(
+            {"session_id": session_id},
+            {"$set": {"session_id": session_id, "state": state, "top_countries": final_codes,
+                      "reported": reported, "weights": None, "sectors": state["sectors"]}},
+            upsert=True
+        )
+        return final_codes, ledger.summary()
+
+# Reports and graphs for shortlisted countries; returns {country_code: report_version} for the saved reports
+def report_countries(idea, shortlist, profiles_col):
+    reported = generate_final_reports(idea, shortlist, profiles_col=profiles_col,
+                                      reports_col=get_collection("country_reports"))
+    graph_col = get_collection("country_graphs")
+    for item in shortlist:
+        generate_country_graphs(item["country_code"], profiles_col, graph_col)
+    return reported
+
+# Countries in `shortlist` without a current report for this session: never saved (skipped or
+# failed), or replaced since by another session's report for the same country
+def countries_to_report(shortlist, reported):
+    codes = [item["country_code"] for item in shortlist]
+    current = {
+        doc["country_code"]: doc.get("report_version")
+        for doc in get_collection("country_reports").find(
+            {"country_code": {"$in": codes}}, {"_id": 0, "country_code": 1, "report_version": 1}
+        )
+    }
+    return [
+        item for item in shortlist
+        if not reported.get(item["country_code"]) or current.get(item["country_code"]) != reported[item["country_code"]]
+    ]
+
+# Checks /rerank-style overrides; returns the resolved weights (None = WEIGHTS)
+def validate_overrides(weights, sectors, top_n):
+    weights = resolve_weights(weights)
+    if sectors is not None and not isinstance(sectors, list):
+        raise ValueError("sectors must be a list")
+    unknown = [s for s in sectors or [] if s not in SECTORS]
+    if unknown:
+        raise ValueError(f"Unknown sector(s): {', '.join(unknown)}")
+    if not 1 <= top_n <= 20:
+        raise ValueError("top_n must be between 1 and 20")
+    return weights
+
+def load_shortlist_session(session_id):
+    session = get_collection(SHORTLIST_SESSIONS).find_one({"session_id": session_id}, {"_id": 0})
+    if not session:
+        raise LookupError(f"No shortlist for session {session_id}; run the pipeline first")
+    return session
+
+# Stores candidates retrieved for sectors the session had not searched yet
+def save_new_candidates(session_id, state, cached_sectors):
+    if set(state["candidates"]) != cached_sectors:
+        get_collection(SHORTLIST_SESSIONS).update_one(
+            {"session_id": session_id}, {"$set": {"state.candidates": state["candidates"]}}
+        )
+
+# Re-ranks a session's cached candidates under custom weights and/or sectors; only countries
+# without a current report for the session get reports.
+# Raises LookupError for an unknown session and ValueError for invalid weights or sectors
+def rerank_country_pipeline(session_id, weights=None, sectors=None, top_n=SHORTLIST_TOP_N):
+    weights = validate_overrides(weights, sectors, top_n)
+    session = load_shortlist_session(session_id)
+
+    with request_ledger("rerank", session_id=session_id, budget_tokens=PIPELINE_TOKEN_BUDGET) as ledger, \
+            span("rerank", session_id=session_id):
+        profiles_col = get_collection("country_profiles")
+        state = session["state"]
+        cached_sectors = set(state["candidates"])
+
+        top = rank_shortlist(state, top_n, sectors=sectors, weights=weights,
+                             semantics_col=get_collection("country_semantics"), profiles_col=profiles_col)
+        codes = [c["country_code"] for c in top]
+        # Sessions stored before reports were versioned hold a plain list: re-check those countries
+        reported = session["reported"] if isinstance(session.get("reported"), dict) else {}
+        entrants = countries_to_report(top, reported)
+        set_attrs(entrants=len(entrants))
+
+        new_reports = report_countries(state["idea"], entrants, profiles_col) if entrants else {}
+        reported.update(new_reports)
+
+        save_new_candidates(session_id, state, cached_sectors)
+        get_collection(SHORTLIST_SESSIONS).update_one({"session_id": session_id}, {"$set": {
+            "top_countries": codes, "weights": weights, "sectors": sectors or state["sectors"],
+            "reported": reported
+        }})
+
+        return {
+            "top_countries": codes,
+            "ranking": top,
+            "new_countries": list(new_reports),
+            "usage": ledger.summary()
+        }
+
+# Monte Carlo rank stability of a session's shortlist (see sensitivity.py). Weights and sectors
+# default to the session's current ones (as last set by /rerank)
+def shortlist_sensitivity(session_id, weights=None, sectors=None, top_n=SHORTLIST_TOP_N, samples=None,
+                          impute=True):
+    weights = validate_overrides(weights, sectors, top_n)
+    if samples is not None and not 100 <= samples <= SENSITIVITY_MAX_SAMPLES:
+        raise ValueError(f"samples must be between 100 and {SENSITIVITY_MAX_SAMPLES}")
+    session = load_shortlist_session(session_id)
+
+    with span("sensitivity", session_id=session_id):
+        state = session["state"]
+        cached_sectors = set(state["candidates"])
+        sectors = sectors or session.get("sectors") or state["sectors"]
+        hits = candidate_hits(state, sectors, get_collection("country_semantics"))
+        components = get_static_components(list(hits), get_collection("country_profiles"))
+        save_new_candidates(session_id, state, cached_sectors)
+
+        with analysis_slots:
+            report = analyze_sensitivity(hits, components, top_n=top_n, weights=weights or session.get("weights"),
+                                         samples=samples, impute=impute)
+        set_attrs(candidates=len(hits), samples=report["samples"])
+        return dict(report, sectors=sectors)
+
+# A JSON boolean, or the strings and numbers a form would send ("false", "0", "off", ...)
+def parse_flag(value, name, default=True):
+    if value is None:
+        return default
+    if isinstance(value, (bool, int)):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in ("true", "1", "yes", "on"):
+        return True
+    if text in ("false", "0", "no", "off"):
+        return False
+    raise ValueError(f"{name} must be a boolean")
+
+# Rate-limiter series: (stats key, Prometheus type, help text)
+LIMITER_METRICS = [
+    ("acquired", "counter", "Tokens handed out by the rate limiter"),
+    ("waited", "counter", "Acquisitions that had to wait for a token"),
+    ("wait_ms_total", "counter", "Total time spent waiting for tokens, in milliseconds"),
+    ("waiting", "gauge", "Callers currently waiting for a token"),
+]
+
+# Prometheus text: stage latency histograms, counters, Mongo pool and rate-limiter series
+def render_metrics():
+    lines = [histograms.prometheus_text()]
+    for key, value in pool_metrics().items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f"# TYPE globallaunch_mongo_pool_{key} gauge\ngloballaunch_mongo_pool_{key} {value}\n")
+    limiters = limiter_stats()
+    if limiters:
+        for key, kind, help_text in LIMITER_METRICS:
+            lines.append(f"# HELP globallaunch_rate_limiter_{key} {help_text}\n")
+            lines.append(f"# TYPE globallaunch_rate_limiter_{key} {kind}\n")
+            for name, stats in limiters.items():
+                lines.append(f'globallaunch_rate_limiter_{key}{{limiter="{name}"}} {stats[key]}\n')
+    return "".join(lines)
@@ -1,24 +1,19 @@
 # === graph_generator.py ===
 
-import os
 import re
-import matplotlib
-matplotlib.use('Agg')  # Use non-GUI backend for headless environments
-
-import matplotlib.pyplot as plt
-import numpy as np
 from collections import defaultdict
-from pymongo import MongoClient
-from dotenv import load_dotenv
 from io import BytesIO
-import base64
+from tracing import traced, set_attrs
+
+# matplotlib and numpy are imported on first chart render (see _pyplot) so that importing
+# this module is cheap. Collections are passed in by the caller (country_profiles for raw
+# numeric data, country_graphs for the generated images).
 
-# === Environment & Mongo Setup ===
-load_dotenv()  # Load .env variables
-client = MongoClient(os.getenv("MONGODB_URI"))  # Connect to MongoDB
-db = client[os.getenv("DB_NAME")]
-profiles_col = db["country_profiles"]  # Collection with raw numeric data
-graphs_col = db["country_graphs"]      # Collection to store generated graph images
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-GUI backend for headless environments
+    import matplotlib.pyplot as plt
+    return plt
 
 # === Field Definitions for Charting ===
 # Each category includes title, field set, and optional regex pattern for dynamic matching
@@ -89,6 +84,9 @@ def plot_grouped_bar_chart_to_bytes(data_dict, title):
     Returns:
         PNG image bytes.
     """
+    import numpy as np
+    plt = _pyplot()
+
     years = sorted(data_dict.keys())
     fields = sorted({f for y in data_dict.values() for f in y})
     n_years = len(years)
@@ -117,6 +115,7 @@ def plot_grouped_bar_chart_to_bytes(data_dict, title):
 
 
 # === Main Driver Function ===
+@traced("generate_country_graphs")
 def generate_country_graphs(country_code, profiles_col, graphs_col):
     """
     Generates missing indicator charts for a given country and stores them in MongoDB.
@@ -130,6 +129,7 @@ def generate_country_graphs(country_code, profiles_col, graphs_col):
     required_categories = set(FIELDS.keys())
 
     # Skip country if all categories are already present
+    set_attrs(country_code=country_code, cache_hit=existing_categories == required_categories)
     if existing_categories == required_categories:
         print(f"Skipping {country_code} — graphs already cached.")
         return
@@ -0,0 +1,107 @@
+# prefilter.py
+# Per-sector bounds that let the shortlist find its top N without scoring every country.
+#
+# For each sector we keep the centroid of its summary embeddings, every country's unit
+# embedding and its angle to the centroid. By the triangle inequality on angles, a country's cosine similarity to a
+# query is at most cos(|θ(query, centroid) − θ(centroid, country)|), so one dot product
+# with the centroid bounds the vector score of the whole sector. Together with each
+# country's static score components (static_scores.py) this bounds the final score, and
+# get_final_shortlist.prefilter_top_n scores countries exactly, from the embeddings held
+# here, in bound order, stopping once no remaining bound can reach the current top N. A
+# sector's table is built from Mongo on first use and rebuilt after PREFILTER_TTL_SECONDS.
+
+import os
+import re
+import math
+import time
+import operator
+import threading
+from array import array
+from services import collection_key, get_collection
+
+# Rebuild interval for the in-memory sector tables
+PREFILTER_TTL_SECONDS = float(os.getenv("PREFILTER_TTL_SECONDS", 600))
+
+# Absorbs float error in acos so a bound never undercuts the exact score
+ANGLE_SLACK = 1e-6
+
+# === Geometry ===
+
+def unit(vector):
+    norm = math.sqrt(sum(map(operator.mul, vector, vector)))
+    return [x / norm for x in vector] if norm else None
+
+
+def angle(a, b):
+    """Angle between two unit vectors."""
+    return math.acos(max(-1.0, min(1.0, sum(map(operator.mul, a, b)))))
+
+# === Sector tables ===
+
+class SectorPrefilter:
+    """A sector's embedding centroid, each country's unit embedding and its angle to the centroid."""
+
+    def __init__(self, sector, docs, field):
+        self.sector = sector
+        # Unit embeddings as float arrays: 8 bytes per dimension instead of a list of floats
+        self.vectors = {}
+        for doc in docs:
+            vector = doc.get(field)
+            if isinstance(vector, list):
+                u = unit(vector)
+                if u:
+                    self.vectors[doc["country_code"]] = array("d", u)
+        total = [sum(column) for column in zip(*self.vectors.values())]
+        self.centroid = unit(total) if total else None
+        self.angles = {code: angle(self.centroid, u) for code, u in self.vectors.items()} if self.centroid else {}
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.angles)
+
+    def vector_bounds(self, query_vector):
+        """{country_code: highest vector score (on the [0, 1] vectorSearchScore scale) it can have}."""
+        query = unit(query_vector)
+        if not query or not self.centroid:
+            return {code: 1.0 for code in self.angles}
+        query_angle = angle(query, self.centroid)
+        return {
+            code: (1 + math.cos(max(0.0, abs(query_angle - country_angle) - ANGLE_SLACK))) / 2
+            for code, country_angle in self.angles.items()
+        }
+
+    def vector_score(self, query, code):
+        """Exact cosine similarity of a unit `query` to the country, on the same [0, 1] scale."""
+        if query is None:
+            return 0.5
+        return (1 + sum(map(operator.mul, query, self.vectors[code]))) / 2
+
+
+_sectors = {}
+_sectors_source = None
+_lock = threading.Lock()
+
+
+def get_sector_prefilter(sector, field, semantics_col=None):
+    """The sector's table, rebuilt when stale or when a different collection is passed in."""
+    global _sectors_source
+    semantics_col = semantics_col if semantics_col is not None else get_collection("country_semantics")
+    source = collection_key(semantics_col)
+    key = (sector.lower(), field)
+    with _lock:
+        if _sectors_source != source:
+            _sectors.clear()
+            _sectors_source = source
+        table = _sectors.get(key)
+        if table is None or time.time() - table.built_at > PREFILTER_TTL_SECONDS:
+            docs = semantics_col.find(
+                {"sector": {"$regex": f"^{re.escape(sector)}$", "$options": "i"}},
+                {"_id": 0, "country_code": 1, field: 1}
+            )
+            table = _sectors[key] = SectorPrefilter(sector, docs, field)
+        return table
+
+
+def invalidate_prefilter():
+    with _lock:
+        _sectors.clear()
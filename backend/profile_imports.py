@@ -0,0 +1,80 @@
+# profile_imports.py
+# Import-time profile for the backend modules.
+#
+# Each module is imported in a fresh interpreter with `python -X importtime`, so the
+# numbers match what a new gunicorn worker pays before serving its first request.
+# The report also lists any service the import built eagerly (there should be none).
+#
+# Usage (from backend/):  python profile_imports.py [module ...] [--top N]
+
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+DEFAULT_MODULES = [
+    "app",
+    "chatbot",
+    "fallback_sector_detection",
+    "get_final_shortlist",
+    "generate_country_reports",
+    "pdf_reader",
+    "plot_graphs",
+]
+
+
+def profile_module(module):
+    """
+    Returns (total_ms, heaviest, built_services, error) where `heaviest` is a list of
+    (self_ms, package) sorted by the time spent in each package itself.
+    """
+    code = f"import {module}, services; print(sorted(services._registry))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+
+    total_us, rows = 0, []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(self_us) / 1000, name.strip()))
+        if name.strip() == module:
+            total_us = int(cumulative_us)
+
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed"
+        return total_us / 1000, [], [], error
+
+    built = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else "[]"
+    return total_us / 1000, sorted(rows, reverse=True), built, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time profile for backend modules")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=5, help="heaviest packages to list per module")
+    args = parser.parse_args()
+
+    print(f"{'module':<28}{'import ms':>10}  services built at import")
+    print("-" * 72)
+    details = []
+    for module in args.modules:
+        total_ms, heaviest, built, error = profile_module(module)
+        status = f"ERROR: {error}" if error else built
+        print(f"{module:<28}{total_ms:>10.1f}  {status}")
+        details.append((module, heaviest[:args.top]))
+
+    for module, heaviest in details:
+        if not heaviest:
+            continue
+        print(f"\n{module} — heaviest imports (self time):")
+        for self_ms, name in heaviest:
+            print(f"  {self_ms:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
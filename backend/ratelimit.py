@@ -0,0 +1,110 @@
+# ratelimit.py
+# Process-wide token-bucket rate limiters for the external APIs (Gemini, Vertex AI).
+#
+# Callers block in `acquire()` until a slot frees up instead of firing requests that the
+# API would reject with 429s and then retrying with backoff. Every wait is counted, so
+# /metrics and the load-test driver can tell when the limiter is the bottleneck.
+
+import os
+import time
+import asyncio
+import threading
+
+# Requests per minute for Gemini text generation; 0 disables the limiter
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0))
+
+
+class RateLimiter:
+    """Token bucket: refills at `rate_per_minute`, holds at most `burst` tokens."""
+
+    def __init__(self, name, rate_per_minute, burst=None):
+        self.name = name
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = burst or max(1, int(self.rate_per_second))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "waited": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0, "waiting": 0}
+
+    @property
+    def enabled(self):
+        return self.rate_per_second > 0
+
+    def _reserve(self, tokens):
+        """Takes `tokens` now (possibly going negative) and returns how long to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_per_second)
+            self._updated = now
+            self._tokens -= tokens
+            self._stats["acquired"] += 1
+            return max(0.0, -self._tokens / self.rate_per_second)
+
+    def _record_wait(self, wait):
+        with self._lock:
+            self._stats["waited"] += 1
+            self._stats["wait_ms_total"] += wait * 1000
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait * 1000)
+
+    def _waiting(self, delta):
+        with self._lock:
+            self._stats["waiting"] += delta
+
+    def acquire(self, tokens=1):
+        if not self.enabled:
+            return 0.0
+        wait = self._reserve(tokens)
+        if wait:
+            self._record_wait(wait)
+            self._waiting(1)
+            try:
+                time.sleep(wait)
+            finally:
+                self._waiting(-1)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        if not self.enabled:
+            return 0.0
+        wait = self._reserve(tokens)
+        if wait:
+            self._record_wait(wait)
+            self._waiting(1)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._waiting(-1)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["rate_per_minute"] = self.rate_per_second * 60
+        stats["burst"] = self.burst
+        stats["wait_ms_total"] = round(stats["wait_ms_total"], 1)
+        stats["wait_ms_max"] = round(stats["wait_ms_max"], 1)
+        return stats
+
+# === Registry ===
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name, rate_per_minute=0, burst=None):
+    """Returns the shared limiter `name`, creating it with the given rate on first use."""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = RateLimiter(name, rate_per_minute, burst)
+        return limiter
+
+
+def get_llm_limiter():
+    return get_limiter("gemini", LLM_REQUESTS_PER_MINUTE)
+
+
+def limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,191 @@
+# schemas.py
+# Response schemas for every JSON-producing Gemini call, plus a small validator and
+# per-field repairs.
+#
+# Schemas use Gemini's OpenAPI subset (uppercase types). They are sent as
+# `response_schema` together with `response_mime_type="application/json"`. The
+# validator also enforces `minItems`/`maxItems`, which are stripped before sending
+# (see `to_gemini_schema`).
+
+SECTORS = [
+    "fintech", "healthtech", "edtech", "ecommerce", "cleantech",
+    "logistics", "SaaS", "cybersecurity", "AI-ML", "retail",
+    "agritech", "mobility", "proptech", "govtech", "biotech"
+]
+
+INSIGHT_KEYS = [
+    "business_environment",
+    "infrastructure_and_digital",
+    "economic_and_trade_outlook",
+    "regulatory_and_risk",
+    "entry_considerations",
+]
+
+ENTRY_KEYS = ["market_opportunity_signals", "sector_specific_notes", "go_to_market_advice"]
+
+
+def string_list(min_items=1, max_items=None):
+    schema = {"type": "ARRAY", "items": {"type": "STRING"}, "minItems": min_items}
+    if max_items:
+        schema["maxItems"] = max_items
+    return schema
+
+
+def sector_list_schema(max_results=3):
+    return {
+        "type": "ARRAY",
+        "items": {"type": "STRING", "enum": SECTORS},
+        "minItems": 1,
+        "maxItems": max_results,
+    }
+
+
+# One chunk's insights (generate_country_reports.CHUNK_PROMPT)
+CHUNK_INSIGHTS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {key: string_list(1, 3) for key in INSIGHT_KEYS},
+    "required": INSIGHT_KEYS,
+}
+
+# The final founder-facing report (generate_country_reports.FINAL_REPORT_PROMPT)
+REPORT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "executive_summary": {"type": "STRING"},
+        **{key: string_list(1) for key in INSIGHT_KEYS[:-1]},
+        "entry_considerations": {
+            "type": "OBJECT",
+            "properties": {key: string_list(1) for key in ENTRY_KEYS},
+            "required": ENTRY_KEYS,
+        },
+    },
+    "required": ["executive_summary"] + INSIGHT_KEYS,
+}
+
+# Sector profile from one chunk (generate_semantics_from_chunks.CHUNK_PROMPT_TEMPLATE).
+# Gemini schemas cannot describe free-form maps, so indicators come back as name/value pairs.
+SEMANTIC_PROFILE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "summary": {"type": "STRING"},
+        "indicators": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"name": {"type": "STRING"}, "value": {"type": "STRING"}},
+                "required": ["name", "value"],
+            },
+        },
+    },
+    "required": ["summary", "indicators"],
+}
+
+
+def multi_sector_profile_schema(sectors):
+    """One SEMANTIC_PROFILE_SCHEMA per sector, keyed by sector name (multi-sector prompt)."""
+    return {
+        "type": "OBJECT",
+        "properties": {sector: SEMANTIC_PROFILE_SCHEMA for sector in sectors},
+        "required": list(sectors),
+    }
+
+# Keys Gemini accepts in response_schema; the rest are validator-only
+_GEMINI_KEYS = {"type", "format", "description", "nullable", "enum", "items", "properties", "required"}
+
+
+def to_gemini_schema(schema):
+    """Copy of `schema` with validator-only keywords removed."""
+    result = {}
+    for key, value in schema.items():
+        if key not in _GEMINI_KEYS:
+            continue
+        if key == "properties":
+            value = {name: to_gemini_schema(sub) for name, sub in value.items()}
+        elif key == "items":
+            value = to_gemini_schema(value)
+        result[key] = value
+    return result
+
+# === Validation ===
+
+_TYPES = {
+    "OBJECT": dict,
+    "ARRAY": list,
+    "STRING": str,
+    "NUMBER": (int, float),
+    "INTEGER": int,
+    "BOOLEAN": bool,
+}
+
+
+def validate(value, schema, path=""):
+    """Returns a list of (path, message) problems; empty when `value` matches `schema`."""
+    expected = _TYPES[schema["type"]]
+    if not isinstance(value, expected) or (schema["type"] in ("NUMBER", "INTEGER") and isinstance(value, bool)):
+        return [(path, f"expected {schema['type'].lower()}, got {type(value).__name__}")]
+
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append((path, f"{value!r} is not one of the allowed values"))
+    if schema["type"] == "ARRAY":
+        if len(value) < schema.get("minItems", 0):
+            errors.append((path, f"needs at least {schema['minItems']} items"))
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append((path, f"allows at most {schema['maxItems']} items"))
+        for i, item in enumerate(value):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    elif schema["type"] == "OBJECT":
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append((_join(path, key), "missing"))
+        for key, sub in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate(value[key], sub, _join(path, key)))
+    return errors
+
+
+def _join(path, key):
+    return f"{path}.{key}" if path else key
+
+
+def top_level_field(path):
+    """'entry_considerations.go_to_market_advice[1]' → 'entry_considerations'."""
+    return path.split(".", 1)[0].split("[", 1)[0]
+
+# === Local repairs ===
+# Cheap fixes applied before anything is re-asked. Each returns the repaired value
+# (which may still be invalid).
+
+def repair(value, schema):
+    kind = schema["type"]
+    if kind == "ARRAY":
+        if isinstance(value, str):
+            value = [value]          # A lone string where a list was expected
+        if not isinstance(value, list):
+            return value
+        items = [repair(item, schema["items"]) for item in value]
+        items = [item for item in items if not validate(item, schema["items"])]
+        if "maxItems" in schema:
+            items = items[:schema["maxItems"]]
+        return items
+    if kind == "OBJECT" and isinstance(value, dict):
+        repaired = dict(value)
+        for key, sub in schema.get("properties", {}).items():
+            if key in repaired:
+                repaired[key] = repair(repaired[key], sub)
+        return repaired
+    if kind == "STRING":
+        if isinstance(value, list) and all(isinstance(v, str) for v in value):
+            value = " ".join(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if isinstance(value, str) and "enum" in schema and value not in schema["enum"]:
+            matches = [e for e in schema["enum"] if e.lower() == value.strip().lower()]
+            value = matches[0] if matches else value
+        return value
+    if kind in ("NUMBER", "INTEGER") and isinstance(value, str):
+        try:
+            return int(value) if kind == "INTEGER" else float(value)
+        except ValueError:
+            return value
+    return value
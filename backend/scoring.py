@@ -0,0 +1,202 @@
+# scoring.py
+# The profile-only part of the shortlist score: indicator sub-scores, data coverage and
+# their weighted total. None of it depends on the user's idea, so static_scores.py
+# materializes it per country and get_final_shortlist only adds the vector score.
+
+import os
+import math
+
+# Weights for each scoring dimension
+WEIGHTS = {
+    "vector": 0.4,
+    "eodb": 0.15,
+    "macro": 0.08,        # Slightly dampened macro
+    "digital": 0.17,      # Slightly boosted digital
+    "trade": 0.08,        # Slightly capped trade
+    "fdi": 0.12,          # Slightly dampened FDI
+    "trend": float(os.getenv("SCORE_TREND_WEIGHT", 0))   # Indicator trends (timeseries.py), off by default
+}
+
+# Dimensions whose weighted sum is the static part of the score
+STATIC_DIMENSIONS = ["eodb", "macro", "digital", "trade", "fdi", "trend"]
+
+# Trade cap, and the micro-boost with the thresholds that earn it
+TRADE_CAP = 0.8
+BOOST = 0.01
+BOOST_MIN_VECTOR = 0.8
+BOOST_MIN_DIGITAL = 0.6
+BOOST_MIN_FDI = 1.1
+
+# Bumped when the components' layout changes, so materialized copies get rebuilt
+COMPONENTS_VERSION = 3
+
+# Indicator fields per dimension as (field suffix, lower is better); all on a 0-100 scale
+DIMENSION_FIELDS = {
+    # EODB (Ease of Doing Business) sub-scores
+    "eodb": [
+        ("ease_of_doing_business.starting_business_score", False),
+        ("ease_of_doing_business.getting_electricity.score", False),
+        ("ease_of_doing_business.registering_property.score", False),
+        ("ease_of_doing_business.getting_credit.score", False),
+        ("ease_of_doing_business.protecting_minority_investors.score", False),
+        ("ease_of_doing_business.paying_taxes.score", False),
+        ("ease_of_doing_business.trading_across_borders.score", False),
+        ("ease_of_doing_business.enforcing_contracts.score", False),
+        ("ease_of_doing_business.resolving_insolvency.score", False),
+        ("ease_of_doing_business.overall_score", False)
+    ],
+    # Macroeconomic indicators
+    "macro": [
+        ("macroeconomic_indicators.gdp_growth_percent", False),
+        ("macroeconomic_indicators.inflation_rate_percent", True),
+        ("macroeconomic_indicators.unemployment_rate_percent", True),
+        ("macroeconomic_indicators.current_account_balance_percent_gdp", False),
+        ("macroeconomic_indicators.public_debt_percent_of_gdp", True)
+    ],
+    # Digital infrastructure and readiness indicators
+    "digital": [
+        ("digital_connectivity.gsma_connectivity_index", False),
+        ("digital_connectivity.mobile_broadband_coverage_percent", False),
+        ("digital_connectivity.mobile_ownership_percent", False),
+        ("connectivity.affordability.device_affordability_40pct_usd", True),
+        ("connectivity.affordability.tax_mobile_data_percent", True),
+        ("connectivity.affordability.tax_handsets_percent", True),
+        ("connectivity.affordability.sector_specific_taxes_percent", True),
+        ("connectivity.consumer_readiness.literacy_percent", False),
+        ("connectivity.content_and_services.e_government_score", False),
+        ("connectivity.content_and_services.social_media_penetration_percent", False),
+        ("connectivity.online_security.cybersecurity_index_score", False)
+    ],
+    # Trade indicators (the dimension is capped to TRADE_CAP to avoid overboosting)
+    "trade": [
+        ("trade_profile.average_applied_tariff_percent", True),
+        ("trade_profile.binding_tariff_coverage_percent", False),
+        ("trade_profile.import_duties_on_capital_goods_percent", True),
+        ("trade_profile.import_duties_on_intermediate_goods_percent", True),
+        ("trade_profile.duty_free_import_share_percent", False)
+    ]
+}
+
+# FDI indicators (USD millions, log-scaled)
+FDI_FIELDS = [
+    "foreign_direct_investment.fdi_net_inflows_usd_millions",
+    "foreign_direct_investment.fdi_inward_stock_usd_millions"
+]
+
+# Per-request weights: WEIGHTS with the given dimensions replaced
+def resolve_weights(overrides):
+    if not overrides:
+        return None
+    if not isinstance(overrides, dict):
+        raise ValueError("Weights must be an object of dimension → weight")
+    unknown = set(overrides) - set(WEIGHTS)
+    if unknown:
+        raise ValueError(f"Unknown weight(s): {', '.join(sorted(unknown))}")
+    weights = dict(WEIGHTS)
+    for dim, value in overrides.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 10:
+            raise ValueError(f"Weight '{dim}' must be a number between 0 and 10")
+        weights[dim] = float(value)
+    return weights
+
+# === Field Utilities ===
+
+# Extract latest value for a field that ends with the given suffix
+def get_latest_field(data, suffix):
+    values = [(k, v) for k, v in data.items() if k.endswith(suffix) and isinstance(v, (int, float))]
+    if not values:
+        return None
+    return sorted(values, key=lambda x: x[0], reverse=True)[0][1]
+
+# Normalize a value to 0-1 range (optionally invert it)
+def safe_norm(val, max_val=100, invert=False):
+    if val is None:
+        return 0.0
+    norm = min(val / max_val, 1.0)
+    return 1.0 - norm if invert else norm
+
+# Apply log scaling to reduce skew of large values
+def log_scale(val):
+    return math.log(val + 1) / 10 if val and val > 0 else 0.0
+
+# === Static components: every sub-score that depends only on the profile ===
+# `trend` is the country's entry from timeseries.trend_components, computed here when not given
+def compute_static_components(flat, trend=None):
+    valid_fields = 0
+    total_fields = 0
+    observed = {}
+
+    # Local utility to normalize and track field coverage (None = no data)
+    def norm_and_count(field, invert=False, max_val=100):
+        nonlocal valid_fields, total_fields
+        total_fields += 1
+        val = get_latest_field(flat, field)
+        if val is None:
+            return None
+        valid_fields += 1
+        return safe_norm(val, max_val=max_val, invert=invert)
+
+    # Mean over a dimension's fields, missing ones counting as 0; the share of fields with
+    # data and their mean are kept so sensitivity analysis can impute the rest
+    def dimension(name, values):
+        present = [v for v in values if v is not None]
+        observed[name] = {
+            "share": len(present) / len(values),
+            "mean": sum(present) / len(present) if present else 0.0
+        }
+        return sum(present) / len(values)
+
+    def field_dimension(name):
+        return dimension(name, [norm_and_count(f, invert=inv) for f, inv in DIMENSION_FIELDS[name]])
+
+    eodb = field_dimension("eodb")
+    macro = field_dimension("macro")
+    digital = field_dimension("digital")
+    trade = min(field_dimension("trade"), TRADE_CAP)
+
+    # FDI indicators (log-scaled)
+    fdi_vals = [get_latest_field(flat, f) for f in FDI_FIELDS]
+    total_fields += len(fdi_vals)
+    valid_fields += sum(v is not None for v in fdi_vals)
+    fdi = dimension("fdi", [log_scale(v) if v is not None else None for v in fdi_vals])
+
+    # Data coverage adjustment (boost for countries with more complete data)
+    coverage = valid_fields / total_fields if total_fields > 0 else 1.0
+    coverage_adjust = 0.5 + 0.5 * coverage
+
+    components = {
+        "eodb": eodb, "macro": macro, "digital": digital, "trade": trade, "fdi": fdi,
+        "coverage": coverage, "coverage_adjust": coverage_adjust, "observed": observed
+    }
+    if trend is None:
+        from timeseries import trend_components
+        trend = trend_components({None: flat})[None]
+    components.update(trend)
+    # Weighted non-vector part of the score
+    components["static"] = static_total(components)
+    return components
+
+def static_total(components, weights=None):
+    weights = weights or WEIGHTS
+    return sum(components[dim] * weights[dim] for dim in STATIC_DIMENSIONS)
+
+# === Final score: the static part plus the weighted vector score ===
+
+# Additional micro-boost for AI/digital/FDI-heavy performers (e.g. India)
+def boost_eligible(components):
+    return components["digital"] > BOOST_MIN_DIGITAL and components["fdi"] > BOOST_MIN_FDI
+
+# `weights` overrides WEIGHTS for one request; otherwise the stored static total is reused
+def _raw_score(vec_score, components, weights):
+    static = components["static"] if weights is None else static_total(components, weights)
+    score = (vec_score * (weights or WEIGHTS)["vector"] + static) * components["coverage_adjust"]
+    if vec_score > BOOST_MIN_VECTOR and boost_eligible(components):
+        score += BOOST
+    return score
+
+def combine_score(vec_score, components, weights=None):
+    return round(_raw_score(vec_score, components, weights), 4)
+
+# Highest score reachable with a vector score of at most `max_vec_score`
+def score_upper_bound(max_vec_score, components, weights=None):
+    return _raw_score(max_vec_score, components, weights)
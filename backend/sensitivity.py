@@ -0,0 +1,206 @@
+# sensitivity.py
+# Rank stability of a shortlist under perturbed weights and imputed missing data.
+#
+# Every candidate country becomes a row of one matrix (vector score, the static
+# sub-scores and trend score, coverage adjustment), and SENSITIVITY_SAMPLES scenarios
+# are scored with NumPy, SENSITIVITY_CHUNK at a time so the imputed
+# (scenarios, countries, dimensions) arrays stay a few MB. In each scenario:
+#   - every weight in WEIGHTS is scaled by a log-normal factor (spread SENSITIVITY_WEIGHT_SIGMA),
+#     then all weights are rescaled to their original total
+#   - with imputation on, the missing share of each sub-score is filled with the observed
+#     mean of a random country that has data for that dimension
+# The trade cap and the micro-boost are re-applied per scenario. The coverage adjustment
+# stays as it is: it is the score's policy on incomplete data, not an estimate.
+#
+# The report gives each contender's chance of making the top N, its rank and score bands,
+# what moves its rank (rank correlation with each weight and with its imputed data), and
+# how often the top-N set as a whole stays the same.
+
+import os
+import threading
+from scoring import (WEIGHTS, STATIC_DIMENSIONS, TRADE_CAP, BOOST, BOOST_MIN_VECTOR,
+                     BOOST_MIN_DIGITAL, BOOST_MIN_FDI)
+
+# Scenarios per analysis, and the upper limit a request may ask for
+SENSITIVITY_SAMPLES = int(os.getenv("SENSITIVITY_SAMPLES", 2000))
+SENSITIVITY_MAX_SAMPLES = int(os.getenv("SENSITIVITY_MAX_SAMPLES", 5000))
+
+# Scenarios scored per batch
+SENSITIVITY_CHUNK = int(os.getenv("SENSITIVITY_CHUNK", 500))
+
+# Analyses running at once per process; each holds the CPU for its whole run
+SENSITIVITY_CONCURRENCY = int(os.getenv("SENSITIVITY_CONCURRENCY", 2))
+analysis_slots = threading.BoundedSemaphore(SENSITIVITY_CONCURRENCY)
+
+# Log-normal spread of the weight multipliers (0.25 ≈ ±25%)
+SENSITIVITY_WEIGHT_SIGMA = float(os.getenv("SENSITIVITY_WEIGHT_SIGMA", 0.25))
+
+# Countries outside the base top N are reported when they make it this often
+CONTENDER_MIN_SHARE = 0.05
+
+# Drivers listed per country
+TOP_DRIVERS = 3
+
+FACTORS = ["vector"] + STATIC_DIMENSIONS
+
+# === Matrix ===
+
+def build_matrix(hits, components):
+    """
+    Arrays for the candidates in `hits` ({code: {"score", ...}}) with static `components`:
+    codes, vector scores (C,), sub-scores (C, D), observed shares and means (C, D) and
+    coverage adjustments (C,). Dimensions without an `observed` breakdown (e.g. trend) count as complete.
+    """
+    import numpy as np
+
+    codes = list(hits)
+    vectors = np.array([hits[code]["score"] for code in codes], dtype=float)
+    subs = np.array([[components[code][dim] for dim in STATIC_DIMENSIONS] for code in codes], dtype=float)
+    shares = np.ones_like(subs)
+    means = subs.copy()
+    for row, code in enumerate(codes):
+        observed = components[code].get("observed") or {}
+        for d, dim in enumerate(STATIC_DIMENSIONS):
+            if dim in observed:
+                shares[row, d] = observed[dim]["share"]
+                means[row, d] = observed[dim]["mean"]
+    coverage = np.array([components[code]["coverage_adjust"] for code in codes], dtype=float)
+    return codes, vectors, subs, shares, means, coverage
+
+# === Scoring ===
+
+def score_matrix(weights, vectors, subs, coverage):
+    """Scores for S weight rows (S, 1 + D) against C countries; `subs` is (C, D) or (S, C, D)."""
+    import numpy as np
+
+    digital = subs[..., STATIC_DIMENSIONS.index("digital")]
+    fdi = subs[..., STATIC_DIMENSIONS.index("fdi")]
+    if subs.ndim == 3:
+        static = np.einsum("scd,sd->sc", subs, weights[:, 1:])
+    else:
+        static = weights[:, 1:] @ subs.T
+    scores = (weights[:, :1] * vectors + static) * coverage
+    boosted = (vectors > BOOST_MIN_VECTOR) & (digital > BOOST_MIN_DIGITAL) & (fdi > BOOST_MIN_FDI)
+    return scores + BOOST * boosted
+
+
+def ranks_of(scores):
+    """1-based ranks per row, best score first; ties keep candidate order."""
+    import numpy as np
+
+    order = np.argsort(-scores, axis=-1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, scores.shape[-1] + 1), axis=-1)
+    return ranks
+
+
+def _correlations(x, y, paired=False):
+    """
+    Pearson correlation of every column of x (S, F) with every column of y (S, C) → (F, C),
+    or with paired=True of each column of x with the same column of y → (C,). Constant columns give 0.
+    """
+    import numpy as np
+
+    x = x - x.mean(axis=0)
+    y = y - y.mean(axis=0)
+    x_norm, y_norm = np.sqrt((x ** 2).sum(axis=0)), np.sqrt((y ** 2).sum(axis=0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if paired:
+            corr = (x * y).sum(axis=0) / (x_norm * y_norm)
+        else:
+            corr = (x.T @ y) / np.outer(x_norm, y_norm)
+    return np.nan_to_num(corr)
+
+# === Analysis ===
+
+def analyze(hits, components, top_n=5, weights=None, samples=None, weight_sigma=None,
+            impute=True, seed=0):
+    """
+    Monte Carlo rank stability for the candidates in `hits`; `weights` are the base weights
+    (default WEIGHTS). Returns a JSON-ready report.
+    """
+    import numpy as np
+
+    samples = min(samples or SENSITIVITY_SAMPLES, SENSITIVITY_MAX_SAMPLES)
+    weight_sigma = SENSITIVITY_WEIGHT_SIGMA if weight_sigma is None else weight_sigma
+    base_weights = np.array([(weights or WEIGHTS)[f] for f in FACTORS], dtype=float)
+    codes, vectors, subs, shares, means, coverage = build_matrix(hits, components)
+    if not codes:
+        return {"samples": 0, "top_n": top_n, "stability": None, "countries": []}
+    top_n = min(top_n, len(codes))
+    rng = np.random.default_rng(seed)
+
+    # Base case: the ranking rank_shortlist produces (scores rounded the same way)
+    base_scores = np.round(score_matrix(base_weights[None, :], vectors, subs, coverage)[0], 4)
+    base_ranks = ranks_of(base_scores)
+
+    # Weight scenarios: log-normal multipliers, rescaled to the original total
+    log_factors = rng.normal(-weight_sigma ** 2 / 2, weight_sigma, size=(samples, len(FACTORS)))
+    sampled = base_weights * np.exp(log_factors)
+    sampled *= base_weights.sum() / sampled.sum(axis=1, keepdims=True)
+
+    # Imputation scenarios: each missing share takes a random donor's observed mean
+    imputing = impute and (shares < 1).any()
+    pools = [means[shares[:, d] > 0, d] for d in range(len(STATIC_DIMENSIONS))]
+    trade = STATIC_DIMENSIONS.index("trade")
+    scores = np.empty((samples, len(codes)))
+    uplift = np.zeros((samples, len(codes)))
+    for start in range(0, samples, SENSITIVITY_CHUNK):
+        chunk = slice(start, min(start + SENSITIVITY_CHUNK, samples))
+        scenario_subs = subs
+        if imputing:
+            size = (chunk.stop - chunk.start, len(codes))
+            donors = np.stack([rng.choice(pool, size=size) if pool.size else np.zeros(size) for pool in pools], axis=-1)
+            raw = shares * means + (1 - shares) * donors
+            raw[..., trade] = np.minimum(raw[..., trade], TRADE_CAP)
+            scenario_subs = raw
+            uplift[chunk] = (raw - subs).sum(axis=2)
+        scores[chunk] = score_matrix(sampled[chunk], vectors, scenario_subs, coverage)
+    ranks = ranks_of(scores)
+    in_top = ranks <= top_n
+
+    # Whole-set stability: how often the top N matches the base top N, and the mean overlap
+    base_top = base_ranks <= top_n
+    overlap = (in_top & base_top).sum(axis=1) / top_n
+
+    # Drivers: a positive effect means raising the factor improves the country's rank
+    effects = -_correlations(log_factors, ranks.astype(float))
+    imputation_effect = -_correlations(uplift, ranks.astype(float), paired=True)
+
+    p_top = in_top.mean(axis=0)
+    rank_bands = np.percentile(ranks, [5, 50, 95], axis=0)
+    score_bands = np.percentile(scores, [5, 95], axis=0)
+    contributions = np.column_stack([base_weights[0] * vectors, subs * base_weights[1:]]) * coverage[:, None]
+
+    countries = []
+    for c in np.argsort(base_ranks):
+        if not base_top[c] and p_top[c] < CONTENDER_MIN_SHARE:
+            continue
+        # Factors weighted 0 (e.g. trend by default) stay 0 in every scenario, so any correlation is noise
+        drivers = [(f"weight:{factor}", effects[f, c]) for f, factor in enumerate(FACTORS) if base_weights[f]]
+        if shares[c].min() < 1 and impute:
+            drivers.append(("missing_data", imputation_effect[c]))
+        drivers.sort(key=lambda item: -abs(item[1]))
+        countries.append({
+            "country_code": codes[c],
+            "base_rank": int(base_ranks[c]),
+            "base_score": float(base_scores[c]),
+            "p_top_n": round(float(p_top[c]), 3),
+            "rank_band": [int(round(r)) for r in rank_bands[:, c]],
+            "score_band": [round(float(s), 4) for s in score_bands[:, c]],
+            "data_completeness": round(float(shares[c].mean()), 3),
+            "contributions": {factor: round(float(contributions[c, f]), 4) for f, factor in enumerate(FACTORS)},
+            "drivers": [{"factor": name, "effect": round(float(effect), 3)} for name, effect in drivers[:TOP_DRIVERS]],
+        })
+
+    return {
+        "samples": samples,
+        "weight_sigma": weight_sigma,
+        "imputed": bool(impute and (shares < 1).any()),
+        "top_n": top_n,
+        "stability": {
+            "same_top_n": round(float((overlap == 1).mean()), 3),
+            "mean_overlap": round(float(overlap.mean()), 3),
+        },
+        "countries": countries,
+    }
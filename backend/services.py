@@ -0,0 +1,207 @@
+# services.py
+# Lazy registry for shared clients and models.
+#
+# Nothing here connects to Mongo, configures Gemini or loads Vertex AI at import time —
+# each service is built on first use and then reused by every module in the process.
+# Static and health routes therefore never pay for SDK imports or model setup.
+
+import os
+import threading
+from dotenv import load_dotenv
+from tracing import make_mongo_listener
+
+load_dotenv()
+
+_registry = {}
+_lock = threading.RLock()
+
+DEFAULT_GEMINI_MODEL = "gemini-1.5-pro"
+# Query and document embeddings must come from the same model (see embed_sector_profiles.py)
+DEFAULT_EMBEDDING_MODEL = os.getenv("EMBED_MODEL", "gemini-embedding-001")
+
+
+def _get_or_build(key, builder):
+    """Returns the service stored under `key`, building it once (thread-safe) if needed."""
+    service = _registry.get(key)
+    if service is None:
+        with _lock:
+            service = _registry.get(key)
+            if service is None:
+                service = builder()
+                _registry[key] = service
+    return service
+
+
+def override(key, service):
+    """Replaces a service (e.g. with an offline fake). Keys: "mongo", "genai", "gemini:<model>:<key env>", "embedding:<model>"."""
+    with _lock:
+        _registry[key] = service
+
+
+def reset():
+    """Forgets every built service; the next access rebuilds it."""
+    with _lock:
+        _registry.clear()
+
+
+def is_built(key):
+    return key in _registry
+
+# === MongoDB ===
+# One client (and so one connection pool + one set of monitor threads) per process,
+# shared by the API and every pipeline module.
+
+MONGO_POOL_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 20)),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_MS", 300000)),
+    "waitQueueTimeoutMS": int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000)),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000)),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 60000)),
+    "readPreference": os.getenv("MONGO_READ_PREFERENCE", "primaryPreferred"),
+    "appname": os.getenv("MONGO_APP_NAME", "globallaunch-ai"),
+}
+
+_pool_stats = {
+    "connections_created": 0,
+    "connections_closed": 0,
+    "checkouts": 0,
+    "checkout_failures": 0,
+    "checked_out": 0,
+    "max_checked_out": 0,
+    "checkout_wait_ms_total": 0.0,
+    "checkout_wait_ms_max": 0.0,
+    "pool_clears": 0,
+}
+_pool_stats_lock = threading.Lock()
+
+
+def _make_pool_listener():
+    from pymongo import monitoring
+
+    class PoolStatsListener(monitoring.ConnectionPoolListener):
+        """Feeds pymongo connection-pool events into `_pool_stats`."""
+
+        def _bump(self, **deltas):
+            with _pool_stats_lock:
+                for key, delta in deltas.items():
+                    _pool_stats[key] += delta
+                _pool_stats["max_checked_out"] = max(_pool_stats["max_checked_out"], _pool_stats["checked_out"])
+
+        def connection_created(self, event):
+            self._bump(connections_created=1)
+
+        def connection_closed(self, event):
+            self._bump(connections_closed=1)
+
+        def connection_checked_out(self, event):
+            wait_ms = (getattr(event, "duration", None) or 0.0) * 1000
+            self._bump(checkouts=1, checked_out=1, checkout_wait_ms_total=wait_ms)
+            with _pool_stats_lock:
+                _pool_stats["checkout_wait_ms_max"] = max(_pool_stats["checkout_wait_ms_max"], wait_ms)
+
+        def connection_checked_in(self, event):
+            self._bump(checked_out=-1)
+
+        def connection_check_out_failed(self, event):
+            self._bump(checkout_failures=1)
+
+        def pool_cleared(self, event):
+            self._bump(pool_clears=1)
+
+        # Remaining events are not tracked
+        def pool_created(self, event): pass
+        def pool_ready(self, event): pass
+        def pool_closed(self, event): pass
+        def connection_ready(self, event): pass
+        def connection_check_out_started(self, event): pass
+
+    return PoolStatsListener()
+
+
+def get_mongo_client():
+    def build():
+        from pymongo import MongoClient
+        return MongoClient(
+            os.getenv("MONGODB_URI"),
+            event_listeners=[_make_pool_listener(), make_mongo_listener()],
+            **MONGO_POOL_OPTIONS
+        )
+    return _get_or_build("mongo", build)
+
+
+def pool_metrics():
+    """Connection-pool counters for the shared client (all zero until Mongo is first used)."""
+    with _pool_stats_lock:
+        stats = dict(_pool_stats)
+    stats["open_connections"] = stats["connections_created"] - stats["connections_closed"]
+    stats["avg_checkout_wait_ms"] = round(stats["checkout_wait_ms_total"] / stats["checkouts"], 3) if stats["checkouts"] else 0.0
+    stats["client_built"] = is_built("mongo")
+    stats["options"] = dict(MONGO_POOL_OPTIONS)
+    return stats
+
+
+def get_db():
+    return get_mongo_client()[os.getenv("DB_NAME")]
+
+
+def get_collection(name):
+    return get_db()[name]
+
+
+def collection_key(collection):
+    """What in-process caches key a collection on: get_collection returns a new object per call."""
+    return (collection.database.name, collection.name)
+
+# === Gemini (google-generativeai) ===
+
+def get_genai():
+    """
+    Returns the `google.generativeai` module, configured with GOOGLE_API_KEY. configure()
+    is process-global, so it runs once here; other keys get their own client (below).
+    """
+    def build():
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        return genai
+    return _get_or_build("genai", build)
+
+
+def get_generative_client(api_key_env="GOOGLE_API_KEY"):
+    """A GenerativeServiceClient bound to the key in `api_key_env`."""
+    def build():
+        from google.ai import generativelanguage as glm
+        return glm.GenerativeServiceClient(client_options={"api_key": os.getenv(api_key_env)})
+    return _get_or_build(f"genai-client:{api_key_env}", build)
+
+
+def get_gemini_model(name=DEFAULT_GEMINI_MODEL, api_key_env="GOOGLE_API_KEY"):
+    def build():
+        model = get_genai().GenerativeModel(name)
+        if api_key_env != "GOOGLE_API_KEY":
+            # GenerativeModel takes no API key; it only falls back to the global client when unset
+            model._client = get_generative_client(api_key_env)
+        return model
+    return _get_or_build(f"gemini:{name}:{api_key_env}", build)
+
+# === Vertex AI embeddings ===
+
+def get_embedding_model(name=DEFAULT_EMBEDDING_MODEL):
+    def build():
+        import vertexai
+        from vertexai.preview.language_models import TextEmbeddingModel
+
+        credentials = None
+        credentials_path = os.getenv("GOOGLE_CLOUD_CREDENTIALS")
+        if credentials_path:
+            from google.oauth2 import service_account
+            credentials = service_account.Credentials.from_service_account_file(credentials_path)
+
+        vertexai.init(
+            project=os.getenv("PROJECT_ID"),
+            location="us-central1",
+            credentials=credentials
+        )
+        return TextEmbeddingModel.from_pretrained(name)
+    return _get_or_build(f"embedding:{name}", build)
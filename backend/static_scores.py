@@ -0,0 +1,132 @@
+# static_scores.py
+# Materializes each country's static score components in country_static_scores.
+#
+# Everything in the shortlist score except the vector similarity (the EODB, macro,
+# digital, trade and FDI sub-scores, indicator trends, data coverage and their weighted
+# total) depends only on the country's profile. This job computes it once per data
+# change; the shortlist loads the whole collection into memory (one small document per
+# country), refreshes it after STATIC_SCORES_TTL_SECONDS, and only adds the vector
+# score online.
+# Each document records a hash of its profile and of the scoring setup, so a rerun only
+# rewrites countries whose data (or WEIGHTS) changed. Run it after loading country_profiles.
+#
+#   python static_scores.py          # rebuild entries whose profile changed
+#   python static_scores.py --force  # rebuild every entry
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from services import collection_key, get_collection
+from scoring import COMPONENTS_VERSION, WEIGHTS, STATIC_DIMENSIONS, compute_static_components, static_total
+from timeseries import trend_components
+
+# === Config ===
+
+STATIC_SCORES = "country_static_scores"
+
+# Refresh interval for the in-memory table
+STATIC_SCORES_TTL_SECONDS = float(os.getenv("STATIC_SCORES_TTL_SECONDS", 600))
+
+# Changes with the weights or the components' layout, so stored copies are never silently out of date
+SCORING_VERSION = hashlib.sha256(
+    json.dumps([WEIGHTS, COMPONENTS_VERSION], sort_keys=True).encode("utf-8")
+).hexdigest()[:12]
+
+# === Build ===
+
+def profile_flats(profiles_col):
+    """{country_code: flat profile} from one pass over country_profiles."""
+    flats = defaultdict(dict)
+    for chunk in profiles_col.find({}, {"_id": 0, "country_code": 1, "chunk_data": 1}):
+        flats[chunk["country_code"]].update(chunk.get("chunk_data", {}))
+    return flats
+
+
+def profile_hash(flat):
+    payload = json.dumps(flat, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def build_static_scores(profiles_col=None, static_col=None, force=False):
+    """Upserts the components of every country whose profile changed; returns {"built", "unchanged"}."""
+    profiles_col = profiles_col if profiles_col is not None else get_collection("country_profiles")
+    static_col = static_col if static_col is not None else get_collection(STATIC_SCORES)
+
+    current = {
+        doc["country_code"]: (doc.get("source_hash"), doc.get("scoring_version"))
+        for doc in static_col.find({}, {"_id": 0, "country_code": 1, "source_hash": 1, "scoring_version": 1})
+    }
+    changed, unchanged = {}, 0
+    for code, flat in profile_flats(profiles_col).items():
+        digest = profile_hash(flat)
+        if not force and current.get(code) == (digest, SCORING_VERSION):
+            unchanged += 1
+            continue
+        changed[code] = (flat, digest)
+
+    # Trend features for every changed country in one vectorized pass
+    trends = trend_components({code: flat for code, (flat, _) in changed.items()}) if changed else {}
+    now = datetime.now(timezone.utc)
+    ops = []
+    for code, (flat, digest) in changed.items():
+        doc = dict(compute_static_components(flat, trends[code]), country_code=code, source_hash=digest,
+                   scoring_version=SCORING_VERSION, built_at=now)
+        ops.append(UpdateOne({"country_code": code}, {"$set": doc}, upsert=True))
+
+    if ops:
+        static_col.bulk_write(ops, ordered=False)
+    invalidate_static_scores()
+    print(f"✅ Static scores: {len(ops)} built, {unchanged} unchanged")
+    return {"built": len(ops), "unchanged": unchanged}
+
+# === Online table ===
+
+_table = None
+_table_source = None
+_table_lock = threading.Lock()
+
+
+def get_static_scores(static_col=None):
+    """
+    {country_code: components} for every materialized country, reloaded when stale or when
+    a different collection is passed in. Totals stored under other weights are recomputed;
+    entries missing a dimension (built before it existed) are left out until the job reruns.
+    """
+    global _table, _table_source
+    static_col = static_col if static_col is not None else get_collection(STATIC_SCORES)
+    source = collection_key(static_col)
+    with _table_lock:
+        stale = _table is None or time.time() - _table[0] > STATIC_SCORES_TTL_SECONDS
+        if stale or _table_source != source:
+            table = {}
+            for doc in static_col.find({}, {"_id": 0, "source_hash": 0, "built_at": 0}):
+                if any(dim not in doc for dim in STATIC_DIMENSIONS):
+                    continue
+                if doc.pop("scoring_version", None) != SCORING_VERSION:
+                    doc["static"] = static_total(doc)
+                table[doc.pop("country_code")] = doc
+            _table, _table_source = (time.time(), table), source
+        return _table[1]
+
+
+def invalidate_static_scores():
+    global _table
+    with _table_lock:
+        _table = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialize per-country static score components")
+    parser.add_argument("--force", action="store_true", help="rebuild entries that are already current")
+    args = parser.parse_args()
+    build_static_scores(force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# Shared fixtures. The backend modules import each other by plain name (they run from
+# backend/), so that directory goes on sys.path; every test runs against the offline
+# fakes in fakes.py, never against real Gemini, Vertex AI or MongoDB.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakes      # noqa: E402
+import services   # noqa: E402
+
+
+@pytest.fixture
+def fake_services():
+    """Installs the fakes (12 countries, 16-dim embeddings) and forgets them afterwards."""
+    installed = fakes.install(n_countries=12, dim=16)
+    yield installed
+    services.reset()
@@ -0,0 +1,72 @@
+# The sync and async chat handlers share ChatTurn, so on the same fakes they must
+# produce the same answers and the same stream events, down to the "done" mode.
+
+import asyncio
+
+import pytest
+
+import chatbot
+import llm
+
+
+@pytest.fixture
+def chat(fake_services):
+    fake_services.db["country_reports"].insert_many([
+        {"country_code": code, "report_version": "v1", "executive_summary": f"{code} is a growing market."}
+        for code in fake_services.country_codes[:3]
+    ])
+    chatbot.clear_chat_sessions()
+    yield fake_services
+    chatbot.clear_chat_sessions()
+
+
+def collect_async(question, codes, session_id=None):
+    async def run():
+        return [event async for event in chatbot.stream_answer_async(question, codes, session_id=session_id)]
+    return asyncio.run(run())
+
+
+def answer_text(events):
+    return "".join(event["text"] for event in events if event["type"] == "token")
+
+
+def test_generate_answer_matches_async(chat):
+    codes = chat.country_codes[:3]
+    answer = chatbot.generate_answer("Which market is easiest to enter?", codes)
+    chatbot.clear_chat_sessions()
+    assert asyncio.run(chatbot.generate_answer_async("Which market is easiest to enter?", codes)) == answer
+    assert answer and answer != chatbot.load_report_context(codes)[1]
+
+
+def test_stream_then_cache_hit(chat):
+    codes = chat.country_codes[:3]
+    events = list(chatbot.stream_answer("Where is labour cheapest?", codes))
+    assert events[-1]["type"] == "done" and events[-1]["mode"] == "stream"
+
+    cached = collect_async("Where is labour cheapest?", codes)
+    assert cached[-1]["mode"] == "cache"
+    assert answer_text(cached) == answer_text(events)
+
+
+def test_session_records_each_turn(chat):
+    codes = chat.country_codes[:3]
+    list(chatbot.stream_answer("First question?", codes, session_id="s1"))
+    collect_async("Second question?", codes, session_id="s1")
+    session = chatbot.get_chat_session("s1", codes)
+    assert session.has_history()
+    assert "Second question?" in session.prompt_for("Third?")
+
+
+@pytest.mark.parametrize("stream", [
+    lambda question, codes: list(chatbot.stream_answer(question, codes)),
+    collect_async,
+], ids=["sync", "async"])
+def test_stream_failure_ends_with_error_and_done(chat, stream, monkeypatch):
+    backoff = llm._backoff
+    # Same attempts, no waiting between them
+    monkeypatch.setattr(llm, "_backoff", lambda *args, **kwargs: backoff(*args, **kwargs) and 0)
+    chat.model.failure_rate = 1.0
+    events = stream("Anything?", chat.country_codes[:3])
+    assert [event["type"] for event in events] == ["error", "done"]
+    assert events[0]["message"] == chatbot.UNAVAILABLE_REPLY
+    assert events[-1]["mode"] == "error"
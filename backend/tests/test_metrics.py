@@ -0,0 +1,21 @@
+# /metrics must be valid Prometheus text: every series belongs to a family declared
+# exactly once with # TYPE, before its first sample.
+
+from pipeline import render_metrics
+from ratelimit import get_llm_limiter
+
+
+def test_every_series_has_one_type_line(fake_services):
+    get_llm_limiter()
+    declared, families = set(), []
+    for line in render_metrics().splitlines():
+        if line.startswith("# TYPE "):
+            name = line.split()[2]
+            assert name not in declared
+            declared.add(name)
+        elif line and not line.startswith("#"):
+            families.append(line.split("{")[0].split()[0])
+
+    assert any(name.startswith("globallaunch_rate_limiter_") for name in families)
+    for name in families:
+        assert name in declared or name.rsplit("_", 1)[0] in declared, name
@@ -0,0 +1,74 @@
+# Every pack pack_fields returns has to fit the token budget once rendered, in both
+# prompt encodings, and it never opens more packs than allowed. When the budget is
+# short, the fields the sector needs are the ones that stay.
+
+import math
+
+import pytest
+
+from packing import compact_value, estimate_tokens, flatten_chunks, pack_fields, relevance, render
+
+ENCODINGS = ["table", "json"]
+
+
+@pytest.fixture
+def profiles(fake_services):
+    col = fake_services.db["country_profiles"]
+    return [flatten_chunks(col.find({"country_code": code})) for code in fake_services.country_codes[:4]]
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+@pytest.mark.parametrize("budget", [150, 300, 600, 1500])
+@pytest.mark.parametrize("max_prompts", [1, 3])
+def test_packs_fit_the_token_budget(profiles, encoding, budget, max_prompts):
+    for fields in profiles:
+        packs, stats = pack_fields(fields, ["fintech"], token_budget=budget, max_prompts=max_prompts,
+                                   encoding=encoding)
+        assert 1 <= len(packs) <= max_prompts
+        for pack in packs:
+            assert estimate_tokens(render(pack, encoding)) <= budget
+        assert stats["packed_fields"] == sum(len(pack) for pack in packs)
+        assert stats["packed_fields"] + stats["dropped_fields"] == len(fields)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_large_budget_keeps_every_field(profiles, encoding):
+    for fields in profiles:
+        packs, stats = pack_fields(fields, ["fintech"], token_budget=100_000, encoding=encoding)
+        assert len(packs) == 1 and stats["dropped_fields"] == 0
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1234.56, 1235),
+    (-250.4, -250),
+    (12.3456, 12.3),
+    (0.0043219, 0.00432),
+    (5.0, 5),
+    (True, True),
+    ("text", "text"),
+    (float("nan"), None),
+    (math.inf, None),
+    ("", None),
+    ([], None),
+])
+def test_compact_value(value, expected):
+    result = compact_value(value)
+    assert result == expected and type(result) is type(expected)
+
+
+def test_relevance_prefers_sector_fields_and_recent_years():
+    credit = "2023.ease_of_doing_business.getting_credit.score"
+    assert relevance(credit, ["fintech"], 2023) > relevance(credit, ["cleantech"], 2023)
+    assert relevance(credit, ["fintech"], 2023) > relevance("2015" + credit[4:], ["fintech"], 2023)
+    assert relevance("2023.trade_profile.details.notes", ["fintech"], 2023) < \
+        relevance("2023.trade_profile.average_applied_tariff_percent", ["fintech"], 2023)
+
+
+def test_short_budget_keeps_the_sector_fields(profiles):
+    fields = profiles[0]
+    packs, stats = pack_fields(fields, ["fintech"], token_budget=150, max_prompts=1)
+    assert stats["dropped_fields"] > 0
+    kept = {key for pack in packs for key in pack}
+    latest = max(int(key.split(".", 1)[0]) for key in fields if key[:4].isdigit())
+    best = max(relevance(key, ["fintech"], latest) for key in fields)
+    assert any(relevance(key, ["fintech"], latest) == best for key in kept)
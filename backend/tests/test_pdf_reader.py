@@ -0,0 +1,50 @@
+import asyncio
+from io import BytesIO
+
+import fitz
+import pytest
+
+import pdf_reader
+
+GARBAGE = [b"not a pdf", b"%PDF-1.7 truncated", b""]
+
+
+def make_pdf(*pages):
+    with fitz.open() as doc:
+        for text in pages:
+            doc.new_page().insert_text((72, 72), text)
+        return doc.tobytes()
+
+
+@pytest.mark.parametrize("data", GARBAGE)
+def test_unreadable_bytes_raise_one_error(data):
+    with pytest.raises(pdf_reader.UnreadablePDFError):
+        pdf_reader.extract_pages(data)
+    with pytest.raises(pdf_reader.UnreadablePDFError):
+        pdf_reader.extract_text_from_stream(data)
+
+
+def test_extract_pages_reads_every_page():
+    pages = pdf_reader.extract_pages(make_pdf("Mobile payments for farmers", "Market size 40%"))
+    assert [text.strip() for text in pages] == ["Mobile payments for farmers", "Market size 40%"]
+
+
+@pytest.mark.parametrize("data", GARBAGE)
+def test_flask_upload_of_garbage_is_a_400(fake_services, data):
+    from app import app
+
+    response = app.test_client().post(
+        "/upload_pdf", data={"file": (BytesIO(data), "deck.pdf")}, content_type="multipart/form-data"
+    )
+    assert response.status_code == 400
+    assert b"Could not read PDF" in response.data
+
+
+@pytest.mark.parametrize("data", GARBAGE)
+def test_asgi_upload_of_garbage_is_a_400(fake_services, data):
+    from fastapi import HTTPException, UploadFile
+    from asgi_app import upload_pdf
+
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(upload_pdf(UploadFile(BytesIO(data), filename="deck.pdf")))
+    assert raised.value.status_code == 400
@@ -0,0 +1,69 @@
+# Local repairs run before a malformed Gemini response is re-asked, so they must fix
+# the common near-misses and leave anything they cannot fix for validate() to report.
+
+from schemas import (
+    CHUNK_INSIGHTS_SCHEMA, INSIGHT_KEYS, REPORT_SCHEMA, SEMANTIC_PROFILE_SCHEMA,
+    repair, sector_list_schema, string_list, to_gemini_schema, top_level_field, validate,
+)
+
+
+def test_lone_string_becomes_a_list():
+    assert repair("only one point", string_list(1)) == ["only one point"]
+
+
+def test_list_is_cut_to_max_items():
+    assert repair(["a", "b", "c", "d"], string_list(1, 3)) == ["a", "b", "c"]
+
+
+def test_invalid_items_are_dropped():
+    assert repair(["a", {"nested": 1}, "b", None], string_list(1)) == ["a", "b"]
+
+
+def test_numbers_and_string_lists_become_strings():
+    assert repair(42, {"type": "STRING"}) == "42"
+    assert repair(["two", "parts"], {"type": "STRING"}) == "two parts"
+    assert repair(True, {"type": "STRING"}) is True
+
+
+def test_enum_matches_case_insensitively():
+    schema = sector_list_schema(3)
+    assert repair([" FinTech ", "saas", "space"], schema) == ["fintech", "SaaS"]
+
+
+def test_numeric_strings_are_parsed():
+    assert repair("12", {"type": "INTEGER"}) == 12
+    assert repair("1.5", {"type": "NUMBER"}) == 1.5
+    assert repair("n/a", {"type": "NUMBER"}) == "n/a"
+
+
+def test_repair_fixes_a_near_miss_chunk():
+    raw = {key: f"{key} insight" for key in INSIGHT_KEYS}
+    raw["business_environment"] = ["one", "two", "three", "four"]
+    assert validate(raw, CHUNK_INSIGHTS_SCHEMA)
+
+    fixed = repair(raw, CHUNK_INSIGHTS_SCHEMA)
+    assert validate(fixed, CHUNK_INSIGHTS_SCHEMA) == []
+    assert fixed["business_environment"] == ["one", "two", "three"]
+    assert raw["business_environment"] == ["one", "two", "three", "four"]
+
+
+def test_unfixable_problems_are_left_for_validate():
+    raw = {"summary": "ok", "indicators": 7}
+    fixed = repair(raw, SEMANTIC_PROFILE_SCHEMA)
+    assert [top_level_field(path) for path, _ in validate(fixed, SEMANTIC_PROFILE_SCHEMA)] == ["indicators"]
+
+    missing = repair({"executive_summary": "x"}, REPORT_SCHEMA)
+    assert {path for path, _ in validate(missing, REPORT_SCHEMA)} == set(INSIGHT_KEYS)
+
+
+def test_top_level_field():
+    assert top_level_field("entry_considerations.go_to_market_advice[1]") == "entry_considerations"
+    assert top_level_field("indicators[0].name") == "indicators"
+    assert top_level_field("summary") == "summary"
+
+
+def test_gemini_schema_drops_validator_only_keys():
+    sent = to_gemini_schema(CHUNK_INSIGHTS_SCHEMA)
+    for key in INSIGHT_KEYS:
+        assert sent["properties"][key] == {"type": "ARRAY", "items": {"type": "STRING"}}
+    assert sent["required"] == INSIGHT_KEYS
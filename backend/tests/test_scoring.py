@@ -0,0 +1,168 @@
+# The shortlist score is now split into a materialized static part (scoring.py) and
+# the per-query vector part. Together they must reproduce the original single-pass
+# compute_score exactly; `baseline_score` below is that function as it was.
+
+import math
+
+import pytest
+
+import scoring
+from packing import flatten_chunks
+from scoring import combine_score, compute_static_components, score_upper_bound
+
+BASELINE_WEIGHTS = {"vector": 0.4, "eodb": 0.15, "macro": 0.08, "digital": 0.17, "trade": 0.08, "fdi": 0.12}
+
+
+def get_latest_field(data, suffix):
+    values = [(k, v) for k, v in data.items() if k.endswith(suffix) and isinstance(v, (int, float))]
+    if not values:
+        return None
+    return sorted(values, key=lambda x: x[0], reverse=True)[0][1]
+
+
+def safe_norm(val, max_val=100, invert=False):
+    if val is None:
+        return 0.0
+    norm = min(val / max_val, 1.0)
+    return 1.0 - norm if invert else norm
+
+
+def log_scale(val):
+    return math.log(val + 1) / 10 if val and val > 0 else 0.0
+
+
+def baseline_score(vec_score, flat):
+    valid_fields = 0
+    total_fields = 0
+
+    def norm_and_count(field, invert=False, max_val=100):
+        nonlocal valid_fields, total_fields
+        total_fields += 1
+        val = get_latest_field(flat, field)
+        if val is not None:
+            valid_fields += 1
+        return safe_norm(val, max_val=max_val, invert=invert)
+
+    eodb_fields = [
+        "ease_of_doing_business.starting_business_score",
+        "ease_of_doing_business.getting_electricity.score",
+        "ease_of_doing_business.registering_property.score",
+        "ease_of_doing_business.getting_credit.score",
+        "ease_of_doing_business.protecting_minority_investors.score",
+        "ease_of_doing_business.paying_taxes.score",
+        "ease_of_doing_business.trading_across_borders.score",
+        "ease_of_doing_business.enforcing_contracts.score",
+        "ease_of_doing_business.resolving_insolvency.score",
+        "ease_of_doing_business.overall_score"
+    ]
+    eodb = sum(norm_and_count(f) for f in eodb_fields) / len(eodb_fields)
+
+    macro_fields = [
+        ("macroeconomic_indicators.gdp_growth_percent", False),
+        ("macroeconomic_indicators.inflation_rate_percent", True),
+        ("macroeconomic_indicators.unemployment_rate_percent", True),
+        ("macroeconomic_indicators.current_account_balance_percent_gdp", False),
+        ("macroeconomic_indicators.public_debt_percent_of_gdp", True)
+    ]
+    macro = sum(norm_and_count(f, invert=inv) for f, inv in macro_fields) / len(macro_fields)
+
+    digital_fields = [
+        ("digital_connectivity.gsma_connectivity_index", False),
+        ("digital_connectivity.mobile_broadband_coverage_percent", False),
+        ("digital_connectivity.mobile_ownership_percent", False),
+        ("connectivity.affordability.device_affordability_40pct_usd", True),
+        ("connectivity.affordability.tax_mobile_data_percent", True),
+        ("connectivity.affordability.tax_handsets_percent", True),
+        ("connectivity.affordability.sector_specific_taxes_percent", True),
+        ("connectivity.consumer_readiness.literacy_percent", False),
+        ("connectivity.content_and_services.e_government_score", False),
+        ("connectivity.content_and_services.social_media_penetration_percent", False),
+        ("connectivity.online_security.cybersecurity_index_score", False)
+    ]
+    digital = sum(norm_and_count(f, invert=inv) for f, inv in digital_fields) / len(digital_fields)
+
+    trade_fields = [
+        ("trade_profile.average_applied_tariff_percent", True),
+        ("trade_profile.binding_tariff_coverage_percent", False),
+        ("trade_profile.import_duties_on_capital_goods_percent", True),
+        ("trade_profile.import_duties_on_intermediate_goods_percent", True),
+        ("trade_profile.duty_free_import_share_percent", False)
+    ]
+    trade = min(sum(norm_and_count(f, invert=inv) for f, inv in trade_fields) / len(trade_fields), 0.8)
+
+    fdi_vals = [
+        get_latest_field(flat, "foreign_direct_investment.fdi_net_inflows_usd_millions"),
+        get_latest_field(flat, "foreign_direct_investment.fdi_inward_stock_usd_millions")
+    ]
+    total_fields += len(fdi_vals)
+    fdi_non_null = [v for v in fdi_vals if v is not None]
+    valid_fields += len(fdi_non_null)
+    fdi = sum(log_scale(v) for v in fdi_non_null) / len(fdi_vals) if fdi_vals else 0.0
+
+    coverage = valid_fields / total_fields if total_fields > 0 else 1.0
+    coverage_adjust = 0.5 + 0.5 * coverage
+
+    final_score = (
+        vec_score * BASELINE_WEIGHTS["vector"] +
+        eodb * BASELINE_WEIGHTS["eodb"] +
+        macro * BASELINE_WEIGHTS["macro"] +
+        digital * BASELINE_WEIGHTS["digital"] +
+        trade * BASELINE_WEIGHTS["trade"] +
+        fdi * BASELINE_WEIGHTS["fdi"]
+    ) * coverage_adjust
+
+    if vec_score > 0.8 and digital > 0.6 and fdi > 1.1:
+        final_score += 0.01
+
+    return round(final_score, 4)
+
+
+VECTOR_SCORES = [0.0, 0.35, 0.8, 0.81, 0.97, 1.0]
+
+
+@pytest.fixture
+def flats(fake_services, monkeypatch):
+    # The trend dimension is new and off by default; the baseline has no such term
+    monkeypatch.setitem(scoring.WEIGHTS, "trend", 0.0)
+    profiles = fake_services.db["country_profiles"]
+    flats = {code: flatten_chunks(profiles.find({"country_code": code})) for code in fake_services.country_codes}
+    flats["EMPTY"] = {}
+    return flats
+
+
+def test_static_split_matches_baseline(flats):
+    for code, flat in flats.items():
+        components = compute_static_components(flat)
+        for vec in VECTOR_SCORES:
+            assert combine_score(vec, components) == baseline_score(vec, flat), (code, vec)
+
+
+def test_sparse_profile_matches_baseline():
+    # The fakes have every indicator; here most are missing, so coverage drops,
+    # while digital and FDI stay high enough for the micro-boost
+    flat = {
+        "2023.digital_connectivity.gsma_connectivity_index": 100,
+        "2023.digital_connectivity.mobile_broadband_coverage_percent": 100,
+        "2023.digital_connectivity.mobile_ownership_percent": 100,
+        "2023.connectivity.consumer_readiness.literacy_percent": 100,
+        "2023.connectivity.content_and_services.e_government_score": 100,
+        "2023.connectivity.content_and_services.social_media_penetration_percent": 100,
+        "2023.connectivity.online_security.cybersecurity_index_score": 100,
+        "2023.connectivity.affordability.tax_handsets_percent": 0,
+        "2023.foreign_direct_investment.fdi_net_inflows_usd_millions": 5e5,
+        "2023.foreign_direct_investment.fdi_inward_stock_usd_millions": 5e6,
+    }
+    components = compute_static_components(flat, trend={"trend": 0.0})
+    assert components["coverage"] < 0.5 and scoring.boost_eligible(components)
+    for vec in VECTOR_SCORES:
+        assert combine_score(vec, components) == baseline_score(vec, flat), vec
+
+
+def test_upper_bound_covers_every_lower_vector_score(flats):
+    for flat in flats.values():
+        components = compute_static_components(flat)
+        for bound in VECTOR_SCORES:
+            ceiling = score_upper_bound(bound, components)
+            for vec in VECTOR_SCORES:
+                if vec <= bound:
+                    assert combine_score(vec, components) <= round(ceiling, 4)
@@ -0,0 +1,171 @@
+# timeseries.py
+# Indicator time series and the trend features the score can weight.
+#
+# get_latest_field keeps only each indicator's latest year. Here every year a profile
+# holds ("2019.ease_of_doing_business.overall_score", ...) goes into one array for a set
+# of countries, values[country, field, year], NaN where a year is missing. Each scored
+# field is normalized the way compute_static_components normalizes it (0-1, inverted
+# where lower is better, FDI log-scaled), so a rising value always means improving.
+# Three features per country and field are computed for all countries at once:
+#   slope       least-squares change per year over the observed years
+#   yoy         change per year between the two latest observed years
+#   volatility  standard deviation of the changes between consecutive observed years
+# Per dimension, the fields' momentum (mean of slope and yoy) relative to their
+# volatility is squashed to a 0-1 trend score (0.5 = flat, above = improving). The mean
+# over the dimensions with at least two years of data is the country's `trend`
+# component, which WEIGHTS["trend"] (SCORE_TREND_WEIGHT, 0 by default) adds to the
+# score. The features depend only on the country's own profile, so static_scores.py
+# materializes them with the other components and rebuilds a country only when its
+# data version (profile hash) changes.
+
+import os
+from scoring import DIMENSION_FIELDS, FDI_FIELDS
+
+# Momentum (normalized points per year) that moves a trend score three quarters of the
+# way from 0.5 (flat) to 0 or 1; volatility adds to it, so noisy series count for less
+TREND_SCALE = float(os.getenv("TREND_SCALE", 0.02))
+
+# Every series field as (dimension, field suffix, lower is better, log-scaled)
+SERIES_FIELDS = (
+    [(dim, field, invert, False) for dim, fields in DIMENSION_FIELDS.items() for field, invert in fields]
+    + [("fdi", field, False, True) for field in FDI_FIELDS]
+)
+TREND_DIMENSIONS = list(dict.fromkeys(dim for dim, *_ in SERIES_FIELDS))
+
+# Profile key → (index in SERIES_FIELDS, year), or None when it is not a scored yearly field.
+# Every country uses the same keys, so each is parsed once.
+_key_cells = {}
+
+
+def key_cell(key):
+    if key not in _key_cells:
+        year, _, path = key.partition(".")
+        field = next((i for i, (_, suffix, _, _) in enumerate(SERIES_FIELDS) if path.endswith(suffix)), None)
+        _key_cells[key] = (field, int(year)) if year.isdigit() and field is not None else None
+    return _key_cells[key]
+
+# === Series ===
+
+class IndicatorSeries:
+    """values[country, field, year] for the scored indicators of {country_code: flat profile}."""
+
+    def __init__(self, flats):
+        import numpy as np
+
+        self.codes = list(flats)
+        # Like get_latest_field, the lexicographically latest key wins when several match
+        cells = {}
+        for row, code in enumerate(self.codes):
+            for key, val in flats[code].items():
+                parsed = key_cell(key)
+                if parsed is None or not isinstance(val, (int, float)):
+                    continue
+                cell = (row, *parsed)
+                if cell not in cells or key > cells[cell][0]:
+                    cells[cell] = (key, val)
+
+        self.years = np.array(sorted({year for _, _, year in cells}), dtype=float)
+        raw = np.full((len(self.codes), len(SERIES_FIELDS), len(self.years)), np.nan)
+        if cells:
+            rows, fields, years = np.array(list(cells)).T
+            raw[rows, fields, np.searchsorted(self.years, years)] = [val for _, val in cells.values()]
+        self.values = self._normalize(raw)
+        self._features = None
+
+    @staticmethod
+    def _normalize(raw):
+        """safe_norm (with invert) per field, or log_scale for the FDI fields; NaN stays NaN."""
+        import numpy as np
+
+        invert = np.array([inv for _, _, inv, _ in SERIES_FIELDS])[:, None]
+        logged = np.array([log for _, _, _, log in SERIES_FIELDS])[:, None]
+        with np.errstate(invalid="ignore"):
+            norm = np.minimum(raw / 100, 1.0)
+            norm = np.where(invert, 1.0 - norm, norm)
+            positive = np.where(raw > 0, raw, 0.0)
+            scaled = np.where(logged, np.log1p(positive) / 10, norm)
+        return np.where(np.isnan(raw), np.nan, scaled)
+
+    def features(self):
+        """{"slope", "yoy", "volatility"} arrays (countries, fields); NaN with fewer than two years."""
+        import numpy as np
+
+        if self._features is not None:
+            return self._features
+        values, years = self.values, self.years
+        if not len(years):
+            empty = np.full(values.shape[:-1], np.nan)
+            self._features = {"slope": empty, "yoy": empty, "volatility": empty}
+            return self._features
+        observed = ~np.isnan(values)
+        points = observed.sum(axis=-1)
+        enough = points >= 2
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Least-squares slope over the observed years
+            n = np.maximum(points, 1)[..., None]
+            x = np.where(observed, years, 0.0)
+            y = np.where(observed, values, 0.0)
+            dx = np.where(observed, years - x.sum(axis=-1, keepdims=True) / n, 0.0)
+            dy = np.where(observed, values - y.sum(axis=-1, keepdims=True) / n, 0.0)
+            slope = (dx * dy).sum(axis=-1) / (dx ** 2).sum(axis=-1)
+
+            # Change per year from each observed year's predecessor (forward-filled index)
+            index = np.arange(len(years))
+            filled = np.maximum.accumulate(np.where(observed, index, -1), axis=-1)
+            before = np.concatenate([np.full(filled.shape[:-1] + (1,), -1), filled[..., :-1]], axis=-1)
+            has_change = observed & (before >= 0)
+            previous = np.take_along_axis(values, np.maximum(before, 0), axis=-1)
+            changes = np.where(has_change, (values - previous) / (years - years[np.maximum(before, 0)]), 0.0)
+
+            latest = np.maximum(filled[..., -1], 0)[..., None]
+            yoy = np.take_along_axis(changes, latest, axis=-1)[..., 0]
+            count = np.maximum(has_change.sum(axis=-1), 1)[..., None]
+            mean_change = changes.sum(axis=-1, keepdims=True) / count
+            volatility = np.sqrt((np.where(has_change, changes - mean_change, 0.0) ** 2).sum(axis=-1) / count[..., 0])
+
+        self._features = {
+            name: np.where(enough, feature, np.nan)
+            for name, feature in (("slope", slope), ("yoy", yoy), ("volatility", volatility))
+        }
+        return self._features
+
+    def trend_components(self):
+        """{country_code: {"trend": 0-1 score, "trends": {dimension: {"score", "slope", "yoy", "volatility"}}}}."""
+        import numpy as np
+
+        features = self.features()
+        dims = np.array([dim for dim, *_ in SERIES_FIELDS])
+        per_dim = {}
+        with np.errstate(invalid="ignore"):
+            for dim in TREND_DIMENSIONS:
+                cols = features["slope"][:, dims == dim]
+                has = ~np.isnan(cols)
+                count = has.sum(axis=1)
+                means = {
+                    name: np.where(has, feature[:, dims == dim], 0.0).sum(axis=1) / np.maximum(count, 1)
+                    for name, feature in features.items()
+                }
+                momentum = (means["slope"] + means["yoy"]) / 2
+                score = 0.5 + 0.5 * np.tanh(momentum / (TREND_SCALE + means["volatility"]))
+                per_dim[dim] = (count > 0, score, means)
+
+        result = {}
+        for row, code in enumerate(self.codes):
+            trends = {
+                dim: {
+                    "score": float(score[row]),
+                    "slope": float(means["slope"][row]),
+                    "yoy": float(means["yoy"][row]),
+                    "volatility": float(means["volatility"][row]),
+                }
+                for dim, (present, score, means) in per_dim.items() if present[row]
+            }
+            trend = sum(t["score"] for t in trends.values()) / len(trends) if trends else 0.5
+            result[code] = {"trend": trend, "trends": trends}
+        return result
+
+
+def trend_components(flats):
+    """Trend components for {country_code: flat profile}, computed in one vectorized pass."""
+    return IndicatorSeries(flats).trend_components()
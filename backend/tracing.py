@@ -0,0 +1,278 @@
+# tracing.py
+# Lightweight pipeline tracing: nested spans with durations, Mongo round-trip counts,
+# LLM token counts and cache-hit flags.
+#
+# - Every finished span feeds a per-name latency histogram (exposed at /metrics in
+#   Prometheus text format, in seconds) and a DEBUG-level structured log line.
+# - When a root span (e.g. one /run_pipeline request) ends, a per-stage summary of the
+#   whole trace is logged at INFO as one JSON line.
+# - If TRACING_OTEL=1 and the OpenTelemetry SDK is installed, spans are mirrored to an
+#   OTLP exporter as well.
+
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger("globallaunch.trace")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.getenv("TRACE_LOG_LEVEL", "INFO"))
+    logger.propagate = False
+
+# Histogram bucket upper bounds in seconds (Prometheus base unit; spans time themselves in ms)
+BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Counters that roll up from child spans into their parents when the child ends
+ROLLUP_COUNTERS = (
+    "mongo_round_trips", "llm_calls", "llm_prompt_tokens", "llm_completion_tokens",
+    "llm_json_repairs", "llm_json_reasks"
+)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.attrs = dict(attrs)
+        self.counters = {key: 0 for key in ROLLUP_COUNTERS}
+        self.children = []
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span": self.name,
+            "parent": self.parent.name if self.parent else None,
+            "duration_ms": round(self.duration_ms or 0.0, 2),
+            **{k: v for k, v in self.counters.items() if v},
+            **self.attrs,
+            **({"error": self.error} if self.error else {}),
+        }
+
+# === Metrics ===
+
+class _Histograms:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}        # span name -> {"buckets": [...], "sum": float, "count": int}
+        self._counters = {}    # (metric, span name) -> value
+
+    def observe(self, span):
+        with self._lock:
+            hist = self._data.setdefault(span.name, {"buckets": [0] * len(BUCKETS_SECONDS), "sum": 0.0, "count": 0})
+            seconds = span.duration_ms / 1000
+            for i, bound in enumerate(BUCKETS_SECONDS):
+                if seconds <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += seconds
+            hist["count"] += 1
+            # Only count a span's own work here (children are counted under their own names)
+            own = dict(span.counters)
+            for child in span.children:
+                for key in ROLLUP_COUNTERS:
+                    own[key] -= child.counters.get(key, 0)
+            for key in ROLLUP_COUNTERS:
+                if own[key] > 0:
+                    self._counters[(key, span.name)] = self._counters.get((key, span.name), 0) + own[key]
+            if "cache_hit" in span.attrs:
+                metric = "cache_hits" if span.attrs["cache_hit"] else "cache_misses"
+                self._counters[(metric, span.name)] = self._counters.get((metric, span.name), 0) + 1
+            if span.error:
+                self._counters[("errors", span.name)] = self._counters.get(("errors", span.name), 0) + 1
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP globallaunch_span_duration_seconds Duration of traced pipeline stages",
+            "# TYPE globallaunch_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for name, hist in sorted(self._data.items()):
+                for bound, count in zip(BUCKETS_SECONDS, hist["buckets"]):
+                    lines.append(f'globallaunch_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+                lines.append(f'globallaunch_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {hist["count"]}')
+                lines.append(f'globallaunch_span_duration_seconds_sum{{span="{name}"}} {hist["sum"]:.6f}')
+                lines.append(f'globallaunch_span_duration_seconds_count{{span="{name}"}} {hist["count"]}')
+            metrics = sorted({metric for metric, _ in self._counters})
+            for metric in metrics:
+                lines.append(f"# TYPE globallaunch_{metric}_total counter")
+                for (m, name), value in sorted(self._counters.items()):
+                    if m == metric:
+                        lines.append(f'globallaunch_{metric}_total{{span="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+histograms = _Histograms()
+
+# === Optional OpenTelemetry bridge ===
+
+_otel_tracer = None
+_otel_checked = False
+
+def _get_otel_tracer():
+    global _otel_tracer, _otel_checked
+    if _otel_checked:
+        return _otel_tracer
+    _otel_checked = True
+    if os.getenv("TRACING_OTEL") != "1":
+        return None
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        provider = TracerProvider()
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        otel_trace.set_tracer_provider(provider)
+        _otel_tracer = otel_trace.get_tracer("globallaunch")
+    except ImportError as e:
+        logger.warning(json.dumps({"event": "otel_unavailable", "reason": str(e)}))
+    return _otel_tracer
+
+# === Public API ===
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times a block as a child of the current span (or as a new trace root)."""
+    parent = _current_span.get()
+    sp = Span(name, parent, **attrs)
+    if parent:
+        with parent._lock:
+            parent.children.append(sp)
+    token = _current_span.set(sp)
+
+    otel_cm = None
+    tracer = _get_otel_tracer()
+    if tracer is not None:
+        otel_cm = tracer.start_as_current_span(name)
+        otel_cm.__enter__()
+
+    try:
+        yield sp
+    except Exception as e:
+        sp.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        sp.duration_ms = (time.perf_counter() - sp.started) * 1000
+        _current_span.reset(token)
+        if parent:
+            for key, value in sp.counters.items():
+                if value:
+                    parent.incr(key, value)
+        if otel_cm is not None:
+            from opentelemetry import trace as otel_trace
+            otel_span = otel_trace.get_current_span()
+            for key, value in sp.to_dict().items():
+                if isinstance(value, (str, int, float, bool)):
+                    otel_span.set_attribute(f"globallaunch.{key}", value)
+            otel_cm.__exit__(None, None, None)
+        histograms.observe(sp)
+        logger.debug(json.dumps(sp.to_dict(), default=str))
+        if parent is None:
+            logger.info(json.dumps(trace_summary(sp), default=str))
+
+
+def traced(name=None):
+    """Decorator form of `span`."""
+    def decorator(fn):
+        span_name = name or fn.__name__
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attrs(**attrs):
+    """Attaches attributes (e.g. cache_hit=True) to the current span, if any."""
+    sp = _current_span.get()
+    if sp is not None:
+        sp.set(**attrs)
+
+
+def incr(key, amount=1):
+    sp = _current_span.get()
+    if sp is not None:
+        sp.incr(key, amount)
+
+
+def record_llm_usage(response):
+    """Adds token counts from a Gemini response's usage_metadata to the current span."""
+    incr("llm_calls")
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        incr("llm_prompt_tokens", getattr(usage, "prompt_token_count", 0) or 0)
+        incr("llm_completion_tokens", getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def bind(fn):
+    """Wraps `fn` so it runs inside the caller's tracing context (for thread pools)."""
+    ctx = contextvars.copy_context()
+    # A Context can only be entered by one thread at a time, so each call runs in its own copy
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
+
+
+def trace_summary(root):
+    """Per-stage rollup of a finished trace: count, total ms, and counters per span name."""
+    stages = {}
+    stack = [root]
+    while stack:
+        sp = stack.pop()
+        stage = stages.setdefault(sp.name, {"count": 0, "total_ms": 0.0, "cache_hits": 0, "errors": 0})
+        stage["count"] += 1
+        stage["total_ms"] = round(stage["total_ms"] + (sp.duration_ms or 0.0), 2)
+        stage["cache_hits"] += 1 if sp.attrs.get("cache_hit") else 0
+        stage["errors"] += 1 if sp.error else 0
+        stack.extend(sp.children)
+    return {
+        "event": "trace",
+        "trace_id": root.trace_id,
+        "root": root.name,
+        "duration_ms": round(root.duration_ms, 2),
+        **{k: v for k, v in root.counters.items() if v},
+        **root.attrs,
+        "stages": stages,
+    }
+
+
+def make_mongo_listener():
+    """pymongo CommandListener that counts round trips on the current span."""
+    from pymongo import monitoring
+
+    class MongoRoundTripListener(monitoring.CommandListener):
+        def started(self, event):
+            incr("mongo_round_trips")
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    return MongoRoundTripListener()
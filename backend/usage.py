@@ -0,0 +1,209 @@
+# usage.py
+# LLM usage ledger: tokens, latency, model and retries for every Gemini call,
+# rolled up per stage, per request and per session, with optional token budgets.
+#
+# A request opens a ledger with `request_ledger(...)`; every call made inside it
+# (including calls on worker threads bound with tracing.bind) is recorded against it.
+# When the ledger closes, the request's calls and totals go to `llm_usage` and the
+# session's running totals are incremented in `llm_usage_sessions`.
+
+import os
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from tracing import current_span, record_llm_usage
+from services import get_collection
+
+PIPELINE_TOKEN_BUDGET = int(os.getenv("PIPELINE_TOKEN_BUDGET", 0))   # Per /run_pipeline request; 0 = unlimited
+CHAT_TOKEN_BUDGET = int(os.getenv("CHAT_TOKEN_BUDGET", 0))           # Per session, across all chat requests
+PERSIST_USAGE = os.getenv("PERSIST_LLM_USAGE", "1") == "1"
+
+_current_ledger = contextvars.ContextVar("current_ledger", default=None)
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised before an LLM call once the request has used up its token budget."""
+
+
+class UsageLedger:
+    def __init__(self, kind, session_id=None, budget_tokens=0, prior_tokens=0):
+        self.request_id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.session_id = session_id
+        self.budget_tokens = budget_tokens
+        self.prior_tokens = prior_tokens   # Tokens already spent against the same budget by earlier requests
+        self.calls = []
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens(self):
+        return sum(c["input_tokens"] + c["output_tokens"] for c in self.calls)
+
+    def budget_exhausted(self):
+        return bool(self.budget_tokens) and self.prior_tokens + self.total_tokens >= self.budget_tokens
+
+    def add(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def by_stage(self):
+        stages = {}
+        for call in self.calls:
+            stage = stages.setdefault(call["stage"], {
+                "calls": 0, "input_tokens": 0, "output_tokens": 0, "retries": 0, "latency_ms": 0.0
+            })
+            stage["calls"] += 1
+            stage["input_tokens"] += call["input_tokens"]
+            stage["output_tokens"] += call["output_tokens"]
+            stage["retries"] += call["retries"]
+            stage["latency_ms"] = round(stage["latency_ms"] + call["latency_ms"], 1)
+        return stages
+
+    def summary(self):
+        return {
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "session_id": self.session_id,
+            "calls": len(self.calls),
+            "input_tokens": sum(c["input_tokens"] for c in self.calls),
+            "output_tokens": sum(c["output_tokens"] for c in self.calls),
+            "retries": sum(c["retries"] for c in self.calls),
+            "latency_ms": round(sum(c["latency_ms"] for c in self.calls), 1),
+            "budget_tokens": self.budget_tokens,
+            "prior_tokens": self.prior_tokens,
+            "budget_exhausted": self.budget_exhausted(),
+            "stages": self.by_stage(),
+        }
+
+    def persist(self):
+        """Writes the request record and bumps the session totals. Never raises."""
+        if not PERSIST_USAGE or not self.calls:
+            return
+        summary = self.summary()
+        try:
+            get_collection("llm_usage").insert_one({
+                **summary,
+                "started_at": self.started_at,
+                "call_log": self.calls
+            })
+            if self.session_id:
+                inc = {
+                    "requests": 1,
+                    "calls": summary["calls"],
+                    "input_tokens": summary["input_tokens"],
+                    "output_tokens": summary["output_tokens"],
+                    "retries": summary["retries"],
+                    f"kinds.{self.kind}.requests": 1,
+                    f"kinds.{self.kind}.tokens": summary["input_tokens"] + summary["output_tokens"],
+                }
+                for stage, totals in summary["stages"].items():
+                    inc[f"stages.{stage}.input_tokens"] = totals["input_tokens"]
+                    inc[f"stages.{stage}.output_tokens"] = totals["output_tokens"]
+                    inc[f"stages.{stage}.calls"] = totals["calls"]
+                get_collection("llm_usage_sessions").update_one(
+                    {"session_id": self.session_id},
+                    {"$inc": inc, "$set": {"updated_at": time.time()}},
+                    upsert=True
+                )
+        except Exception as e:
+            print(f"Failed to persist LLM usage for {self.request_id}: {e}")
+
+# === Process-wide totals (all requests, including offline jobs without a ledger) ===
+
+_totals = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "retries": 0}
+_totals_lock = threading.Lock()
+
+
+def process_totals():
+    with _totals_lock:
+        return dict(_totals)
+
+# === Public API ===
+
+@contextmanager
+def request_ledger(kind, session_id=None, budget_tokens=0, persist=True, per_session=False, prior_tokens=None):
+    """Opens a ledger for one request; calls made inside are recorded against it.
+
+    With per_session=True the budget covers every `kind` request of the session, not just this one
+    (async callers can look the spent tokens up themselves and pass prior_tokens).
+    """
+    if prior_tokens is None:
+        prior_tokens = session_tokens(session_id, kind) if per_session and budget_tokens and session_id else 0
+    ledger = UsageLedger(kind, session_id=session_id, budget_tokens=budget_tokens, prior_tokens=prior_tokens)
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+        if persist:
+            ledger.persist()
+
+
+def current_ledger():
+    return _current_ledger.get()
+
+
+def check_budget():
+    """Raises TokenBudgetExceeded if the current request has no tokens left."""
+    ledger = _current_ledger.get()
+    if ledger is not None and ledger.budget_exhausted():
+        raise TokenBudgetExceeded(
+            f"{ledger.kind} request {ledger.request_id} used {ledger.prior_tokens + ledger.total_tokens} "
+            f"of {ledger.budget_tokens} tokens"
+        )
+
+
+def budget_exhausted():
+    ledger = _current_ledger.get()
+    return ledger is not None and ledger.budget_exhausted()
+
+
+def record_call(response, model_name, latency_ms, retries, prompt_chars=0, ok=True):
+    """Records one LLM call (response may be None for a failed call) on the current ledger and span."""
+    usage = getattr(response, "usage_metadata", None) if response is not None else None
+    input_tokens = (getattr(usage, "prompt_token_count", 0) or 0) if usage is not None else 0
+    output_tokens = (getattr(usage, "candidates_token_count", 0) or 0) if usage is not None else 0
+
+    span = current_span()
+    call = {
+        "stage": span.name if span else "untraced",
+        "model": model_name,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "prompt_chars": prompt_chars,
+        "latency_ms": round(latency_ms, 1),
+        "retries": retries,
+        "ok": ok,
+        "at": time.time(),
+    }
+
+    ledger = _current_ledger.get()
+    if ledger is not None:
+        ledger.add(call)
+    with _totals_lock:
+        _totals["calls"] += 1
+        _totals["input_tokens"] += input_tokens
+        _totals["output_tokens"] += output_tokens
+        _totals["retries"] += retries
+    if response is not None:
+        record_llm_usage(response)
+    return call
+
+
+def session_usage(session_id):
+    return get_collection("llm_usage_sessions").find_one({"session_id": session_id}, {"_id": 0})
+
+
+def session_tokens(session_id, kind):
+    """Tokens a session has already spent on `kind` requests (0 if unknown or unreachable)."""
+    try:
+        doc = get_collection("llm_usage_sessions").find_one(
+            {"session_id": session_id}, {"_id": 0, f"kinds.{kind}.tokens": 1}
+        )
+    except Exception as e:
+        print(f"Could not read LLM usage for session {session_id}: {e}")
+        return 0
+    return ((doc or {}).get("kinds", {}).get(kind, {}).get("tokens", 0)) or 0
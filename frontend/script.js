@@ -221,6 +221,7 @@ ideaForm.onsubmit = async (e) => {
   const file = document.getElementById("pdfUpload").files[0];
   let ideaText = document.getElementById("ideaText").value.trim();
   let sectors = [];
+  let sessionId = "";
 
   ideaContainer.style.display = "none";
   loadingOverlay.classList.remove("hidden");
@@ -232,26 +233,31 @@ ideaForm.onsubmit = async (e) => {
     const data = await res.json();
     ideaText = data.text;
     sectors = data.sectors;
+    sessionId = data.session_id || "";
     document.getElementById("ideaText").value = ideaText;
   }
 
   const submitForm = new FormData();
   submitForm.append("text", ideaText);
+  if (sessionId) submitForm.append("session_id", sessionId);
   const submitRes = await fetch("/submit_text", { method: "POST", body: submitForm });
   const submitData = await submitRes.json();
   if (!sectors.length) sectors = submitData.sectors;
+  sessionStorage.setItem("sessionId", submitData.session_id);
   if (sectorListEl) {
     sectorListEl.innerText = sectors.length ? sectors.join(", ") : "None";
   }
 
   const runForm = new FormData();
   runForm.append("idea", ideaText);
+  runForm.append("session_id", submitData.session_id);
   try {
     const runRes = await fetch("/run_pipeline", { method: "POST", body: runForm });
     if (!runRes.ok) throw new Error(`Pipeline error: ${runRes.status} ${runRes.statusText}`);
 
     const runData = await runRes.json();
     topCountries = runData.top_countries;
+    sessionStorage.setItem("sessionId", runData.session_id);
     sessionStorage.setItem("topCountries", JSON.stringify(topCountries));
     sessionStorage.setItem("detectedSectors", JSON.stringify(sectors));
   } catch (err) {
@@ -322,6 +328,7 @@ async function resetAndRefresh() {
   sessionStorage.removeItem("hasActiveReports");
   sessionStorage.removeItem("topCountries");
   sessionStorage.removeItem("detectedSectors");
+  sessionStorage.removeItem("sessionId");
   window.location.reload();
 }
 
@@ -339,11 +346,59 @@ chatForm.onsubmit = async (e) => {
   const chatFormData = new FormData();
   chatFormData.append("question", msg);
   topCountries.forEach(code => chatFormData.append("top_countries", code));
-  const res = await fetch("/chat", { method: "POST", body: chatFormData });
-  const data = await res.json();
-  addMessage(data.response, false);
+  const sessionId = sessionStorage.getItem("sessionId");
+  if (sessionId) chatFormData.append("session_id", sessionId);
+
+  try {
+    await streamChat(chatFormData);
+  } catch (err) {
+    console.warn("⚠️ Chat streaming failed, falling back to /chat:", err);
+    const res = await fetch("/chat", { method: "POST", body: chatFormData });
+    const data = await res.json();
+    addMessage(data.response, false);
+  }
 };
 
+// Reads the SSE stream from /chat/stream and grows a single bot message as tokens arrive.
+// An "error" event is the server's final word (e.g. the usage limit): it is shown and not
+// retried, so only a stream that sent neither tokens nor an error falls back to /chat.
+async function streamChat(chatFormData) {
+  const res = await fetch("/chat/stream", { method: "POST", body: chatFormData });
+  if (!res.ok || !res.body) throw new Error(`Stream error: ${res.status}`);
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let message = null;
+  let failed = false;
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    const events = buffer.split("\n\n");
+    buffer = events.pop();
+    for (const raw of events) {
+      const dataLine = raw.split("\n").find(line => line.startsWith("data: "));
+      if (!dataLine) continue;
+      const event = JSON.parse(dataLine.slice(6));
+
+      if (event.type === "token") {
+        if (!message) message = addMessage("", false);
+        message.textContent += event.text;
+        chatbox.scrollTop = chatbox.scrollHeight;
+      } else if (event.type === "error") {
+        addMessage(event.message, false);
+        failed = true;
+      } else if (event.type === "done") {
+        console.log(`💬 Chat ${event.mode}: first token ${event.first_token_ms} ms, total ${event.total_ms} ms`);
+      }
+    }
+  }
+  if (!message && !failed) throw new Error("Stream ended without a response");
+}
+
 function addMessage(text, isUser) {
   const message = document.createElement("div");
   message.textContent = text;
@@ -352,6 +407,7 @@ function addMessage(text, isUser) {
   }`;
   chatbox.appendChild(message);
   chatbox.scrollTop = chatbox.scrollHeight;
+  return message;
 }
 
 resetBtn.onclick = async () => {
@@ -380,6 +436,7 @@ window.addEventListener("pagehide", async function (event) {
   sessionStorage.removeItem("hasActiveReports");
   sessionStorage.removeItem("topCountries");
   sessionStorage.removeItem("detectedSectors");
+  sessionStorage.removeItem("sessionId");
 });
 
 ideaForm.addEventListener("submit", () => {